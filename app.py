@@ -4,7 +4,8 @@ Flask API服务 - 提供RESTful接口
 注重安全性：输入验证、错误处理、日志记录
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import sys
 import os
@@ -18,7 +19,18 @@ from models.auth_model import AuthModel
 from models.schedule_model import ScheduleModel
 from models.lock_model import LockModel
 from models.report_model import ReportModel
-from database import SafeDatabase
+from models.waitlist_model import WaitlistModel
+from database import SafeDatabase, begin_unit_of_work, end_unit_of_work, set_consistency_key
+from compact_result import CompactResult
+from seat_inventory import seat_inventory
+from lock_expiry import lock_expiry_worker
+from waitlist_promoter import waitlist_promoter
+from contention_stats import contention_stats
+import idempotency
+from idempotency import idempotency_store
+import snowflake
+from database_config import SEAT_INVENTORY_CONFIG
+import tracing
 import logging
 from functools import wraps
 
@@ -33,8 +45,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class AppJSONProvider(DefaultJSONProvider):
+    """在 Flask 默认序列化的基础上直接写出 CompactResult（{"columns": [...], "rows": [[...]]}）"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, CompactResult):
+            return o.to_json()
+        return DefaultJSONProvider.default(o)
+
+
 # 创建Flask应用
 app = Flask(__name__)
+app.json = AppJSONProvider(app)
 CORS(app)  # 允许跨域请求
 
 # 统一响应格式
@@ -54,6 +78,121 @@ def error_response(message="操作失败", code=400):
         'data': None
     }), code
 
+def stream_response(rows, message="查询成功"):
+    """
+    流式响应（用于不分页的大列表）
+
+    - 默认：分块输出与 success_response 相同结构的 JSON（前端无需改动）
+    - ?format=ndjson：每行一条记录的 NDJSON
+    - rows 为 CompactResult 时：data 为 {"columns": [...], "rows": [[...], ...]}，每行直接写成数组
+
+    rows 为逐行产出的可迭代对象，序列化与 jsonify 使用同一个 JSON provider。
+    """
+    compact = isinstance(rows, CompactResult)
+    ndjson = request.args.get('format') == 'ndjson' and not compact
+    batch_size = 200
+    if compact:
+        head = '{"code": 200, "message": %s, "data": {"columns": %s, "rows": [' % (
+            app.json.dumps(message), app.json.dumps(rows.columns))
+        tail = "]}}"
+        rows = rows.rows
+    else:
+        head = '{"code": 200, "message": %s, "data": [' % app.json.dumps(message)
+        tail = "]}"
+
+    def generate():
+        if not ndjson:
+            yield head
+        buffer = []
+        first = True
+        for row in rows:
+            if ndjson:
+                buffer.append(app.json.dumps(row) + "\n")
+            else:
+                buffer.append(app.json.dumps(row) if first else "," + app.json.dumps(row))
+                first = False
+            if len(buffer) >= batch_size:
+                yield "".join(buffer)
+                buffer = []
+        if buffer:
+            yield "".join(buffer)
+        if not ndjson:
+            yield tail
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+def page_args():
+    """
+    读取键集分页参数 ?limit=50&cursor=<上一页的 next_cursor>
+
+    两者都没传时返回 (None, None)，列表接口按原样返回完整数组；
+    传了任意一个时返回 {"items": [...], "next_cursor": "..."}，next_cursor 为 null 表示已到最后一页。
+    """
+    return request.args.get('limit', type=int), request.args.get('cursor') or None
+
+
+def compact_requested():
+    """?format=compact：列表以 {"columns": [...], "rows": [[...]]} 返回，省去每行重复的字段名"""
+    return request.args.get('format') == 'compact'
+
+
+# 请求链路追踪：先于工作单元注册，使 after_request 中的提交也计入本次 trace
+@app.before_request
+def begin_request_trace():
+    """每个请求一个 trace，根 span 名称为路由函数名（如 get_dashboard）"""
+    tracing.start_trace(
+        request.endpoint or request.path,
+        trace_id=request.headers.get('X-Trace-ID'),
+        method=request.method,
+        path=request.path
+    )
+
+
+@app.after_request
+def finish_request_trace(response):
+    """结束 trace，并通过响应头返回 trace ID 便于排查"""
+    trace_id = tracing.current_trace_id()
+    if trace_id:
+        response.headers['X-Trace-ID'] = trace_id
+        tracing.finish_trace(status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def cleanup_request_trace(exc):
+    """未捕获异常时 after_request 不执行，这里兜底结束 trace"""
+    tracing.finish_trace(error=exc)
+
+
+# 请求级工作单元：一次请求内的数据库操作共用一条连接、一个事务
+@app.before_request
+def begin_db_unit_of_work():
+    """请求开始时开启工作单元（连接在首次执行 SQL 时才借出）"""
+    begin_unit_of_work()
+
+
+@app.after_request
+def finish_db_unit_of_work(response):
+    """请求成功（状态码 < 400）提交，否则整体回滚"""
+    try:
+        end_unit_of_work(commit=response.status_code < 400)
+    except Exception as e:
+        logger.error(f"请求事务提交失败: {str(e)}")
+        return make_response(error_response(f"数据提交失败: {str(e)}", 500))
+    return response
+
+
+@app.teardown_request
+def cleanup_db_unit_of_work(exc):
+    """视图抛出未捕获异常时 after_request 不会执行，这里兜底回滚"""
+    try:
+        end_unit_of_work(commit=False)
+    except Exception as e:
+        logger.error(f"请求事务回滚失败: {str(e)}")
+
+
 # Token验证装饰器
 def token_required(f):
     """验证token的装饰器"""
@@ -68,6 +207,8 @@ def token_required(f):
                 token = token[7:]
             payload = AuthModel.verify_token(token)
             request.current_user = payload
+            # 同一用户写入后短时间内的读请求走主库（读己之写）
+            set_consistency_key(f"{payload.get('role')}:{payload.get('user_id')}")
         except Exception as e:
             return error_response(str(e), 401)
 
@@ -75,6 +216,60 @@ def token_required(f):
     return decorated
 
 
+def idempotent(f):
+    """
+    Idempotency-Key 请求头支持（放在 token_required 之后，键按用户隔离）
+
+    同一用户用同一个键重试时直接返回第一次成功的响应（响应头 Idempotent-Replayed: true），不再执行业务逻辑；
+    第一次请求仍在处理中返回 409，同一个键换了请求内容返回 422。
+    只保存成功的响应：失败（含 4xx 业务错误）时释放该键，客户端可以用同一个键重试。
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None or not idempotency_store.enabled:
+            return f(*args, **kwargs)
+
+        key = key.strip()
+        if not key or len(key) > idempotency_store.max_key_length:
+            return error_response("Idempotency-Key 无效", 400)
+
+        user_id = request.current_user['user_id']
+        request_fingerprint = idempotency.fingerprint(request.method, request.path, request.get_data())
+        try:
+            outcome, entry = idempotency_store.begin(user_id, key, request_fingerprint)
+        except Exception as e:
+            return error_response(f"幂等键校验失败: {str(e)}", 500)
+
+        if outcome == idempotency.REPLAY:
+            response = make_response(entry.body, entry.code)
+            response.mimetype = 'application/json'
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        if outcome == idempotency.IN_PROGRESS:
+            return error_response("相同 Idempotency-Key 的请求正在处理中，请稍后重试", 409)
+        if outcome == idempotency.MISMATCH:
+            return error_response("该 Idempotency-Key 已用于其它请求", 422)
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency_store.release(user_id, key)
+            raise
+
+        if response.status_code < 400:
+            try:
+                idempotency_store.complete(user_id, key, request_fingerprint,
+                                           response.status_code, response.get_data(as_text=True))
+            except Exception:
+                idempotency_store.release(user_id, key)
+                raise
+        else:
+            idempotency_store.release(user_id, key)
+        return response
+    return decorated
+
+
 def _require_staff_or_boss():
     role = request.current_user.get('role')
     if role not in ('staff', 'boss'):
@@ -259,12 +454,14 @@ def get_script_schedules(script_id):
 
 @app.route('/api/orders', methods=['POST'])
 @token_required
+@idempotent
 def create_order():
     """
     创建订单（安全版本：使用token鉴权，禁止伪造player_id）
     POST /api/orders
     Body: {"schedule_id": 4001}
     Headers: Authorization: Bearer <token>
+             Idempotency-Key: <客户端生成的唯一键>（可选，重试时带同一个键）
     """
     try:
         user_id = request.current_user['user_id']
@@ -301,12 +498,14 @@ def create_order():
 
 @app.route('/api/orders/<int:order_id>/pay', methods=['POST'])
 @token_required
+@idempotent
 def pay_order(order_id):
     """
     支付订单（安全版本：只能支付自己的订单）
     POST /api/orders/5001/pay
     Body: {"channel": 1}
     Headers: Authorization: Bearer <token>
+             Idempotency-Key: <客户端生成的唯一键>（可选，重试时带同一个键）
     """
     try:
         user_id = request.current_user['user_id']
@@ -378,6 +577,7 @@ def get_my_orders():
     """
     查询当前用户的订单（安全版本）
     GET /api/my/orders
+    GET /api/my/orders?limit=20&cursor=<next_cursor>
     Headers: Authorization: Bearer <token>
     """
     try:
@@ -393,7 +593,8 @@ def get_my_orders():
         if not user['Ref_ID']:
             return error_response("用户信息不完整", 400)
 
-        orders = OrderModel.get_orders_by_player(user['Ref_ID'])
+        limit, cursor = page_args()
+        orders = OrderModel.get_orders_by_player(user['Ref_ID'], limit=limit, cursor=cursor)
         logger.info(f"查询我的订单成功: Player_ID={user['Ref_ID']}")
         return success_response(orders, "查询成功")
     except Exception as e:
@@ -422,6 +623,9 @@ def get_all_orders():
     """
     查询所有订单（员工专用）
     GET /api/admin/orders
+    GET /api/admin/orders?format=ndjson
+    GET /api/admin/orders?format=compact
+    GET /api/admin/orders?limit=50&cursor=<next_cursor>
     Headers: Authorization: Bearer <token>
     """
     try:
@@ -435,10 +639,16 @@ def get_all_orders():
         if err:
             return err
 
-        # 获取所有订单
-        orders = OrderModel.get_all_orders(dm_id=dm_id)
+        limit, cursor = page_args()
+        if limit is not None or cursor:
+            page = OrderModel.get_all_orders(dm_id=dm_id, limit=limit, cursor=cursor)
+            logger.info(f"员工分页查询订单成功: User_ID={user_id}, 返回{len(page['items'])}条")
+            return success_response(page, "查询成功")
+
+        # 获取所有订单（服务端游标 + 分块输出，内存占用与订单总量无关）
+        orders = OrderModel.get_all_orders(dm_id=dm_id, stream=True, compact=compact_requested())
         logger.info(f"员工查询所有订单成功: User_ID={user_id}")
-        return success_response(orders, "查询成功")
+        return stream_response(orders, "查询成功")
     except Exception as e:
         logger.error(f"查询所有订单失败: {str(e)}")
         return error_response(str(e))
@@ -517,6 +727,7 @@ def get_my_locks():
     """
     查询当前玩家的锁位记录
     GET /api/my/locks
+    GET /api/my/locks?limit=20&cursor=<next_cursor>
     Headers: Authorization: Bearer <token>
     """
     try:
@@ -530,7 +741,8 @@ def get_my_locks():
             return error_response("只有玩家可以查看锁位", 403)
 
         # 查询锁位记录
-        locks = LockModel.get_locks_by_player(user['Ref_ID'])
+        limit, cursor = page_args()
+        locks = LockModel.get_locks_by_player(user['Ref_ID'], limit=limit, cursor=cursor)
         logger.info(f"查询玩家锁位成功: Player_ID={user['Ref_ID']}")
         return success_response(locks, "查询成功")
     except Exception as e:
@@ -544,6 +756,9 @@ def get_all_locks():
     """
     查询所有锁位记录（员工专用）
     GET /api/admin/locks
+    GET /api/admin/locks?format=ndjson
+    GET /api/admin/locks?format=compact
+    GET /api/admin/locks?limit=50&cursor=<next_cursor>
     Headers: Authorization: Bearer <token>
     """
     try:
@@ -557,15 +772,131 @@ def get_all_locks():
         if err:
             return err
 
-        # 查询所有锁位
-        locks = LockModel.get_all_locks(dm_id=dm_id)
+        limit, cursor = page_args()
+        if limit is not None or cursor:
+            page = LockModel.get_all_locks(dm_id=dm_id, limit=limit, cursor=cursor)
+            logger.info(f"员工分页查询锁位成功: User_ID={user_id}, 返回{len(page['items'])}条")
+            return success_response(page, "查询成功")
+
+        # 查询所有锁位（服务端游标 + 分块输出）
+        locks = LockModel.get_all_locks(dm_id=dm_id, stream=True, compact=compact_requested())
         logger.info(f"员工查询所有锁位成功: User_ID={user_id}")
-        return success_response(locks, "查询成功")
+        return stream_response(locks, "查询成功")
     except Exception as e:
         logger.error(f"查询所有锁位失败: {str(e)}")
         return error_response(str(e))
 
 
+# ==================== 候补相关接口 ====================
+
+@app.route('/api/waitlist', methods=['POST'])
+@token_required
+def join_waitlist():
+    """
+    加入场次候补队列（场次已满时）；空出名额后按加入顺序自动为候补玩家锁位
+    POST /api/waitlist
+    Body: {"schedule_id": 4001}
+    Headers: Authorization: Bearer <token>
+    """
+    try:
+        user_id = request.current_user['user_id']
+
+        user_sql = "SELECT Ref_ID, Role FROM T_User WHERE User_ID=%s"
+        user = SafeDatabase.execute_query(user_sql, (user_id,), fetch_one=True)
+
+        if not user or user['Role'] != 'player':
+            return error_response("只有玩家可以候补", 403)
+
+        if not user['Ref_ID']:
+            return error_response("用户信息不完整", 400)
+
+        data = request.get_json()
+        schedule_id = data.get('schedule_id')
+
+        if not schedule_id:
+            return error_response("缺少场次ID", 400)
+
+        entry = WaitlistModel.join(user['Ref_ID'], schedule_id)
+        return success_response(entry, "已加入候补")
+    except Exception as e:
+        logger.error(f"加入候补失败: {str(e)}")
+        return error_response(str(e))
+
+
+@app.route('/api/waitlist/<int:wait_id>', methods=['GET'])
+@token_required
+def get_waitlist_entry(wait_id):
+    """
+    查询候补状态与当前排名（获得名额后返回自动创建的锁位ID）
+    GET /api/waitlist/<id>
+    Headers: Authorization: Bearer <token>
+    """
+    try:
+        user_id = request.current_user['user_id']
+
+        user_sql = "SELECT Ref_ID, Role FROM T_User WHERE User_ID=%s"
+        user = SafeDatabase.execute_query(user_sql, (user_id,), fetch_one=True)
+
+        if not user or user['Role'] != 'player':
+            return error_response("只有玩家可以查看候补", 403)
+
+        entry = WaitlistModel.get_entry(wait_id)
+        if not entry or entry['Player_ID'] != user['Ref_ID']:
+            return error_response("候补记录不存在", 404)
+        return success_response(entry, "查询成功")
+    except Exception as e:
+        logger.error(f"查询候补失败: {str(e)}")
+        return error_response(str(e))
+
+
+@app.route('/api/waitlist/<int:wait_id>/cancel', methods=['POST'])
+@token_required
+def cancel_waitlist(wait_id):
+    """
+    取消候补
+    POST /api/waitlist/<id>/cancel
+    Headers: Authorization: Bearer <token>
+    """
+    try:
+        user_id = request.current_user['user_id']
+
+        user_sql = "SELECT Ref_ID, Role FROM T_User WHERE User_ID=%s"
+        user = SafeDatabase.execute_query(user_sql, (user_id,), fetch_one=True)
+
+        if not user or user['Role'] != 'player':
+            return error_response("只有玩家可以取消候补", 403)
+
+        WaitlistModel.cancel(wait_id, user['Ref_ID'])
+        return success_response(None, "取消成功")
+    except Exception as e:
+        logger.error(f"取消候补失败: {str(e)}")
+        return error_response(str(e))
+
+
+@app.route('/api/my/waitlist', methods=['GET'])
+@token_required
+def get_my_waitlist():
+    """
+    查询当前玩家的候补记录（候补中的带排名）
+    GET /api/my/waitlist
+    Headers: Authorization: Bearer <token>
+    """
+    try:
+        user_id = request.current_user['user_id']
+
+        user_sql = "SELECT Ref_ID, Role FROM T_User WHERE User_ID=%s"
+        user = SafeDatabase.execute_query(user_sql, (user_id,), fetch_one=True)
+
+        if not user or user['Role'] != 'player':
+            return error_response("只有玩家可以查看候补", 403)
+
+        entries = WaitlistModel.get_by_player(user['Ref_ID'])
+        return success_response(entries, "查询成功")
+    except Exception as e:
+        logger.error(f"查询玩家候补失败: {str(e)}")
+        return error_response(str(e))
+
+
 # ==================== 场次管理接口（员工专用） ====================
 
 @app.route('/api/admin/schedules', methods=['GET'])
@@ -574,6 +905,8 @@ def get_admin_schedules():
     """
     获取所有场次列表（员工专用，支持筛选）
     GET /api/admin/schedules?date=2024-01-01&room_id=1&script_id=1001&status=0
+    GET /api/admin/schedules?limit=50&cursor=<next_cursor>
+    GET /api/admin/schedules?format=compact
     Headers: Authorization: Bearer <token>
     """
     try:
@@ -593,8 +926,11 @@ def get_admin_schedules():
         script_id = request.args.get('script_id', type=int)
         status = request.args.get('status', type=int)
 
-        schedules = ScheduleModel.get_all_schedules(date, room_id, script_id, status, dm_id=dm_id)
-        logger.info(f"员工查询场次成功: User_ID={user_id}, 返回{len(schedules)}条")
+        limit, cursor = page_args()
+        schedules = ScheduleModel.get_all_schedules(date, room_id, script_id, status, dm_id=dm_id,
+                                                    limit=limit, cursor=cursor, compact=compact_requested())
+        count = len(schedules['items']) if isinstance(schedules, dict) else len(schedules)
+        logger.info(f"员工查询场次成功: User_ID={user_id}, 返回{count}条")
         return success_response(schedules, "查询成功")
     except Exception as e:
         logger.error(f"查询场次失败: {str(e)}")
@@ -742,7 +1078,8 @@ def get_admin_dms():
             return error_response("只有老板可以查看 DM 列表", 403)
 
         dms = SafeDatabase.execute_query(
-            "SELECT DM_ID, Name, Phone, Star_Level FROM T_DM ORDER BY DM_ID"
+            "SELECT DM_ID, Name, Phone, Star_Level FROM T_DM ORDER BY DM_ID",
+            cache_tables=('T_DM',)
         )
         return success_response(dms, "查询成功")
     except Exception as e:
@@ -762,7 +1099,8 @@ def get_admin_rooms():
             return err
 
         rooms = SafeDatabase.execute_query(
-            "SELECT Room_ID, Room_Name FROM T_Room ORDER BY Room_ID"
+            "SELECT Room_ID, Room_Name FROM T_Room ORDER BY Room_ID",
+            cache_tables=('T_Room',)
         )
         return success_response(rooms, "查询成功")
     except Exception as e:
@@ -863,6 +1201,141 @@ def get_admin_db_objects():
         logger.error(f"数据库对象自检失败: {str(e)}")
         return error_response(str(e))
 
+@app.route('/api/admin/db-stats', methods=['GET'])
+@token_required
+def get_admin_db_stats():
+    """
+    SQL 执行统计（按语句指纹聚合：调用次数、p50/p95/p99 耗时、返回行数、调用方）+ 连接池状态 + 查询缓存命中率
+    + 座位库存准入统计 + 锁位过期调度（待过期数、过期延迟）
+    GET /api/admin/db-stats?top=20&order_by=p95_ms
+    """
+    try:
+        role, err = _require_staff_or_boss()
+        if err:
+            return err
+
+        top = request.args.get('top', default=50, type=int)
+        order_by = request.args.get('order_by', default='total_ms')
+
+        return success_response({
+            'pool': SafeDatabase.pool_stats(),
+            'replicas': SafeDatabase.replica_stats(),
+            'queries': SafeDatabase.get_query_stats(top=top, order_by=order_by),
+            'cache': SafeDatabase.cache_stats(),
+            'inventory': seat_inventory.stats(),
+            'lock_expiry': lock_expiry_worker.stats(),
+            'waitlist': waitlist_promoter.stats(),
+            'idempotency': idempotency_store.stats(),
+        }, "查询成功")
+    except Exception as e:
+        logger.error(f"查询SQL执行统计失败: {str(e)}")
+        return error_response(str(e))
+
+
+@app.route('/api/admin/contention', methods=['GET'])
+@token_required
+def get_admin_contention():
+    """
+    锁位/下单争用统计：尝试/拒绝次数（已满、重复、行锁内被抢先、候补、冲突）、等待场次行锁和座位获取耗时分位数、
+    各滑动窗口内最热的场次
+    GET /api/admin/contention?top=10&order_by=wait_ms
+    """
+    try:
+        role, err = _require_staff_or_boss()
+        if err:
+            return err
+
+        top = request.args.get('top', default=None, type=int)
+        order_by = request.args.get('order_by', default='attempts')
+        return success_response(contention_stats.snapshot(top=top, order_by=order_by), "查询成功")
+    except Exception as e:
+        logger.error(f"查询争用统计失败: {str(e)}")
+        return error_response(str(e))
+
+
+@app.route('/api/admin/seat-inventory/check', methods=['GET'])
+@token_required
+def check_seat_inventory():
+    """
+    座位库存与数据库逐场次核对（repair=1 时用数据库状态替换不一致的场次）
+    GET /api/admin/seat-inventory/check?repair=1
+    """
+    try:
+        role, err = _require_staff_or_boss()
+        if err:
+            return err
+
+        repair = request.args.get('repair') == '1'
+        mismatches = seat_inventory.check(repair=repair)
+        return success_response({
+            'mismatches': mismatches,
+            'inventory': seat_inventory.stats(),
+        }, "核对完成")
+    except Exception as e:
+        logger.error(f"核对座位库存失败: {str(e)}")
+        return error_response(str(e))
+
+
+@app.route('/api/admin/db-stats/reset', methods=['POST'])
+@token_required
+def reset_admin_db_stats():
+    """
+    清空 SQL 执行统计和锁位/下单争用统计（老板专用）
+    POST /api/admin/db-stats/reset
+    """
+    try:
+        if request.current_user.get('role') != 'boss':
+            return error_response("只有老板可以清空统计", 403)
+
+        SafeDatabase.reset_query_stats()
+        contention_stats.reset()
+        return success_response(None, "统计已清空")
+    except Exception as e:
+        logger.error(f"清空SQL执行统计失败: {str(e)}")
+        return error_response(str(e))
+
+@app.route('/api/admin/traces', methods=['GET'])
+@token_required
+def get_admin_traces():
+    """
+    最近请求的链路追踪摘要（新的在前）
+    GET /api/admin/traces?limit=50&min_ms=100&name=get_dashboard
+    """
+    try:
+        role, err = _require_staff_or_boss()
+        if err:
+            return err
+
+        limit = request.args.get('limit', default=50, type=int)
+        min_ms = request.args.get('min_ms', default=0, type=float)
+        name = request.args.get('name')
+        return success_response(tracing.recent_traces(limit=limit, min_ms=min_ms, name=name), "查询成功")
+    except Exception as e:
+        logger.error(f"查询链路追踪失败: {str(e)}")
+        return error_response(str(e))
+
+
+@app.route('/api/admin/traces/<trace_id>', methods=['GET'])
+@token_required
+def get_admin_trace_detail(trace_id):
+    """
+    单个请求的完整调用树（路由 → 模型方法 → SQL）
+    GET /api/admin/traces/<trace_id>
+    """
+    try:
+        role, err = _require_staff_or_boss()
+        if err:
+            return err
+
+        trace = tracing.get_trace(trace_id)
+        if not trace:
+            return error_response("trace不存在或已过期", 404)
+        return success_response(trace, "查询成功")
+    except Exception as e:
+        logger.error(f"查询链路详情失败: {str(e)}")
+        return error_response(str(e))
+
+
 @app.route('/api/admin/dashboard', methods=['GET'])
 @token_required
 def get_dashboard():
@@ -996,5 +1469,15 @@ def get_dm_performance_report():
 # ==================== 启动服务 ====================
 
 if __name__ == '__main__':
-    logger.info("启动Flask API服务...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    debug = True
+    # debug 模式下 reloader 先起一个只负责监视文件的父进程，再由它启动真正处理请求的子进程（WERKZEUG_RUN_MAIN=true）；
+    # 启动任务只在处理请求的进程里执行一次，否则会多租一个 worker 号、重复预热名额、重复启动后台线程
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        logger.info("启动Flask API服务...")
+        snowflake.get_generator()  # 启动时确定 worker 号（没有可用的 worker 号时直接失败）
+        if SEAT_INVENTORY_CONFIG['enabled'] and SEAT_INVENTORY_CONFIG['warm_on_start']:
+            seat_inventory.warm()
+        lock_expiry_worker.start()
+        waitlist_promoter.start()
+        contention_stats.start()
+    app.run(host='0.0.0.0', port=5000, debug=debug, use_reloader=debug)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 入口 - 预约高峰的热点接口走 asyncio，其余接口仍由 Flask 处理
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+原生异步处理的接口（响应格式与 app.py 完全一致）：
+    GET  /api/scripts
+    GET  /api/scripts/<id>/schedules
+    POST /api/locks
+    GET  /api/my/locks
+其它路径在安装了 asgiref 时转交 Flask 应用（WsgiToAsgi），否则返回 404。
+"""
+
+import json
+import logging
+import re
+from urllib.parse import parse_qs
+
+import tracing
+from app import app as flask_app
+from async_database import AsyncSafeDatabase, DatabaseBusyError
+from database import get_pool, set_consistency_key
+from database_config import SEAT_INVENTORY_CONFIG
+from models.auth_model import AuthModel
+from models.async_model import AsyncScriptModel, AsyncScheduleModel, AsyncLockModel
+from seat_inventory import seat_inventory
+from lock_expiry import lock_expiry_worker
+from waitlist_promoter import waitlist_promoter
+from contention_stats import contention_stats
+import snowflake
+
+logger = logging.getLogger(__name__)
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    _flask_asgi = WsgiToAsgi(flask_app)
+except ImportError:
+    _flask_asgi = None
+
+
+class Request:
+    """最小化的请求对象（只包含热点接口用到的部分）"""
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        self.args = {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode('utf-8')).items()}
+        self.body = body
+        self.current_user = None
+
+    def arg_int(self, name, default=None):
+        """同 Flask 的 request.args.get(name, type=int)：非法值按未传处理"""
+        try:
+            return int(self.args[name])
+        except (KeyError, ValueError):
+            return default
+
+    def get_json(self):
+        try:
+            return json.loads(self.body or b'null')
+        except ValueError:
+            return None
+
+
+def success_response(data=None, message="操作成功"):
+    return {'code': 200, 'message': message, 'data': data}, 200
+
+
+def error_response(message="操作失败", code=400):
+    return {'code': code, 'message': message, 'data': None}, code
+
+
+def _authenticate(request):
+    """与 app.token_required 相同的 token 校验；失败时返回错误响应"""
+    token = request.headers.get('authorization')
+    if not token:
+        return error_response("缺少认证token", 401)
+    try:
+        if token.startswith('Bearer '):
+            token = token[7:]
+        payload = AuthModel.verify_token(token)
+        request.current_user = payload
+        set_consistency_key(f"{payload.get('role')}:{payload.get('user_id')}")
+    except Exception as e:
+        return error_response(str(e), 401)
+    return None
+
+
+async def _get_player(request):
+    user_sql = "SELECT Ref_ID, Role FROM T_User WHERE User_ID=%s"
+    return await AsyncSafeDatabase.execute_query(user_sql, (request.current_user['user_id'],), fetch_one=True)
+
+
+# ==================== 异步接口 ====================
+
+async def get_scripts(request):
+    """GET /api/scripts?status=1"""
+    try:
+        scripts = await AsyncScriptModel.get_all_scripts(request.arg_int('status'))
+        logger.info(f"查询剧本列表成功，返回{len(scripts)}条记录")
+        return success_response(scripts, "查询成功")
+    except DatabaseBusyError:
+        raise  # 等待数据库线程的请求已满，由 _handle_http 返回 503
+    except Exception as e:
+        logger.error(f"查询剧本列表失败: {str(e)}")
+        return error_response(str(e))
+
+
+async def get_script_schedules(request, script_id):
+    """GET /api/scripts/1001/schedules?player_id=2001"""
+    try:
+        player_id = request.arg_int('player_id')
+        schedules = await AsyncScheduleModel.get_schedules_by_script(script_id, player_id)
+        logger.info(f"查询剧本场次成功: Script_ID={script_id}, Player_ID={player_id}")
+        return success_response(schedules, "查询成功")
+    except DatabaseBusyError:
+        raise
+    except Exception as e:
+        logger.error(f"查询剧本场次失败: {str(e)}")
+        return error_response(str(e))
+
+
+async def create_lock(request):
+    """POST /api/locks  Body: {"schedule_id": 4001}"""
+    err = _authenticate(request)
+    if err:
+        return err
+    try:
+        user = await _get_player(request)
+        if not user or user['Role'] != 'player':
+            return error_response("只有玩家可以锁位", 403)
+        if not user['Ref_ID']:
+            return error_response("用户信息不完整", 400)
+
+        data = request.get_json() or {}
+        schedule_id = data.get('schedule_id')
+        if not schedule_id:
+            return error_response("缺少场次ID", 400)
+
+        # 内存库存可信地判定已满/重复锁位时直接拒绝，不进数据库线程池
+        seat_inventory.check_lock(schedule_id, user['Ref_ID'], reload=False)
+        lock_id = await AsyncLockModel.create_lock(user['Ref_ID'], schedule_id)
+        logger.info(f"创建锁位成功: Lock_ID={lock_id}, Player_ID={user['Ref_ID']}")
+        return success_response({'lock_id': lock_id}, "锁位成功")
+    except DatabaseBusyError:
+        raise
+    except Exception as e:
+        logger.error(f"创建锁位失败: {str(e)}")
+        return error_response(str(e))
+
+
+async def get_my_locks(request):
+    """GET /api/my/locks?limit=20&cursor=<next_cursor>"""
+    err = _authenticate(request)
+    if err:
+        return err
+    try:
+        user = await _get_player(request)
+        if not user or user['Role'] != 'player':
+            return error_response("只有玩家可以查看锁位", 403)
+
+        locks = await AsyncLockModel.get_locks_by_player(
+            user['Ref_ID'], request.arg_int('limit'), request.args.get('cursor') or None)
+        logger.info(f"查询玩家锁位成功: Player_ID={user['Ref_ID']}")
+        return success_response(locks, "查询成功")
+    except DatabaseBusyError:
+        raise
+    except Exception as e:
+        logger.error(f"查询玩家锁位失败: {str(e)}")
+        return error_response(str(e))
+
+
+ROUTES = [
+    ('GET', re.compile(r'^/api/scripts$'), get_scripts),
+    ('GET', re.compile(r'^/api/scripts/(\d+)/schedules$'), get_script_schedules),
+    ('POST', re.compile(r'^/api/locks$'), create_lock),
+    ('GET', re.compile(r'^/api/my/locks$'), get_my_locks),
+]
+
+_CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Authorization, Content-Type, X-Trace-ID'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+    (b'access-control-expose-headers', b'X-Trace-ID'),
+]
+
+
+def _match(method, path):
+    """返回 (handler, 路径参数)；路径匹配但方法不符时 handler 为 None"""
+    path_matched = False
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.match(path)
+        if match:
+            path_matched = True
+            if method == route_method or method == 'OPTIONS':
+                return handler, [int(group) for group in match.groups()], True
+    return None, None, path_matched
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_json(send, payload, status, extra_headers=()):
+    # 与 Flask jsonify 使用同一个 JSON provider（日期/Decimal 的序列化格式一致）
+    body = flask_app.json.dumps(payload).encode('utf-8')
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    headers.extend(_CORS_HEADERS)
+    headers.extend(extra_headers)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _handle_http(scope, receive, send):
+    handler, path_args, path_matched = _match(scope['method'], scope['path'])
+
+    if handler is None:
+        if _flask_asgi is not None:
+            return await _flask_asgi(scope, receive, send)
+        payload, status = error_response("接口不存在", 405 if path_matched else 404)
+        return await _send_json(send, payload, status)
+
+    if scope['method'] == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 200, 'headers': list(_CORS_HEADERS)})
+        return await send({'type': 'http.response.body', 'body': b''})
+
+    request = Request(scope, await _read_body(receive))
+    tracing.start_trace(
+        handler.__name__,
+        trace_id=request.headers.get('x-trace-id'),
+        method=request.method,
+        path=request.path
+    )
+    error = None
+    try:
+        payload, status = await handler(request, *path_args)
+    except DatabaseBusyError as e:
+        payload, status = error_response(str(e), 503)
+    except Exception as e:
+        error = e
+        logger.error(f"异步接口处理失败: {str(e)}")
+        payload, status = error_response("服务器内部错误", 500)
+
+    trace_id = tracing.current_trace_id()
+    tracing.finish_trace(error=error, status=status)
+    extra = [(b'x-trace-id', trace_id.encode())] if trace_id else []
+    await _send_json(send, payload, status, extra)
+
+
+async def _handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await AsyncSafeDatabase.run_sync(snowflake.get_generator, unit_of_work=False)
+            if SEAT_INVENTORY_CONFIG['enabled'] and SEAT_INVENTORY_CONFIG['warm_on_start']:
+                await AsyncSafeDatabase.run_sync(seat_inventory.warm, unit_of_work=False)
+            lock_expiry_worker.start()
+            waitlist_promoter.start()
+            contention_stats.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            contention_stats.stop()
+            waitlist_promoter.stop()
+            lock_expiry_worker.stop()
+            AsyncSafeDatabase.shutdown()
+            snowflake.release()
+            get_pool().dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI 应用"""
+    if scope['type'] == 'http':
+        return await _handle_http(scope, receive, send)
+    if scope['type'] == 'lifespan':
+        return await _handle_lifespan(receive, send)
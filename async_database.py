@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+异步数据库访问层 - SafeDatabase 的 asyncio 版本
+pymysql 是阻塞驱动，这里把每次数据库访问放到有界线程池中执行：
+事件循环只持有等待中的协程（很轻），真正占用线程/连接的请求数不超过连接池容量。
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from database import SafeDatabase
+from database_config import POOL_CONFIG, ASYNC_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseBusyError(Exception):
+    """等待数据库的请求过多（超过 max_waiting），直接拒绝而不是无限排队"""
+
+
+class AsyncSafeDatabase:
+    """
+    异步安全数据库操作类（接口与 SafeDatabase 一一对应）
+
+    示例：
+        scripts = await AsyncSafeDatabase.execute_query("SELECT ... WHERE Status=%s", (1,))
+        # 一次线程切换内执行一个完整的同步模型方法（多条 SQL 共用一个工作单元）
+        locks = await AsyncSafeDatabase.run_sync(LockModel.get_locks_by_player, player_id)
+    """
+
+    _executor = None
+    _semaphore = None
+    _loop = None
+    _waiting = 0
+
+    @classmethod
+    def _get_executor(cls):
+        if cls._executor is None:
+            max_workers = ASYNC_CONFIG.get('max_workers') or (
+                POOL_CONFIG['pool_size'] + POOL_CONFIG['max_overflow'])
+            cls._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='async-db')
+        return cls._executor
+
+    @classmethod
+    def _get_semaphore(cls):
+        # 信号量绑定事件循环，循环变化（例如测试中多次 asyncio.run）时重新创建
+        loop = asyncio.get_running_loop()
+        if cls._semaphore is None or cls._loop is not loop:
+            cls._semaphore = asyncio.Semaphore(cls._get_executor()._max_workers)
+            cls._loop = loop
+            cls._waiting = 0
+        return cls._semaphore
+
+    @classmethod
+    async def run_sync(cls, func, *args, unit_of_work=True, **kwargs):
+        """
+        在数据库线程池中执行同步函数
+
+        Args:
+            func: 同步函数（通常是模型方法）
+            unit_of_work: 是否包在一个工作单元中（函数内所有 SQL 共用一条连接、一个事务，正常返回才提交）
+
+        Raises:
+            DatabaseBusyError: 等待中的请求超过 ASYNC_CONFIG['max_waiting']
+
+        当前上下文（trace、一致性键）会被带入工作线程，SQL 仍计入本次请求的 trace。
+        """
+        semaphore = cls._get_semaphore()
+        if semaphore.locked() and cls._waiting >= ASYNC_CONFIG.get('max_waiting', 2000):
+            raise DatabaseBusyError("服务繁忙，请稍后重试")
+
+        if unit_of_work:
+            func = functools.partial(cls._in_unit_of_work, func)
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+
+        cls._waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            cls._waiting -= 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(cls._get_executor(), call)
+        finally:
+            semaphore.release()
+
+    @staticmethod
+    def _in_unit_of_work(func, *args, **kwargs):
+        with SafeDatabase.unit_of_work():
+            return func(*args, **kwargs)
+
+    @classmethod
+    async def execute_query(cls, sql, params=None, fetch_one=False, fetch_all=True, use_replica=False):
+        """异步执行查询语句（参数同 SafeDatabase.execute_query）"""
+        return await cls.run_sync(
+            SafeDatabase.execute_query, sql, params,
+            fetch_one=fetch_one, fetch_all=fetch_all, use_replica=use_replica, unit_of_work=False
+        )
+
+    @classmethod
+    async def execute_update(cls, sql, params=None):
+        """异步执行更新语句（参数同 SafeDatabase.execute_update）"""
+        return await cls.run_sync(SafeDatabase.execute_update, sql, params, unit_of_work=False)
+
+    @classmethod
+    async def execute_transaction(cls, operations):
+        """异步执行事务（参数同 SafeDatabase.execute_transaction）"""
+        return await cls.run_sync(SafeDatabase.execute_transaction, operations, unit_of_work=False)
+
+    @classmethod
+    def stats(cls):
+        """线程池/排队状态"""
+        executor = cls._executor
+        return {
+            'max_workers': executor._max_workers if executor else None,
+            'waiting': cls._waiting,
+        }
+
+    @classmethod
+    def shutdown(cls):
+        """关闭线程池（ASGI lifespan shutdown 时调用）"""
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=True)
+            cls._executor = None
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+紧凑结果集 - 大列表不再逐行构造字典
+
+DictCursor 的每一行都是一个新字典，列名字符串在每行重复一次；后台订单/锁位/场次列表
+动辄上万行时，内存和 JSON 序列化的大头都花在这些字典上。
+CompactResult 只保存一份列名，每行是数据库驱动直接返回的元组：
+    result.columns   -> ('Order_ID', 'Amount', ...)
+    result.rows      -> [(5001, Decimal('188.00'), ...), ...]
+    for row in result: row.Order_ID          # 按需包装成 namedtuple（共享同一个列索引）
+JSON 输出为 {"columns": [...], "rows": [[...], ...]}，由 app.py 的 JSON provider 直接写出。
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def _record_type(columns):
+    """同一组列名共享一个 namedtuple 类型（非法字段名自动改名为 _0、_1...）"""
+    return namedtuple('Row', columns, rename=True)
+
+
+class CompactResult:
+    """
+    列名 + 元组行的查询结果
+
+    Args:
+        columns: 列名序列
+        rows: 元组列表；流式查询时为逐行产出元组的生成器（只能遍历一次，不支持 len）
+    """
+
+    __slots__ = ('columns', 'rows')
+
+    def __init__(self, columns, rows):
+        self.columns = tuple(columns)
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        """逐行产出 namedtuple 记录（row.Order_ID / row[0]）"""
+        return map(self.record_type._make, self.rows)
+
+    def __repr__(self):
+        size = len(self.rows) if isinstance(self.rows, list) else '?'
+        return f"<CompactResult columns={len(self.columns)} rows={size}>"
+
+    @property
+    def record_type(self):
+        return _record_type(self.columns)
+
+    def column(self, name):
+        """取出一整列的值"""
+        index = self.columns.index(name)
+        return [row[index] for row in self.rows]
+
+    def to_dicts(self):
+        """转换回字典列表（与普通查询结果一致）"""
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in self.rows]
+
+    def to_json(self):
+        """JSON 结构：{"columns": [...], "rows": [[...], ...]}"""
+        return {'columns': list(self.columns), 'rows': self.rows}
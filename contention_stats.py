@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+锁位/下单争用统计 - 哪些场次在挤占数据库、抢一个座位要等多久
+
+LockModel.create_lock / OrderModel.create_order 的每次执行（冲突重做的每一遍都单独计一次）记录：
+- 结果：ok 成功；full/duplicate 在锁场次行之前就被拒绝（内存库存判断已满/重复）；
+  race 通过了预检、在场次行锁内才发现已满/重复（被其它请求抢先）；waitlist 名额留给了候补玩家；
+  conflict 死锁/锁等待超时（由 retry_on_conflict 重做）；other 其它业务校验失败；error 其它异常
+- 等待场次行锁的耗时（lock_for_booking：SELECT ... FOR UPDATE + 顺带过期本场次的锁位）
+- 成功时从开始到事务结束的总耗时（座位获取耗时）
+
+按场次的计数放在 bucket_seconds 宽的时间桶里，windows 中每个滑动窗口合并最近的桶得到最热场次；
+后台线程每 log_interval 秒写一条摘要日志（最近一个间隔的尝试/拒绝/行锁等待和最热场次）。
+
+    with contention_stats.attempt('lock', schedule_id) as attempt:
+        seat_inventory.check_lock(schedule_id, player_id)
+        with SafeDatabase.unit_of_work():
+            with attempt.row_lock():
+                seat = ScheduleModel.lock_for_booking(schedule_id, player_id)
+            ...
+"""
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+import logging
+import threading
+import time
+
+from database import is_retryable_error
+from database_config import CONTENTION_CONFIG
+from models.waitlist_model import WaitlistModel
+from query_stats import _percentile
+from seat_inventory import FULL, DUPLICATE_LOCK, DUPLICATE_ORDER
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('lock', 'order')
+REJECTIONS = ('full', 'duplicate', 'race', 'waitlist', 'conflict', 'other', 'error')
+
+
+def _schedule_key(schedule_id):
+    try:
+        return int(schedule_id)
+    except (TypeError, ValueError):
+        return schedule_id
+
+
+def _latency(samples):
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'p50_ms': round(_percentile(samples, 50), 3),
+        'p95_ms': round(_percentile(samples, 95), 3),
+        'p99_ms': round(_percentile(samples, 99), 3),
+        'max_ms': round(samples[-1], 3) if samples else 0.0,
+    }
+
+
+class _Attempt:
+    """一次锁位/下单执行"""
+
+    __slots__ = ('op', 'schedule_id', 'started', 'wait_ms', 'locked')
+
+    def __init__(self, op, schedule_id):
+        self.op = op
+        self.schedule_id = schedule_id
+        self.started = time.perf_counter()
+        self.wait_ms = None         # 等待场次行锁的耗时（没走到行锁时为 None）
+        self.locked = False         # 是否已拿到场次行锁
+
+    @contextmanager
+    def row_lock(self):
+        """统计获取场次行锁的耗时（锁等待超时时也记录等了多久）"""
+        start = time.perf_counter()
+        try:
+            yield
+            self.locked = True
+        finally:
+            self.wait_ms = (time.perf_counter() - start) * 1000
+
+
+class _Spot:
+    """一个时间桶内单个场次的计数"""
+
+    __slots__ = ('attempts', 'ok', 'rejected', 'conflicts', 'wait_ms', 'waits', 'max_wait_ms')
+
+    def __init__(self):
+        self.attempts = 0
+        self.ok = 0
+        self.rejected = 0
+        self.conflicts = 0
+        self.wait_ms = 0.0
+        self.waits = 0
+        self.max_wait_ms = 0.0
+
+    def merge(self, other):
+        self.attempts += other.attempts
+        self.ok += other.ok
+        self.rejected += other.rejected
+        self.conflicts += other.conflicts
+        self.wait_ms += other.wait_ms
+        self.waits += other.waits
+        self.max_wait_ms = max(self.max_wait_ms, other.max_wait_ms)
+
+
+class ContentionStats:
+    """线程安全的争用统计 + 定期摘要日志线程"""
+
+    def __init__(self, config=None):
+        config = config or CONTENTION_CONFIG
+        self.enabled = config.get('enabled', True)
+        self.bucket_seconds = max(1, config.get('bucket_seconds', 10))
+        self.windows = tuple(sorted(config.get('windows', (60, 300, 900))))
+        self.top_n = config.get('top_n', 10)
+        self.sample_size = config.get('sample_size', 2048)
+        self.log_interval = config.get('log_interval', 60)
+        self._max_buckets = -(-self.windows[-1] // self.bucket_seconds) + 1
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._reset_state()
+
+    def _reset_state(self):
+        self._totals = {op: Counter() for op in OPERATIONS}
+        self._waits = {op: deque(maxlen=self.sample_size) for op in OPERATIONS}
+        self._acquire = {op: deque(maxlen=self.sample_size) for op in OPERATIONS}
+        self._buckets = deque()         # (桶序号, {场次ID: _Spot})
+        self._interval = {op: Counter() for op in OPERATIONS}
+        self._interval_waits = []
+        self._since = time.time()
+
+    # ==================== 记录 ====================
+
+    @contextmanager
+    def attempt(self, op, schedule_id):
+        """包住一次锁位/下单执行，退出时按结果（或异常类型）记录"""
+        attempt = _Attempt(op, schedule_id)
+        if not self.enabled:
+            yield attempt
+            return
+        try:
+            yield attempt
+        except Exception as e:
+            self._record(attempt, self._classify(e, attempt))
+            raise
+        self._record(attempt, 'ok')
+
+    @staticmethod
+    def _classify(exc, attempt):
+        if is_retryable_error(exc):
+            return 'conflict'
+        if not isinstance(exc, ValueError):
+            return 'error'
+        message = str(exc)
+        if message in (FULL, DUPLICATE_LOCK, DUPLICATE_ORDER):
+            if attempt.locked:
+                return 'race'
+            return 'full' if message == FULL else 'duplicate'
+        if message == WaitlistModel.QUEUE_AHEAD:
+            return 'waitlist'
+        return 'other'
+
+    def _bucket(self, now):
+        """当前时间桶（调用方持有 self._lock），顺带丢弃超出最长窗口的旧桶"""
+        index = int(now // self.bucket_seconds)
+        if not self._buckets or self._buckets[-1][0] != index:
+            self._buckets.append((index, {}))
+        while self._buckets[0][0] <= index - self._max_buckets:
+            self._buckets.popleft()
+        return self._buckets[-1][1]
+
+    def _record(self, attempt, outcome):
+        elapsed_ms = (time.perf_counter() - attempt.started) * 1000
+        schedule_id = _schedule_key(attempt.schedule_id)
+        wait_ms = attempt.wait_ms
+
+        with self._lock:
+            for counter in (self._totals[attempt.op], self._interval[attempt.op]):
+                counter['attempts'] += 1
+                counter[outcome] += 1
+            if outcome == 'ok':
+                self._acquire[attempt.op].append(elapsed_ms)
+            if wait_ms is not None:
+                self._waits[attempt.op].append(wait_ms)
+                if len(self._interval_waits) < self.sample_size:
+                    self._interval_waits.append(wait_ms)
+
+            spots = self._bucket(time.time())
+            spot = spots.get(schedule_id)
+            if spot is None:
+                spot = spots[schedule_id] = _Spot()
+            spot.attempts += 1
+            if outcome == 'ok':
+                spot.ok += 1
+            elif outcome == 'conflict':
+                spot.conflicts += 1
+            else:
+                spot.rejected += 1
+            if wait_ms is not None:
+                spot.wait_ms += wait_ms
+                spot.waits += 1
+                spot.max_wait_ms = max(spot.max_wait_ms, wait_ms)
+
+    # ==================== 查询 ====================
+
+    def hot_schedules(self, window, top=None, order_by='attempts'):
+        """
+        最近 window 秒内最热的场次
+
+        Args:
+            window: 窗口秒数（按时间桶对齐，最长为配置中最长的窗口）
+            top: 返回前 N 个，默认 top_n
+            order_by: attempts（尝试次数）/ wait_ms（行锁等待总耗时）/ rejected / conflicts
+        """
+        top = top or self.top_n
+        oldest = int(time.time() // self.bucket_seconds) - (-(-window // self.bucket_seconds)) + 1
+        merged = {}
+        with self._lock:
+            for index, spots in self._buckets:
+                if index < oldest:
+                    continue
+                for schedule_id, spot in spots.items():
+                    total = merged.get(schedule_id)
+                    if total is None:
+                        total = merged[schedule_id] = _Spot()
+                    total.merge(spot)
+
+        if order_by not in ('attempts', 'wait_ms', 'rejected', 'conflicts'):
+            order_by = 'attempts'
+        ranked = sorted(merged.items(), key=lambda item: getattr(item[1], order_by), reverse=True)
+        return [{
+            'schedule_id': schedule_id,
+            'attempts': spot.attempts,
+            'per_second': round(spot.attempts / window, 2),
+            'ok': spot.ok,
+            'rejected': spot.rejected,
+            'conflicts': spot.conflicts,
+            'wait_ms_total': round(spot.wait_ms, 1),
+            'wait_ms_avg': round(spot.wait_ms / spot.waits, 3) if spot.waits else 0.0,
+            'wait_ms_max': round(spot.max_wait_ms, 3),
+        } for schedule_id, spot in ranked[:top]]
+
+    def snapshot(self, top=None, order_by='attempts'):
+        """
+        导出统计结果
+
+        Returns:
+            dict: {since, operations: {lock/order: {attempts, ok, rejections, row_lock_wait, acquire}},
+                   hot_schedules: {'60s': [...], ...}}
+        """
+        with self._lock:
+            totals = {op: dict(counter) for op, counter in self._totals.items()}
+            waits = {op: list(samples) for op, samples in self._waits.items()}
+            acquire = {op: list(samples) for op, samples in self._acquire.items()}
+            since = self._since
+
+        operations = {}
+        for op in OPERATIONS:
+            counter = totals[op]
+            operations[op] = {
+                'attempts': counter.get('attempts', 0),
+                'ok': counter.get('ok', 0),
+                'rejections': {reason: counter.get(reason, 0) for reason in REJECTIONS},
+                'row_lock_wait': _latency(waits[op]),
+                'acquire': _latency(acquire[op]),
+            }
+
+        return {
+            'enabled': self.enabled,
+            'since': datetime.fromtimestamp(since).isoformat(timespec='seconds'),
+            'bucket_seconds': self.bucket_seconds,
+            'operations': operations,
+            'hot_schedules': {f"{window}s": self.hot_schedules(window, top, order_by) for window in self.windows},
+        }
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._reset_state()
+
+    # ==================== 定期摘要 ====================
+
+    def start(self):
+        """启动摘要日志线程（log_interval 为 0 或重复调用时不启动）"""
+        if not self.enabled or not self.log_interval or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='contention-summary', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.log_interval):
+            try:
+                summary = self.interval_summary()
+                if summary:
+                    logger.info(summary)
+            except Exception as e:
+                logger.error(f"写争用摘要失败: {str(e)}")
+
+    def interval_summary(self):
+        """上次调用以来的争用摘要（一行文本），期间没有锁位/下单时返回 None"""
+        with self._lock:
+            interval = self._interval
+            waits = sorted(self._interval_waits)
+            self._interval = {op: Counter() for op in OPERATIONS}
+            self._interval_waits = []
+        if not any(counter['attempts'] for counter in interval.values()):
+            return None
+
+        parts = []
+        for op in OPERATIONS:
+            counter = interval[op]
+            if not counter['attempts']:
+                continue
+            rejected = ' '.join(f"{reason}={counter[reason]}" for reason in REJECTIONS if counter[reason])
+            parts.append(f"{op} 尝试 {counter['attempts']} 成功 {counter['ok']}" + (f" 拒绝 {rejected}" if rejected else ''))
+        hot = ' '.join(f"{spot['schedule_id']}({spot['attempts']}次/等待{spot['wait_ms_total']:.0f}ms)"
+                       for spot in self.hot_schedules(self.log_interval, top=5))
+        return (f"锁位/下单争用（最近 {self.log_interval} 秒）：{'；'.join(parts)}；"
+                f"行锁等待 p50={_percentile(waits, 50):.1f}ms p95={_percentile(waits, 95):.1f}ms "
+                f"max={waits[-1] if waits else 0.0:.1f}ms；最热场次 {hot}")
+
+
+contention_stats = ContentionStats()
@@ -5,10 +5,23 @@
 """
 
 import pymysql
-from pymysql.cursors import DictCursor
 from contextlib import contextmanager
+from collections import deque
+from contextvars import ContextVar
+from functools import partial, wraps
+from itertools import islice
 import logging
-from database_config import DB_CONFIG
+import os
+import random
+import threading
+import time
+from database_config import (DB_CONFIG, POOL_CONFIG, DB_REPLICAS, REPLICA_CONFIG, RETRY_CONFIG,
+                             DB_BACKEND, SQLITE_CONFIG)
+from db_backends import MySQLBackend, SQLiteBackend
+from compact_result import CompactResult
+from query_stats import query_stats, fingerprint
+from query_cache import query_cache, written_tables
+import tracing
 
 # 配置日志
 logging.basicConfig(
@@ -18,46 +31,771 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class DatabaseConnection:
-    """数据库连接管理类 - 使用上下文管理器确保连接安全关闭"""
+class ConnectionPool:
+    """
+    线程安全的数据库连接池
+
+    - pool_size: 常驻的空闲连接上限，归还后保留复用
+    - max_overflow: 常驻连接用完后允许临时创建的连接数，归还时直接关闭
+    - pool_timeout: 连接全部借出时的最长等待时间（秒），超时抛出 TimeoutError
+    - pool_recycle: 连接存活超过该秒数后重建，避免被 MySQL wait_timeout 断开
+    - pre_ping: 借出前先 ping 一次，剔除已失效的连接
+    - nested_overflow: 已持有本池连接的线程再借独立连接（acquire(nested=True)）时额外允许的连接数；
+      这类借用很短，持有连接的请求不会因为等它们而把连接池耗尽、互相等到超时
+    - backend: 创建连接的数据库后端（默认按 DB_BACKEND 配置）
+    """
+
+    def __init__(self, db_config, pool_size=5, max_overflow=10, pool_timeout=30,
+                 pool_recycle=3600, pre_ping=True, name='primary', backend=None, nested_overflow=0):
+        self.db_config = db_config
+        self.backend = backend or get_backend()
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        self.pre_ping = pre_ping
+        self.nested_overflow = nested_overflow
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._idle = deque()      # (connection, created_at)，后进先出，优先复用热连接
+        self._born = {}           # id(connection) -> created_at（借出中的连接）
+        self._total = 0           # 已创建且未关闭的连接数
+        self._pid = os.getpid()
+        self._counters = {
+            'checkouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'invalidated': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def _create_connection(self):
+        """创建一条新的物理连接"""
+        return self.backend.connect(self.db_config)
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _reset_after_fork(self):
+        """多进程部署（fork）后子进程不能复用父进程的 socket，直接丢弃重建"""
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._idle.clear()
+            self._born.clear()
+            self._total = 0
+            self._pid = os.getpid()
+
+    def acquire(self, nested=False):
+        """
+        借出一条连接
+
+        Args:
+            nested: 调用线程已持有本池的一条连接（工作单元内再借独立连接），可使用 nested_overflow 的额度
+
+        Returns:
+            pymysql 连接对象（用完必须调用 release 归还）
+
+        Raises:
+            TimeoutError: 等待超过 pool_timeout 仍无可用连接
+        """
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+        deadline = time.monotonic() + self.pool_timeout
+        connection = None
+        created_at = None
+        limit = self.pool_size + self.max_overflow + (self.nested_overflow if nested else 0)
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    connection, created_at = self._idle.pop()
+                    break
+                if self._total < limit:
+                    self._total += 1  # 先占名额，锁外再建连接
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise TimeoutError(f"连接池[{self.name}]获取连接超时（{self.pool_timeout}秒）")
+                self._counters['waits'] += 1
+                self._cond.wait(remaining)
+            self._counters['checkouts'] += 1
+
+        try:
+            if connection is not None:
+                connection, created_at = self._validate(connection, created_at)
+            else:
+                connection, created_at = self._create_connection(), time.time()
+                self._count('created')
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._born[id(connection)] = created_at
+        return connection
+
+    def _validate(self, connection, created_at):
+        """回收超龄连接、剔除 ping 不通的连接，必要时换一条新连接"""
+        if self.pool_recycle and self.pool_recycle > 0 and time.time() - created_at > self.pool_recycle:
+            self._close_quietly(connection)
+            self._count('recycled')
+            return self._create_connection(), time.time()
+
+        if self.pre_ping:
+            try:
+                connection.ping(reconnect=False)
+            except Exception as e:
+                logger.warning(f"连接池[{self.name}]检测到失效连接，已重建: {str(e)}")
+                self._close_quietly(connection)
+                self._count('invalidated')
+                return self._create_connection(), time.time()
+
+        return connection, created_at
+
+    def release(self, connection, discard=False):
+        """
+        归还连接
+
+        Args:
+            connection: acquire 借出的连接
+            discard: 为 True 时直接关闭（连接状态不可信，例如提交/回滚失败）
+        """
+        with self._cond:
+            created_at = self._born.pop(id(connection), None)
+            if created_at is None:
+                # fork 之前借出的连接或重复归还，直接关闭
+                self._close_quietly(connection)
+                return
+
+            if discard or not connection.open or len(self._idle) >= self.pool_size:
+                self._total -= 1
+                self._close_quietly(connection)
+            else:
+                self._idle.append((connection, created_at))
+            self._cond.notify()
+
+    def dispose(self):
+        """关闭所有空闲连接（借出中的连接在归还时关闭）"""
+        with self._cond:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._total -= 1
+                self._close_quietly(connection)
+            self._cond.notify_all()
+
+    def _count(self, key):
+        with self._cond:
+            self._counters[key] += 1
+
+    def stats(self):
+        """连接池运行状态"""
+        with self._cond:
+            checked_out = len(self._born)
+            return {
+                'name': self.name,
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'nested_overflow': self.nested_overflow,
+                'total': self._total,
+                'idle': len(self._idle),
+                'checked_out': checked_out,
+                'overflow': max(0, self._total - self.pool_size),
+                **self._counters,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_backend = None
+
+
+def get_backend():
+    """获取当前数据库后端（首次使用时按 DB_BACKEND 创建）"""
+    global _backend
+    if _backend is None:
+        if DB_BACKEND == 'sqlite':
+            _backend = SQLiteBackend(SQLITE_CONFIG['path'], SQLITE_CONFIG.get('busy_timeout', 5))
+        elif DB_BACKEND == 'mysql':
+            _backend = MySQLBackend()
+        else:
+            raise ValueError(f"不支持的数据库后端: {DB_BACKEND}")
+    return _backend
+
+
+def use_backend(backend):
+    """
+    切换数据库后端（基准测试/工具脚本使用），关闭现有连接池，之后按新后端重新建立
+
+    示例：
+        backend = SQLiteBackend('/tmp/bench.sqlite3')
+        backend.create_schema()
+        use_backend(backend)
+    """
+    global _backend, _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.dispose()
+        _backend = backend
+        _pool = None
+
+
+def get_pool():
+    """获取全局连接池（首次使用时按 POOL_CONFIG 创建）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DB_CONFIG,
+                    pool_size=POOL_CONFIG['pool_size'],
+                    max_overflow=POOL_CONFIG['max_overflow'],
+                    pool_timeout=POOL_CONFIG['pool_timeout'],
+                    pool_recycle=POOL_CONFIG['pool_recycle'],
+                    pre_ping=POOL_CONFIG.get('pre_ping', True),
+                    nested_overflow=POOL_CONFIG.get('nested_overflow', 0),
+                )
+    return _pool
+
+
+class ReplicaRouter:
+    """
+    只读副本路由：在健康的副本之间轮询，复制延迟过大/连接失败的副本暂时剔除
+
+    - 延迟通过 SHOW REPLICA STATUS（旧版本 SHOW SLAVE STATUS）检测，结果缓存 lag_check_interval 秒
+    - 未配置复制的实例（例如本地两个独立 MySQL 做测试）视为无延迟
+    """
+
+    def __init__(self, replica_configs, config=None):
+        config = config or REPLICA_CONFIG
+        self.max_lag_seconds = config.get('max_lag_seconds', 5)
+        self.lag_check_interval = config.get('lag_check_interval', 5)
+        self.pools = [
+            ConnectionPool(
+                replica,
+                pool_size=POOL_CONFIG['pool_size'],
+                max_overflow=POOL_CONFIG['max_overflow'],
+                pool_timeout=POOL_CONFIG['pool_timeout'],
+                pool_recycle=POOL_CONFIG['pool_recycle'],
+                pre_ping=POOL_CONFIG.get('pre_ping', True),
+                name=f"replica-{index}",
+            )
+            for index, replica in enumerate(replica_configs)
+        ]
+        self._lock = threading.Lock()
+        self._health = {pool.name: {'lag': None, 'healthy': True, 'checked_at': 0.0, 'error': None}
+                        for pool in self.pools}
+        self._next = 0
+        self._routed = {'replica': 0, 'primary_no_replica': 0, 'primary_own_writes': 0}
+
+    def choose(self):
+        """选出一个可用副本；没有可用副本时返回 None"""
+        if not self.pools:
+            return None
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.pools)
+        for offset in range(len(self.pools)):
+            pool = self.pools[(start + offset) % len(self.pools)]
+            if self._is_healthy(pool):
+                return pool
+        return None
+
+    def _is_healthy(self, pool):
+        state = self._health[pool.name]
+        if time.monotonic() - state['checked_at'] >= self.lag_check_interval:
+            self._check_lag(pool)
+        return state['healthy']
+
+    def _check_lag(self, pool):
+        state = self._health[pool.name]
+        with self._lock:
+            # 同一时刻只让一个线程去检测，其它线程沿用上次结果
+            if time.monotonic() - state['checked_at'] < self.lag_check_interval:
+                return
+            state['checked_at'] = time.monotonic()
+
+        connection = None
+        try:
+            connection = pool.acquire()
+            with connection.cursor() as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except pymysql.err.MySQLError:
+                    cursor.execute("SHOW SLAVE STATUS")
+                row = cursor.fetchone()
+            connection.commit()
+
+            if not row:
+                lag = 0
+            else:
+                lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+            healthy = lag is not None and lag <= self.max_lag_seconds
+            state.update(lag=lag, healthy=healthy, error=None if lag is not None else '复制已中断')
+            pool.release(connection)
+        except Exception as e:
+            if connection is not None:
+                pool.release(connection, discard=True)
+            state.update(lag=None, healthy=False, error=str(e))
+            logger.warning(f"只读副本[{pool.name}]不可用，读请求回退主库: {str(e)}")
+
+    def mark_failed(self, pool, error):
+        """执行读请求时连接失败，立即剔除该副本直到下次检测"""
+        self._health[pool.name].update(healthy=False, error=str(error), checked_at=time.monotonic())
+
+    def count(self, key):
+        with self._lock:
+            self._routed[key] += 1
+
+    def stats(self):
+        with self._lock:
+            routed = dict(self._routed)
+        return {
+            'routed': routed,
+            'replicas': [
+                {**pool.stats(), **{k: v for k, v in self._health[pool.name].items() if k != 'checked_at'}}
+                for pool in self.pools
+            ],
+        }
+
+
+_router = None
+
+
+def get_replica_router():
+    """获取全局副本路由（按 DB_REPLICAS 创建，未配置副本时路由结果总是主库）"""
+    global _router
+    if _router is None:
+        with _pool_lock:
+            if _router is None:
+                _router = ReplicaRouter(DB_REPLICAS)
+    return _router
+
+
+@contextmanager
+def _instrument(sql):
+    """单条 SQL 的执行统计 + 追踪 span（调用方把返回/影响行数写入 tracker.rows）"""
+    with tracing.span('sql', kind='sql', statement=fingerprint(sql)) as sql_span:
+        with query_stats.track(sql) as tracker:
+            yield tracker
+        if sql_span is not None:
+            sql_span.attrs['rows'] = tracker.rows
+
+
+def _flask_g():
+    """在 Flask 请求/应用上下文中返回 g，否则返回 None（脚本/工具场景）"""
+    try:
+        from flask import g, has_app_context
+    except ImportError:
+        return None
+    return g if has_app_context() else None
+
+
+_uow_local = threading.local()
+
+
+class UnitOfWork:
+    """
+    工作单元：一次 API 请求内的所有 SafeDatabase 调用共用一条连接、一个事务
+
+    - 连接在第一次执行 SQL 时才从连接池借出（不访问数据库的请求不占连接）
+    - 由 end_unit_of_work 统一提交或回滚，中途的 SafeDatabase 调用不再各自提交
+    - after_commit 注册的回调在事务提交成功后执行（回滚时丢弃），如查询缓存失效
+    - after_rollback 注册的回调在事务回滚（或提交失败）、连接归还之后执行，如释放事务外占用的资源
+    """
 
     def __init__(self):
+        self.pool = None
+        self.connection = None
+        self.broken = False  # 出现连接层错误后不再复用该连接
+        self.dirty = False   # 是否已执行写操作（已写入的请求后续读都走主库）
+        self._savepoint_seq = 0
+        self._after_commit = []
+        self._after_rollback = []
+
+    def after_commit(self, callback):
+        self._after_commit.append(callback)
+
+    def after_rollback(self, callback):
+        self._after_rollback.append(callback)
+
+    def get_connection(self):
+        if self.connection is None:
+            self.pool = get_pool()
+            self.connection = self.pool.acquire()
+        return self.connection
+
+    def next_savepoint(self):
+        self._savepoint_seq += 1
+        return f"uow_sp_{self._savepoint_seq}"
+
+    def rollback_for_retry(self):
+        """
+        撤销本工作单元至今的全部操作，供冲突重试从头重做
+
+        回滚后连接立即归还连接池，退避等待期间不占连接（冲突多时大量请求同时在退避）；
+        重做时第一次执行 SQL 再重新借出。
+        """
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            discard = self.broken
+            try:
+                if not discard:
+                    with tracing.span('rollback', kind='sql', reason='retry'):
+                        connection.rollback()
+            except Exception:
+                discard = True
+                raise
+            finally:
+                self.pool.release(connection, discard=discard)
+        self.broken = False
+        self.dirty = False
+        self._savepoint_seq = 0
+        self._after_commit = []
+
+    def finish(self, commit=True):
+        """提交或回滚并归还连接"""
+        callbacks, self._after_commit = self._after_commit, []
+        rollback_callbacks, self._after_rollback = self._after_rollback, []
+        if self.connection is None:
+            _run_after_commit(callbacks if commit else rollback_callbacks)
+            return
+        connection, self.connection = self.connection, None
+        discard = self.broken
+        committed = False
+        try:
+            if commit and not self.broken:
+                with tracing.span('commit', kind='sql'):
+                    connection.commit()
+                committed = True
+                logger.info("工作单元事务提交")
+                _run_after_commit(callbacks)
+            else:
+                with tracing.span('rollback', kind='sql'):
+                    connection.rollback()
+                logger.warning("工作单元事务回滚")
+        except Exception:
+            discard = True
+            raise
+        finally:
+            self.pool.release(connection, discard=discard)
+            if not committed:
+                _run_after_commit(rollback_callbacks)
+
+
+def _run_after_commit(callbacks):
+    """执行提交后（或回滚后）回调；事务已经结束，回调失败只记日志"""
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"提交后回调执行失败: {str(e)}")
+
+
+def current_unit_of_work():
+    """返回当前绑定的工作单元（Flask 请求绑定在 g 上，其它场景绑定在线程上）"""
+    g = _flask_g()
+    if g is not None:
+        return g.get('_db_unit_of_work')
+    return getattr(_uow_local, 'unit_of_work', None)
+
+
+def begin_unit_of_work():
+    """开启并绑定工作单元；已存在时直接返回现有的"""
+    uow = current_unit_of_work()
+    if uow is not None:
+        return uow
+    uow = UnitOfWork()
+    g = _flask_g()
+    if g is not None:
+        g._db_unit_of_work = uow
+    else:
+        _uow_local.unit_of_work = uow
+    return uow
+
+
+def end_unit_of_work(commit=True):
+    """解绑当前工作单元并提交/回滚（未开启时什么也不做）"""
+    g = _flask_g()
+    if g is not None:
+        uow = g.pop('_db_unit_of_work', None)
+    else:
+        uow = getattr(_uow_local, 'unit_of_work', None)
+        _uow_local.unit_of_work = None
+    if uow is not None:
+        uow.finish(commit=commit)
+
+
+_recent_writes = {}          # 一致性键 -> 最近一次写入的时间（monotonic）
+_recent_writes_lock = threading.Lock()
+# 非 Flask 场景的一致性键放在 ContextVar 中，随 copy_context 带入异步层的工作线程
+_consistency_key = ContextVar('db_consistency_key', default=None)
+
+
+def set_consistency_key(key):
+    """
+    设置当前调用方的一致性键（例如 "player:3001"）
+
+    该调用方写入后 read_your_writes_window 秒内，本进程中它的只读查询都走主库，
+    避免刚下单就去副本读“我的订单”却读不到。
+    """
+    g = _flask_g()
+    if g is not None:
+        g._db_consistency_key = key
+    else:
+        _consistency_key.set(key)
+
+
+def _current_consistency_key():
+    g = _flask_g()
+    if g is not None:
+        return g.get('_db_consistency_key')
+    return _consistency_key.get()
+
+
+def _note_write(*sqls, db=None):
+    """
+    记录一次写入：标记工作单元已写、记录调用方最近写入时间，
+    并在提交后让依赖被写表的查询缓存失效（工作单元/本次连接提交后执行；两者都没有时说明已提交，立即执行）
+    """
+    uow = current_unit_of_work()
+    if uow is not None:
+        uow.dirty = True
+
+    tables = set().union(*(written_tables(sql) for sql in sqls))
+    if tables and query_cache.enabled:
+        invalidate = partial(query_cache.invalidate, tables)
+        if uow is not None:
+            uow.after_commit(invalidate)
+        elif db is not None:
+            db.after_commit(invalidate)
+        else:
+            invalidate()
+
+    key = _current_consistency_key()
+    if key is None:
+        return
+    now = time.monotonic()
+    window = REPLICA_CONFIG.get('read_your_writes_window', 10)
+    with _recent_writes_lock:
+        _recent_writes[key] = now
+        if len(_recent_writes) > 10000:
+            # 清理过期记录，防止无限增长
+            for stale in [k for k, t in _recent_writes.items() if now - t > window]:
+                del _recent_writes[stale]
+
+
+def _read_from_primary_required():
+    """当前调用方是否必须读主库（本请求已写入，或刚写入过）"""
+    uow = current_unit_of_work()
+    if uow is not None and uow.dirty:
+        return True
+    key = _current_consistency_key()
+    if key is None:
+        return False
+    with _recent_writes_lock:
+        last_write = _recent_writes.get(key)
+    window = REPLICA_CONFIG.get('read_your_writes_window', 10)
+    return last_write is not None and time.monotonic() - last_write < window
+
+
+def _choose_read_pool(use_replica):
+    """按路由提示选择连接池；返回 None 表示走默认路径（主库/工作单元）"""
+    if not use_replica:
+        return None
+    router = get_replica_router()
+    if not router.pools:
+        return None
+    if _read_from_primary_required():
+        router.count('primary_own_writes')
+        return None
+    pool = router.choose()
+    router.count('replica' if pool is not None else 'primary_no_replica')
+    return pool
+
+
+class DatabaseConnection:
+    """
+    数据库连接管理类 - 使用上下文管理器确保连接安全归还连接池
+
+    存在工作单元时复用其连接，事务由工作单元统一提交；
+    savepoint=True 时用 SAVEPOINT 保证本次多语句操作在工作单元内仍然整体生效或整体撤销；
+    指定 pool（例如只读副本）时总是从该连接池单独借连接，不加入工作单元。
+    """
+
+    def __init__(self, savepoint=False, pool=None):
         self.connection = None
         self.cursor = None
+        self.pool = pool
+        self.unit_of_work = None
+        self.savepoint = savepoint
+        self._savepoint_name = None
+        self._after_commit = []
+
+    def after_commit(self, callback):
+        """注册提交后回调（在工作单元内时转交工作单元，由其提交后执行）"""
+        if self.unit_of_work is not None:
+            self.unit_of_work.after_commit(callback)
+        else:
+            self._after_commit.append(callback)
 
     def __enter__(self):
-        """进入上下文时建立连接"""
+        """进入上下文时借出连接（或加入当前工作单元）"""
+        uow = current_unit_of_work() if self.pool is None else None
+        if uow is not None:
+            self.unit_of_work = uow
+            self.connection = uow.get_connection()
+            self.cursor = self.connection.cursor()
+            if self.savepoint:
+                self._savepoint_name = uow.next_savepoint()
+                self.cursor.execute(f"SAVEPOINT {self._savepoint_name}")
+            return self
+
         try:
-            self.connection = pymysql.connect(
-                host=DB_CONFIG['host'],
-                port=DB_CONFIG['port'],
-                user=DB_CONFIG['user'],
-                password=DB_CONFIG['password'],
-                database=DB_CONFIG['database'],
-                charset=DB_CONFIG['charset'],
-                cursorclass=DictCursor,  # 返回字典格式结果
-                autocommit=False  # 手动控制事务
-            )
+            self.pool = self.pool or get_pool()
+            # 工作单元已持有同一个池的连接时（事务外取号段、加载座位库存等），按嵌套借用
+            holder = current_unit_of_work()
+            nested = holder is not None and holder.connection is not None and holder.pool is self.pool
+            self.connection = self.pool.acquire(nested=nested)
             self.cursor = self.connection.cursor()
-            logger.info("数据库连接成功")
+            logger.debug("数据库连接已借出")
             return self
         except Exception as e:
+            if self.connection is not None:
+                self.pool.release(self.connection, discard=True)
+                self.connection = None
             logger.error(f"数据库连接失败: {str(e)}")
             raise
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """退出上下文时关闭连接"""
+        """退出上下文时提交/回滚并把连接归还连接池"""
+        if self.unit_of_work is not None:
+            self._exit_unit_of_work(exc_type, exc_val)
+            return
+
         if self.cursor:
-            self.cursor.close()
+            try:
+                self.cursor.close()
+            except Exception:
+                pass
         if self.connection:
-            if exc_type:
-                self.connection.rollback()  # 发生异常时回滚
-                logger.warning("事务回滚")
-            else:
-                self.connection.commit()  # 正常情况下提交
-                logger.info("事务提交")
-            self.connection.close()
-            logger.info("数据库连接关闭")
+            discard = False
+            try:
+                if exc_type:
+                    self.connection.rollback()  # 发生异常时回滚
+                    logger.warning("事务回滚")
+                    # 连接层错误（断线等）后连接状态不可信，不再放回池中
+                    discard = _is_connection_error(exc_val)
+                else:
+                    self.connection.commit()  # 正常情况下提交
+                    logger.info("事务提交")
+                    _run_after_commit(self._after_commit)
+            except Exception:
+                discard = True
+                raise
+            finally:
+                self.pool.release(self.connection, discard=discard)
+                logger.debug("数据库连接已归还")
+
+    def _exit_unit_of_work(self, exc_type, exc_val):
+        """工作单元内只撤销本次操作（如有 SAVEPOINT），提交留给请求结束时"""
+        try:
+            if exc_type and _is_connection_error(exc_val):
+                self.unit_of_work.broken = True
+            elif exc_type and self._savepoint_name:
+                self.cursor.execute(f"ROLLBACK TO SAVEPOINT {self._savepoint_name}")
+                logger.warning(f"工作单元内回滚到 {self._savepoint_name}")
+        finally:
+            try:
+                self.cursor.close()
+            except Exception:
+                pass
+
+
+def is_retryable_error(exc):
+    """是否为可重做的冲突错误（死锁 1213、锁等待超时 1205）"""
+    return (isinstance(exc, pymysql.err.OperationalError)
+            and bool(exc.args) and exc.args[0] in RETRY_CONFIG['retryable_errors'])
+
+
+def _is_connection_error(exc):
+    """连接层错误（断线等）；死锁/锁等待超时只影响事务，连接本身仍可复用"""
+    if isinstance(exc, pymysql.err.InterfaceError):
+        return True
+    return isinstance(exc, pymysql.err.OperationalError) and not is_retryable_error(exc)
+
+
+_in_retry_scope = ContextVar('db_in_retry_scope', default=False)
+
+
+def _retry_delay(attempt):
+    """第 attempt 次重试前的等待时间（秒）：指数退避 + 全抖动，避免冲突双方同时重来再次撞上"""
+    cap = min(RETRY_CONFIG['max_delay_ms'], RETRY_CONFIG['base_delay_ms'] * (2 ** attempt))
+    return random.uniform(0, cap) / 1000.0
+
+
+def retry_on_conflict(func):
+    """
+    装饰器：业务写操作遇到死锁/锁等待超时时回滚并从头重做整个操作
+
+    - 在工作单元内时先回滚工作单元（撤销本操作已做的读写），再重新执行；
+      若本请求在进入该操作前已有其它写入，重做会丢失这些写入，此时不重试直接抛出
+    - 嵌套调用时只由最外层负责重试
+    - 重试次数用完后抛出 ValueError，由接口层按普通业务错误返回
+    - 每个操作的冲突/重试/成功/放弃次数记入 SQL 执行统计（/api/admin/db-stats 的 retries）
+    """
+    operation = func.__qualname__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _in_retry_scope.get():
+            return func(*args, **kwargs)
+
+        uow = current_unit_of_work()
+        can_retry = uow is None or not uow.dirty
+        max_attempts = max(1, RETRY_CONFIG['max_attempts'])
+        token = _in_retry_scope.set(True)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    result = func(*args, **kwargs)
+                    if attempt:
+                        query_stats.record_retry(operation, 'succeeded')
+                    return result
+                except Exception as e:
+                    if not is_retryable_error(e):
+                        raise
+                    query_stats.record_retry(operation, 'deadlock' if e.args[0] == 1213 else 'lock_wait')
+                    if not can_retry:
+                        query_stats.record_retry(operation, 'not_retryable')
+                        raise
+                    attempt += 1
+                    if attempt >= max_attempts:
+                        query_stats.record_retry(operation, 'exhausted')
+                        logger.error(f"{operation} 冲突重试 {attempt} 次仍失败: {str(e)}")
+                        raise ValueError("当前预约人数较多，请稍后重试") from e
+
+                    if uow is not None:
+                        uow.rollback_for_retry()
+                    delay = _retry_delay(attempt)
+                    logger.warning(f"{operation} 遇到冲突（{e.args[0]}），{delay * 1000:.0f}ms 后第 {attempt} 次重试")
+                    query_stats.record_retry(operation, 'retried')
+                    time.sleep(delay)
+        finally:
+            _in_retry_scope.reset(token)
+
+    return wrapper
 
 
 class SafeDatabase:
@@ -71,7 +809,8 @@ class SafeDatabase:
     """
 
     @staticmethod
-    def execute_query(sql, params=None, fetch_one=False, fetch_all=True):
+    def execute_query(sql, params=None, fetch_one=False, fetch_all=True, use_replica=False, compact=False,
+                      cache_tables=None, cache_ttl=None):
         """
         安全执行查询语句（SELECT）
 
@@ -80,28 +819,69 @@ class SafeDatabase:
             params: 参数元组或列表
             fetch_one: 是否只返回一条记录
             fetch_all: 是否返回所有记录
+            use_replica: 允许读只读副本（报表/列表等可接受秒级延迟的查询）；
+                         没有可用副本、或调用方刚写入过时仍读主库
+            compact: 为 True 时返回 CompactResult（列名一份 + 元组行），用于上万行的大列表；
+                     fetch_one 时忽略
+            cache_tables: 查询依赖的表；传入时结果进入查询缓存，写入这些表并提交后失效。
+                          当前事务已有未提交的写入时绕过缓存；未命中时单独借连接读取最新已提交数据
+            cache_ttl: 缓存秒数，默认 QUERY_CACHE_CONFIG['default_ttl']
 
         Returns:
-            查询结果（字典或字典列表）
+            查询结果（字典或字典列表；compact=True 时为 CompactResult）
 
         安全说明：
         - 使用参数化查询，params会被安全转义
         - 永远不要使用字符串拼接构建SQL
         """
+        if cache_tables and query_cache.enabled:
+            uow = current_unit_of_work()
+            if uow is not None and uow.dirty:
+                query_cache.count_bypass()
+            else:
+                # 未命中时不加入工作单元：工作单元的事务快照可能早于最近一次写入，读到的旧数据不能写进缓存
+                return query_cache.get_or_load(
+                    (sql, params, fetch_one, fetch_all, compact), cache_tables,
+                    lambda replica_ok: SafeDatabase._read(sql, params, fetch_one, fetch_all,
+                                                          use_replica and replica_ok, compact, get_pool()),
+                    ttl=cache_ttl
+                )
+        return SafeDatabase._read(sql, params, fetch_one, fetch_all, use_replica, compact)
+
+    @staticmethod
+    def _read(sql, params, fetch_one, fetch_all, use_replica, compact, primary=None):
+        """按路由读取：可用副本优先，副本失败时改读主库（primary 为 None 时走工作单元/默认连接池）"""
+        pool = _choose_read_pool(use_replica)
+        if pool is not None:
+            try:
+                return SafeDatabase._execute_query(sql, params, fetch_one, fetch_all, pool, compact)
+            except (pymysql.err.OperationalError, pymysql.err.InterfaceError, TimeoutError) as e:
+                get_replica_router().mark_failed(pool, e)
+                logger.warning(f"只读副本[{pool.name}]查询失败，改读主库: {str(e)}")
+        return SafeDatabase._execute_query(sql, params, fetch_one, fetch_all, primary, compact)
+
+    @staticmethod
+    def _execute_query(sql, params, fetch_one, fetch_all, pool=None, compact=False):
         try:
-            with DatabaseConnection() as db:
+            with DatabaseConnection(pool=pool) as db:
                 # 记录SQL日志（不记录敏感参数）
                 logger.info(f"执行查询: {sql[:100]}...")
 
-                # 执行参数化查询
-                db.cursor.execute(sql, params or ())
+                if compact and fetch_all and not fetch_one:
+                    return SafeDatabase._execute_compact(db, sql, params)
 
-                if fetch_one:
-                    result = db.cursor.fetchone()
-                elif fetch_all:
-                    result = db.cursor.fetchall()
-                else:
-                    result = None
+                # 执行参数化查询（统计耗时与返回行数）
+                with _instrument(sql) as tracker:
+                    db.cursor.execute(sql, params or ())
+
+                    if fetch_one:
+                        result = db.cursor.fetchone()
+                        tracker.rows = 1 if result else 0
+                    elif fetch_all:
+                        result = db.cursor.fetchall()
+                        tracker.rows = len(result)
+                    else:
+                        result = None
 
                 logger.info(f"查询成功，返回 {len(result) if result else 0} 条记录")
                 return result
@@ -110,6 +890,90 @@ class SafeDatabase:
             logger.error(f"查询执行失败: {str(e)}")
             raise
 
+    @staticmethod
+    def _execute_compact(db, sql, params):
+        """在同一连接上用元组游标执行查询，返回 CompactResult"""
+        backend = (db.pool or get_pool()).backend
+        with backend.compact_cursor(db.connection) as cursor:
+            with _instrument(sql) as tracker:
+                cursor.execute(sql, params or ())
+                result = CompactResult([column[0] for column in cursor.description], list(cursor.fetchall()))
+                tracker.rows = len(result)
+        logger.info(f"查询成功，返回 {len(result)} 条记录（紧凑格式）")
+        return result
+
+    @staticmethod
+    def execute_query_stream(sql, params=None, chunk_size=500, use_replica=False, compact=False):
+        """
+        流式执行查询语句（无缓冲的服务端游标，适合不带 LIMIT 的大列表）
+
+        Args:
+            sql: SQL语句（使用%s作为占位符）
+            params: 参数元组或列表
+            chunk_size: 每次从服务端读取的行数
+            use_replica: 允许读只读副本（同 execute_query）
+            compact: 为 True 时返回 CompactResult，其 rows 为逐行产出元组的生成器
+
+        Returns:
+            逐行产出字典的生成器；内存占用与总行数无关
+
+        说明：
+        - SQL 在调用时立即执行，连接/语法错误在返回生成器之前抛出
+        - 无缓冲游标在读完之前独占连接，因此总是单独从连接池借一条连接，
+          不加入当前工作单元（只用于只读查询）
+        - 生成器读完或被关闭时归还连接；提前关闭时直接丢弃该连接，避免把剩余结果读完
+        """
+        replica = _choose_read_pool(use_replica)
+        while True:
+            pool = replica or get_pool()
+            connection = None
+            try:
+                connection = pool.acquire()
+                logger.info(f"执行流式查询: {sql[:100]}...")
+                cursor = pool.backend.stream_cursor(connection, compact=compact)
+                with _instrument(sql):
+                    cursor.execute(sql, params or ())
+                break
+            except Exception as e:
+                if connection is not None:
+                    pool.release(connection, discard=True)
+                if replica is not None and isinstance(
+                        e, (pymysql.err.OperationalError, pymysql.err.InterfaceError, TimeoutError)):
+                    get_replica_router().mark_failed(replica, e)
+                    logger.warning(f"只读副本[{replica.name}]查询失败，改读主库: {str(e)}")
+                    replica = None
+                    continue
+                logger.error(f"流式查询执行失败: {str(e)}")
+                raise
+
+        def generate():
+            finished = False
+            count = 0
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    yield from rows
+                finished = True
+                logger.info(f"流式查询完成，共返回 {count} 条记录")
+            except Exception as e:
+                logger.error(f"流式查询读取失败: {str(e)}")
+                raise
+            finally:
+                if finished:
+                    try:
+                        cursor.close()
+                        connection.commit()  # 结束只读快照，避免归还后连接停留在旧事务中
+                    except Exception:
+                        finished = False
+                pool.release(connection, discard=not finished)
+
+        if compact:
+            return CompactResult([column[0] for column in cursor.description], generate())
+        return generate()
+
     @staticmethod
     def execute_update(sql, params=None):
         """
@@ -131,7 +995,10 @@ class SafeDatabase:
                 logger.info(f"执行更新: {sql[:100]}...")
 
                 # 执行参数化更新
-                affected_rows = db.cursor.execute(sql, params or ())
+                with _instrument(sql) as tracker:
+                    affected_rows = db.cursor.execute(sql, params or ())
+                    tracker.rows = affected_rows
+                _note_write(sql, db=db)
 
                 logger.info(f"更新成功，影响 {affected_rows} 行")
                 return affected_rows
@@ -158,13 +1025,16 @@ class SafeDatabase:
             ]
         """
         try:
-            with DatabaseConnection() as db:
+            with DatabaseConnection(savepoint=True) as db:
                 logger.info(f"开始执行事务，共 {len(operations)} 个操作")
                 total_affected = 0
 
                 for sql, params in operations:
-                    affected = db.cursor.execute(sql, params or ())
+                    with _instrument(sql) as tracker:
+                        affected = db.cursor.execute(sql, params or ())
+                        tracker.rows = affected
                     total_affected += affected
+                _note_write(*(sql for sql, _ in operations), db=db)
 
                 logger.info(f"事务执行成功，共影响 {total_affected} 行")
                 return total_affected
@@ -172,3 +1042,167 @@ class SafeDatabase:
         except Exception as e:
             logger.error(f"事务执行失败，已回滚: {str(e)}")
             raise
+
+    @staticmethod
+    def execute_many(sql, rows, batch_size=500, commit_each_batch=False):
+        """
+        批量执行同一条写语句（executemany）
+
+        Args:
+            sql: SQL语句（使用%s作为占位符）；形如 INSERT ... VALUES (%s, ...) 时，
+                 pymysql 会把一批参数改写成一条多行 INSERT，每批只需一次往返
+            rows: 参数元组的可迭代对象
+            batch_size: 每批行数
+            commit_each_batch: 为 True 时每批单独提交（大批量导入，失败只影响当前批次）；
+                               在工作单元内时忽略，仍由工作单元统一提交
+
+        Returns:
+            所有批次影响的总行数
+
+        示例：
+            SafeDatabase.execute_many(
+                "INSERT INTO T_Order (Order_ID, Player_ID, Schedule_ID, Amount, Pay_Status, Create_Time) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                order_rows
+            )
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size必须是正整数")
+
+        def batches():
+            iterator = iter(rows)
+            while True:
+                batch = list(islice(iterator, batch_size))
+                if not batch:
+                    return
+                yield batch
+
+        try:
+            logger.info(f"执行批量写入: {sql[:100]}...")
+            total_affected = 0
+            batch_count = 0
+
+            if commit_each_batch and current_unit_of_work() is None:
+                for batch in batches():
+                    with DatabaseConnection() as db:
+                        with _instrument(sql) as tracker:
+                            tracker.rows = db.cursor.executemany(sql, batch) or 0
+                    total_affected += tracker.rows
+                    batch_count += 1
+            else:
+                with DatabaseConnection(savepoint=True) as db:
+                    for batch in batches():
+                        with _instrument(sql) as tracker:
+                            tracker.rows = db.cursor.executemany(sql, batch) or 0
+                        total_affected += tracker.rows
+                        batch_count += 1
+
+            if batch_count:
+                _note_write(sql)
+            logger.info(f"批量写入成功，共 {batch_count} 批，影响 {total_affected} 行")
+            return total_affected
+
+        except Exception as e:
+            logger.error(f"批量写入失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def execute_snapshot(queries):
+        """
+        在同一个只读事务中执行多条查询（单独借主库连接，不加入工作单元）
+
+        InnoDB 可重复读隔离级别下几条查询读到同一个一致性快照，且是最新已提交的数据
+        （不受当前工作单元事务快照的影响），用于几张表的结果必须互相对得上的场景，如座位库存加载。
+
+        Args:
+            queries: [(sql, params), ...]
+
+        Returns:
+            与 queries 一一对应的结果（字典列表）
+        """
+        try:
+            with DatabaseConnection(pool=get_pool()) as db:
+                results = []
+                for sql, params in queries:
+                    with _instrument(sql) as tracker:
+                        db.cursor.execute(sql, params or ())
+                        rows = list(db.cursor.fetchall())
+                        tracker.rows = len(rows)
+                    results.append(rows)
+                return results
+
+        except Exception as e:
+            logger.error(f"快照查询失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def pool_stats():
+        """
+        连接池运行状态（用于监控/排查连接泄漏）
+
+        Returns:
+            dict: total/idle/checked_out/overflow 及 created/recycled/timeouts 等计数
+        """
+        return get_pool().stats()
+
+    @staticmethod
+    def replica_stats():
+        """
+        只读副本状态（各副本连接池、复制延迟、健康状态，以及读请求路由计数）
+        """
+        return get_replica_router().stats()
+
+    @staticmethod
+    @contextmanager
+    def unit_of_work():
+        """
+        在非请求场景（脚本、后台任务）中手动开启工作单元
+
+        with SafeDatabase.unit_of_work():
+            ...  # 期间所有 SafeDatabase 调用共用一个事务，正常退出提交，异常回滚
+
+        已处于工作单元中（例如 Flask 请求内）时直接加入外层，不单独提交。
+        """
+        if current_unit_of_work() is not None:
+            yield current_unit_of_work()
+            return
+
+        uow = begin_unit_of_work()
+        try:
+            yield uow
+        except BaseException:
+            end_unit_of_work(commit=False)
+            raise
+        else:
+            end_unit_of_work(commit=True)
+
+    @staticmethod
+    def get_query_stats(top=50, order_by='total_ms'):
+        """
+        各类 SQL 的执行统计（调用次数、p50/p95/p99 耗时、返回行数、主要调用方）
+
+        Args:
+            top: 返回前 N 类语句
+            order_by: 排序字段（total_ms/count/p95_ms/max_ms/avg_ms/errors/slow）
+        """
+        return query_stats.snapshot(top=top, order_by=order_by)
+
+    @staticmethod
+    def reset_query_stats():
+        """清空 SQL 执行统计和查询缓存统计（例如发布后重新观察）"""
+        query_stats.reset()
+        query_cache.reset()
+
+    @staticmethod
+    def cache_stats():
+        """
+        查询缓存状态（命中/未命中/绕过/失效次数、命中率、各表统计、缓存条数）
+        """
+        return query_cache.snapshot()
+
+    @staticmethod
+    def invalidate_cache(*tables):
+        """
+        手动使依赖这些表的缓存失效（用于绕过 SafeDatabase 的写入，如在数据库客户端里改数据后）
+        """
+        query_cache.invalidate(tables)
@@ -85,7 +85,9 @@ SELECT 'OK: boss user Boss created/updated (password=123456)' AS Status;
 /*==================== 2) 锁位超时自动过期（可选） ====================*/
 /* 注意：
    - 需要 MySQL event_scheduler 开启；若你没有权限开启 GLOBAL 变量，可以跳过
-   - 本系统逻辑中：Locked_Count 只统计 Status=0 且 ExpireTime>NOW()，所以事件不是必需
+   - 过期锁位改为 Status=3 的同时扣减 T_Schedule.Locked_Count、重新计算 Next_Lock_Expire
+     （见 008_schedule_occupancy_counters.sql / 012_schedule_next_lock_expire.sql）
+   - 没有事件时可用定时任务执行 tools/reconcile_occupancy.py --expire；下单/锁位时也会清理本场次的过期锁位
 */
 DROP EVENT IF EXISTS evt_expire_locks;
 
@@ -95,9 +97,24 @@ ON SCHEDULE EVERY 1 MINUTE
 STARTS CURRENT_TIMESTAMP
 DO
 BEGIN
-  UPDATE t_lock_record
-  SET Status = 3
-  WHERE Status = 0 AND ExpireTime < NOW();
+  DECLARE v_now DATETIME DEFAULT NOW();
+  START TRANSACTION;
+  UPDATE T_Schedule sch
+  JOIN (
+    SELECT Schedule_ID, COUNT(*) AS cnt FROM t_lock_record
+    WHERE Status = 0 AND ExpireTime <= v_now
+    GROUP BY Schedule_ID
+  ) e ON e.Schedule_ID = sch.Schedule_ID
+  SET sch.Locked_Count = sch.Locked_Count - e.cnt;
+
+  UPDATE t_lock_record SET Status = 3 WHERE Status = 0 AND ExpireTime <= v_now;
+
+  UPDATE T_Schedule sch
+  SET sch.Next_Lock_Expire = (
+    SELECT MIN(l.ExpireTime) FROM t_lock_record l WHERE l.Schedule_ID = sch.Schedule_ID AND l.Status = 0
+  )
+  WHERE sch.Next_Lock_Expire <= v_now;
+  COMMIT;
 END$$
 DELIMITER ;
 
@@ -231,19 +248,14 @@ DROP FUNCTION IF EXISTS fn_schedule_occupied;
 DELIMITER $$
 CREATE FUNCTION fn_schedule_occupied(p_schedule_id BIGINT)
 RETURNS INT
-DETERMINISTIC
+READS SQL DATA
 BEGIN
-  DECLARE booked INT DEFAULT 0;
-  DECLARE locked INT DEFAULT 0;
-  SELECT COUNT(*) INTO booked
-  FROM T_Order o
-  WHERE o.Schedule_ID = p_schedule_id AND o.Pay_Status IN (0, 1);
-
-  SELECT COUNT(*) INTO locked
-  FROM t_lock_record l
-  WHERE l.Schedule_ID = p_schedule_id AND l.Status = 0 AND l.ExpireTime > NOW();
-
-  RETURN booked + locked;
+  /* 已预约 + 锁定中，读 T_Schedule 上由后端维护的计数列 */
+  DECLARE occupied INT DEFAULT 0;
+  SELECT Booked_Count + Locked_Count INTO occupied
+  FROM T_Schedule
+  WHERE Schedule_ID = p_schedule_id;
+  RETURN occupied;
 END$$
 DELIMITER ;
 
@@ -0,0 +1,84 @@
+/*==============================================================
+  007_keyset_pagination_indexes.sql
+  作用：为订单/锁位/场次列表的键集分页补齐复合索引
+
+  背景：
+  - 列表接口支持 ?limit=&cursor= 分页，按 (时间列 DESC, 主键 DESC) 翻页：
+        WHERE [过滤列 = ?] AND (时间列 < ? OR (时间列 = ? AND 主键 < ?))
+        ORDER BY 时间列 DESC, 主键 DESC LIMIT n
+  - 有 (过滤列, 时间列, 主键) 索引时每页只需扫描 n 行，翻页耗时不随历史数据增长
+
+  特性：
+  - 兼容 MySQL 5.7（不支持 CREATE INDEX IF NOT EXISTS，改为先查 information_schema）
+  - 可重复执行（索引已存在则跳过）
+==============================================================*/
+
+SET NAMES utf8mb4;
+
+-- 1) 后台订单列表（全局）
+SET @idx_exists := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'T_Order' AND INDEX_NAME = 'idx_order_create_time'
+);
+SET @sql := IF(@idx_exists = 0,
+  'ALTER TABLE T_Order ADD INDEX idx_order_create_time (Create_Time, Order_ID)',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+-- 2) 我的订单
+SET @idx_exists := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'T_Order' AND INDEX_NAME = 'idx_order_player_time'
+);
+SET @sql := IF(@idx_exists = 0,
+  'ALTER TABLE T_Order ADD INDEX idx_order_player_time (Player_ID, Create_Time, Order_ID)',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+-- 3) 后台锁位列表（全局）
+SET @idx_exists := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 't_lock_record' AND INDEX_NAME = 'idx_lock_time'
+);
+SET @sql := IF(@idx_exists = 0,
+  'ALTER TABLE t_lock_record ADD INDEX idx_lock_time (LockTime, LockID)',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+-- 4) 我的锁位
+SET @idx_exists := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 't_lock_record' AND INDEX_NAME = 'idx_lock_player_time'
+);
+SET @sql := IF(@idx_exists = 0,
+  'ALTER TABLE t_lock_record ADD INDEX idx_lock_player_time (Player_ID, LockTime, LockID)',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+-- 5) 后台场次列表（老板全局）
+SET @idx_exists := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'T_Schedule' AND INDEX_NAME = 'idx_schedule_start'
+);
+SET @sql := IF(@idx_exists = 0,
+  'ALTER TABLE T_Schedule ADD INDEX idx_schedule_start (Start_Time, Schedule_ID)',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+-- 6) 后台场次列表（员工按 DM 分域）
+SET @idx_exists := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'T_Schedule' AND INDEX_NAME = 'idx_schedule_dm_start'
+);
+SET @sql := IF(@idx_exists = 0,
+  'ALTER TABLE T_Schedule ADD INDEX idx_schedule_dm_start (DM_ID, Start_Time, Schedule_ID)',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+SELECT 'OK: keyset pagination indexes ready' AS Status;
@@ -0,0 +1,97 @@
+/*==============================================================
+  008_schedule_occupancy_counters.sql
+  作用：T_Schedule 增加占用计数列 Booked_Count / Locked_Count，列表/看板/容量校验直接读计数
+
+  背景：
+  - 场次列表、看板上座率、fn_schedule_occupied、下单/锁位的容量校验原来都对每个场次执行
+        (SELECT COUNT(*) FROM T_Order ...) + (SELECT COUNT(*) FROM t_lock_record ...)
+    场次越多、历史订单越多越慢
+  - 计数由后端在同一事务内维护（锁住场次行后再改订单/锁位状态，按实际影响行数加减）：
+        Booked_Count = Pay_Status IN (0, 1) 的订单数
+        Locked_Count = Status = 0 的锁位数（过期锁位被改为 Status = 3 时减掉）
+  - 漂移（绕过后端直接改库等）由 tools/reconcile_occupancy.py 修复
+
+  特性：
+  - 兼容 MySQL 5.7（列已存在则跳过）
+  - 可重复执行（回填语句按明细重新统计）
+==============================================================*/
+
+SET NAMES utf8mb4;
+
+-- 1) 计数列
+SET @col_exists := (
+  SELECT COUNT(*) FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'T_Schedule' AND COLUMN_NAME = 'Booked_Count'
+);
+SET @sql := IF(@col_exists = 0,
+  'ALTER TABLE T_Schedule ADD COLUMN Booked_Count INT NOT NULL DEFAULT 0 COMMENT ''有效订单数（Pay_Status IN (0, 1)）''',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+SET @col_exists := (
+  SELECT COUNT(*) FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'T_Schedule' AND COLUMN_NAME = 'Locked_Count'
+);
+SET @sql := IF(@col_exists = 0,
+  'ALTER TABLE T_Schedule ADD COLUMN Locked_Count INT NOT NULL DEFAULT 0 COMMENT ''锁定中的锁位数（Status = 0）''',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+-- 2) 回填：先把已过期的锁位标记为过期，再按明细统计
+UPDATE t_lock_record SET Status = 3 WHERE Status = 0 AND ExpireTime <= NOW();
+
+UPDATE T_Schedule sch
+LEFT JOIN (
+  SELECT Schedule_ID, COUNT(*) AS cnt FROM T_Order WHERE Pay_Status IN (0, 1) GROUP BY Schedule_ID
+) o ON o.Schedule_ID = sch.Schedule_ID
+LEFT JOIN (
+  SELECT Schedule_ID, COUNT(*) AS cnt FROM t_lock_record WHERE Status = 0 GROUP BY Schedule_ID
+) l ON l.Schedule_ID = sch.Schedule_ID
+SET sch.Booked_Count = COALESCE(o.cnt, 0),
+    sch.Locked_Count = COALESCE(l.cnt, 0);
+
+SELECT 'OK: T_Schedule occupancy counters ready' AS Status;
+
+-- 3) 锁位过期事件：改锁位状态的同时扣减 Locked_Count（替换 init_complete_system.sql 中的版本）
+--    与后端一致先锁场次行，同一事务内按同一个截止时间统计并改状态；需要 event_scheduler=ON
+DROP EVENT IF EXISTS evt_expire_locks;
+
+DELIMITER $$
+CREATE EVENT evt_expire_locks
+ON SCHEDULE EVERY 1 MINUTE
+STARTS CURRENT_TIMESTAMP
+DO
+BEGIN
+  DECLARE v_now DATETIME DEFAULT NOW();
+  START TRANSACTION;
+  UPDATE T_Schedule sch
+  JOIN (
+    SELECT Schedule_ID, COUNT(*) AS cnt FROM t_lock_record
+    WHERE Status = 0 AND ExpireTime <= v_now
+    GROUP BY Schedule_ID
+  ) e ON e.Schedule_ID = sch.Schedule_ID
+  SET sch.Locked_Count = sch.Locked_Count - e.cnt;
+
+  UPDATE t_lock_record SET Status = 3 WHERE Status = 0 AND ExpireTime <= v_now;
+  COMMIT;
+END$$
+DELIMITER ;
+
+-- 4) fn_schedule_occupied 改为读计数列
+DROP FUNCTION IF EXISTS fn_schedule_occupied;
+DELIMITER $$
+CREATE FUNCTION fn_schedule_occupied(p_schedule_id BIGINT)
+RETURNS INT
+READS SQL DATA
+BEGIN
+  DECLARE occupied INT DEFAULT 0;
+  SELECT Booked_Count + Locked_Count INTO occupied
+  FROM T_Schedule
+  WHERE Schedule_ID = p_schedule_id;
+  RETURN occupied;
+END$$
+DELIMITER ;
+
+SELECT 'OK: evt_expire_locks / fn_schedule_occupied now maintain/read counters' AS Status;
@@ -0,0 +1,43 @@
+/*==============================================================
+  009_id_sequences.sql
+  作用：新增序列表 T_Sequence，锁位/玩家/场次/流水 ID 改由后端按号段分配（id_allocator.py）
+
+  背景：
+  - 原来插入前执行 SELECT IFNULL(MAX(LockID), 7000) + 1 / MAX(Player_ID) + 1 取新 ID：
+    每次插入多一次索引探测，并发时两个事务读到同一个 MAX，后提交的主键冲突
+  - 新方式：每个进程一次把 Next_Value 加上号段大小（一个极短的独立事务），之后在内存中逐个发放
+  - 未用完的号段在进程退出后作废，ID 可能不连续，但不会重复
+
+  特性：
+  - 可重复执行：Next_Value 取 当前值 与 MAX(主键)+1 中的较大者
+  - 演示数据脚本等直接按主键插入数据后，重新执行本脚本即可把序列推到最大值之后
+  - 序列行不存在时后端首次取号也会按 MAX(主键)+1 自动补齐
+==============================================================*/
+
+SET NAMES utf8mb4;
+
+-- 1) 序列表
+CREATE TABLE IF NOT EXISTS T_Sequence (
+    Seq_Name VARCHAR(32) NOT NULL COMMENT '序列名（lock/player/schedule/transaction）',
+    Next_Value BIGINT NOT NULL COMMENT '下一个未分配的 ID',
+    PRIMARY KEY (Seq_Name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='ID 号段分配';
+
+-- 2) 按现有数据初始化（起始值与 database_config.py 的 ID_ALLOCATOR_CONFIG 一致）
+INSERT INTO T_Sequence (Seq_Name, Next_Value)
+SELECT 'lock', IFNULL(MAX(LockID), 7000) + 1 FROM t_lock_record
+ON DUPLICATE KEY UPDATE Next_Value = GREATEST(Next_Value, VALUES(Next_Value));
+
+INSERT INTO T_Sequence (Seq_Name, Next_Value)
+SELECT 'player', IFNULL(MAX(Player_ID), 3000) + 1 FROM T_Player
+ON DUPLICATE KEY UPDATE Next_Value = GREATEST(Next_Value, VALUES(Next_Value));
+
+INSERT INTO T_Sequence (Seq_Name, Next_Value)
+SELECT 'schedule', IFNULL(MAX(Schedule_ID), 4000) + 1 FROM T_Schedule
+ON DUPLICATE KEY UPDATE Next_Value = GREATEST(Next_Value, VALUES(Next_Value));
+
+INSERT INTO T_Sequence (Seq_Name, Next_Value)
+SELECT 'transaction', IFNULL(MAX(Trans_ID), 9000) + 1 FROM T_Transaction
+ON DUPLICATE KEY UPDATE Next_Value = GREATEST(Next_Value, VALUES(Next_Value));
+
+SELECT Seq_Name, Next_Value FROM T_Sequence;
@@ -0,0 +1,31 @@
+/*==============================================================
+  010_schedule_waitlist.sql
+  作用：新增场次候补队列表 T_Waitlist
+
+  背景：
+  - 场次已满时玩家只能收到“该场次已满”，然后反复刷新场次列表（最重的查询之一）等名额
+  - 候补后按加入顺序排队：锁位过期、取消锁位、取消订单空出名额时，后端自动为排在最前面的候补玩家创建锁位
+  - Wait_ID 为按时间递增的 ID（snowflake.py），排队顺序即 Wait_ID 顺序；
+    排名 = 同场次 Status = 0 且 Wait_ID <= 自己的条数，走 idx_waitlist_queue 索引范围计数
+
+  状态：0 候补中，1 已获得名额（Lock_ID 为自动创建的锁位，直接锁位/下单时为空），2 已取消，3 已失效（场次已开始/取消）
+
+  特性：可重复执行（表已存在则跳过）
+==============================================================*/
+
+SET NAMES utf8mb4;
+
+CREATE TABLE IF NOT EXISTS T_Waitlist (
+    Wait_ID BIGINT NOT NULL COMMENT '候补ID（按加入时间递增）',
+    Schedule_ID BIGINT NOT NULL COMMENT '场次ID',
+    Player_ID BIGINT NOT NULL COMMENT '玩家ID',
+    Status TINYINT NOT NULL DEFAULT 0 COMMENT '0候补中 1已获得名额 2已取消 3已失效',
+    Join_Time DATETIME NOT NULL COMMENT '加入时间',
+    Promote_Time DATETIME NULL COMMENT '获得名额时间',
+    Lock_ID BIGINT NULL COMMENT '自动创建的锁位ID',
+    PRIMARY KEY (Wait_ID),
+    INDEX idx_waitlist_queue (Schedule_ID, Status, Wait_ID),
+    INDEX idx_waitlist_player (Player_ID, Status, Wait_ID)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='场次候补队列';
+
+SELECT 'OK: T_Waitlist ready' AS Status;
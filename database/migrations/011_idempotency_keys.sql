@@ -0,0 +1,31 @@
+/*==============================================================
+  011_idempotency_keys.sql
+  作用：新增幂等键表 T_Idempotency_Key（POST /api/orders、/api/orders/<id>/pay 的 Idempotency-Key）
+
+  背景：
+  - 移动端在网络不稳定时会重试下单/支付，每次重试都会完整执行一遍下单/支付流程
+  - 带 Idempotency-Key 请求头时，第一次请求开始前占用该键（Status = 0），成功后在同一个业务事务内写入响应（Status = 1）；
+    同一用户用同一个键重试时直接返回保存的响应，不再访问订单/场次/流水表
+  - 进程内缓存（idempotency.py）是第一层，本表让重试落到其它进程或进程重启后仍能命中
+  - Expire_Time 之后记录作废（由应用按 idx_idem_expire 定期删除）；Status = 0 且 Lock_Until 已过的记录视为处理者已失联，可被接管
+
+  特性：可重复执行（表已存在则跳过）
+==============================================================*/
+
+SET NAMES utf8mb4;
+
+CREATE TABLE IF NOT EXISTS T_Idempotency_Key (
+    User_ID BIGINT NOT NULL COMMENT '用户ID（键按用户隔离）',
+    Idem_Key VARCHAR(128) NOT NULL COMMENT '客户端生成的幂等键',
+    Request_Hash CHAR(64) NOT NULL COMMENT '请求指纹（方法 + 路径 + 请求体的 SHA-256）',
+    Status TINYINT NOT NULL DEFAULT 0 COMMENT '0处理中 1已完成',
+    Response_Code SMALLINT NULL COMMENT '响应状态码',
+    Response_Body TEXT NULL COMMENT '响应体（JSON）',
+    Create_Time DATETIME NOT NULL COMMENT '创建时间',
+    Lock_Until DATETIME NOT NULL COMMENT '处理中状态的占用截止时间',
+    Expire_Time DATETIME NOT NULL COMMENT '记录过期时间',
+    PRIMARY KEY (User_ID, Idem_Key),
+    INDEX idx_idem_expire (Expire_Time)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='接口幂等键';
+
+SELECT 'OK: T_Idempotency_Key ready' AS Status;
@@ -0,0 +1,80 @@
+/*==============================================================
+  012_schedule_next_lock_expire.sql
+  作用：T_Schedule 增加 Next_Lock_Expire（本场次锁定中锁位的最早到期时间），
+        与 Booked_Count / Locked_Count 一起组成场次余位投影，玩家场次列表和后台场次列表只读 T_Schedule
+
+  背景：
+  - 迁移 008 之后余位已经按计数列读取，Next_Lock_Expire 补上“已满的场次最早什么时候可能空出名额”
+  - 后端在改锁位的同一事务内维护（ScheduleModel.adjust_counts：锁位数有增减时按剩余锁位重新取 MIN(ExpireTime)），
+    idx_lock_schedule_expire 让这次重新计算以及“该玩家在本场次的锁位”点查都只读索引
+  - 漂移由 tools/reconcile_occupancy.py 检查/修复，--rebuild 按明细整体重建
+
+  特性：
+  - 兼容 MySQL 5.7（列/索引已存在则跳过）
+  - 可重复执行（回填语句按明细重新统计）
+==============================================================*/
+
+SET NAMES utf8mb4;
+
+-- 1) 最早到期时间列
+SET @col_exists := (
+  SELECT COUNT(*) FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'T_Schedule' AND COLUMN_NAME = 'Next_Lock_Expire'
+);
+SET @sql := IF(@col_exists = 0,
+  'ALTER TABLE T_Schedule ADD COLUMN Next_Lock_Expire DATETIME NULL COMMENT ''锁定中锁位的最早到期时间（没有锁位为 NULL）''',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+-- 2) 锁位按场次 + 状态 + 到期时间的索引
+SET @idx_exists := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 't_lock_record' AND INDEX_NAME = 'idx_lock_schedule_expire'
+);
+SET @sql := IF(@idx_exists = 0,
+  'ALTER TABLE t_lock_record ADD INDEX idx_lock_schedule_expire (Schedule_ID, Status, ExpireTime)',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+-- 3) 回填
+UPDATE T_Schedule sch
+LEFT JOIN (
+  SELECT Schedule_ID, MIN(ExpireTime) AS next_expire FROM t_lock_record WHERE Status = 0 GROUP BY Schedule_ID
+) l ON l.Schedule_ID = sch.Schedule_ID
+SET sch.Next_Lock_Expire = l.next_expire;
+
+SELECT 'OK: T_Schedule.Next_Lock_Expire ready' AS Status;
+
+-- 4) 锁位过期事件：过期后同时重新计算最早到期时间（替换迁移 008 中的版本）；需要 event_scheduler=ON
+DROP EVENT IF EXISTS evt_expire_locks;
+
+DELIMITER $$
+CREATE EVENT evt_expire_locks
+ON SCHEDULE EVERY 1 MINUTE
+STARTS CURRENT_TIMESTAMP
+DO
+BEGIN
+  DECLARE v_now DATETIME DEFAULT NOW();
+  START TRANSACTION;
+  UPDATE T_Schedule sch
+  JOIN (
+    SELECT Schedule_ID, COUNT(*) AS cnt FROM t_lock_record
+    WHERE Status = 0 AND ExpireTime <= v_now
+    GROUP BY Schedule_ID
+  ) e ON e.Schedule_ID = sch.Schedule_ID
+  SET sch.Locked_Count = sch.Locked_Count - e.cnt;
+
+  UPDATE t_lock_record SET Status = 3 WHERE Status = 0 AND ExpireTime <= v_now;
+
+  UPDATE T_Schedule sch
+  SET sch.Next_Lock_Expire = (
+    SELECT MIN(l.ExpireTime) FROM t_lock_record l WHERE l.Schedule_ID = sch.Schedule_ID AND l.Status = 0
+  )
+  WHERE sch.Next_Lock_Expire <= v_now;
+  COMMIT;
+END$$
+DELIMITER ;
+
+SELECT 'OK: evt_expire_locks now maintains Next_Lock_Expire' AS Status;
@@ -0,0 +1,37 @@
+/*==============================================================
+  013_report_range_indexes.sql
+  作用：为报表/场次列表的日期范围筛选补齐复合索引
+
+  背景：
+  - 报表与后台场次列表的日期筛选已从 DATE(列) / YEARWEEK / DATE_FORMAT 改为原始列上的半开区间：
+        列 >= '开始日期 00:00:00' AND 列 < '结束日期次日 00:00:00'（date_range.range_condition）
+    条件不再对列套函数，可以走索引范围扫描
+  - 仪表盘营收按 (Trans_Type, Result, Trans_Time) 定位“支付成功”的交易后按时间范围扫描
+  - 热门剧本/房间利用率/DM 业绩按场次关联订单，走已有的外键索引 T_Order(Schedule_ID) 即可；
+    汇总还要读 Amount/Create_Time 等列，(Schedule_ID, Pay_Status) 之类的窄索引做不到只读索引，不再额外添加
+  - 已有索引（无需重复添加）：
+        T_Schedule  idx_schedule_dm_start (DM_ID, Start_Time, Schedule_ID)  DM 分域 + 开场时间（迁移 007）
+        T_Schedule  idx_schedule_start (Start_Time, Schedule_ID)            开场时间（迁移 007）
+        T_Order     idx_order_create_time (Create_Time, Order_ID)           下单时间（迁移 007）
+        t_lock_record idx_lock_time (LockTime, LockID)                      锁位时间（迁移 007）
+  - 各报表的执行计划可用 tools/explain_reports.py 检查
+
+  特性：
+  - 兼容 MySQL 5.7（索引已存在则跳过）
+  - 可重复执行
+==============================================================*/
+
+SET NAMES utf8mb4;
+
+-- 1) 支付成功交易按时间范围统计（仪表盘今日/本周/本月营收）
+SET @idx_exists := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'T_Transaction' AND INDEX_NAME = 'idx_trans_type_result_time'
+);
+SET @sql := IF(@idx_exists = 0,
+  'ALTER TABLE T_Transaction ADD INDEX idx_trans_type_result_time (Trans_Type, Result, Trans_Time)',
+  'SELECT 1'
+);
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+SELECT 'OK: report range indexes ready' AS Status;
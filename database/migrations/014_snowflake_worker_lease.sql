@@ -0,0 +1,32 @@
+/*==============================================================
+  014_snowflake_worker_lease.sql
+  作用：新增 T_Snowflake_Worker，后端进程启动时租用一个不重复的 Snowflake worker 号（snowflake.py）；
+        移除不再使用的 'transaction' 序列
+
+  背景：
+  - 订单号/交易流水号由 snowflake.py 在进程内生成，worker 号（0 ~ 31）相同的两个进程同一毫秒内会生成相同的 ID
+  - 未显式配置 worker 号时，进程在本表中租用一个空闲或租约已过期的 worker 号，后台线程定期续约，
+    正常退出时释放；进程异常退出后租约到期（SNOWFLAKE_CONFIG['lease_seconds']）即可被其它进程接管
+  - 交易流水号改由 snowflake.py 生成后，迁移 009 初始化的 'transaction' 序列不再使用
+    （重新执行 009 会再次插入该行，无影响）
+
+  特性：
+  - 可重复执行
+==============================================================*/
+
+SET NAMES utf8mb4;
+
+-- 1) worker 号租约表（行在首次租用时插入）
+CREATE TABLE IF NOT EXISTS T_Snowflake_Worker (
+    Worker_ID INT NOT NULL COMMENT 'Snowflake worker 号（0 ~ 31）',
+    Owner VARCHAR(128) NOT NULL COMMENT '持有者（主机名:进程号:随机串）',
+    Lease_Expire DATETIME NOT NULL COMMENT '租约到期时间，到期后可被其它进程租用',
+    PRIMARY KEY (Worker_ID)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='Snowflake worker 号租约';
+
+-- 2) 交易流水号不再按号段分配
+DELETE FROM T_Sequence WHERE Seq_Name = 'transaction';
+
+ALTER TABLE T_Sequence MODIFY COLUMN Seq_Name VARCHAR(32) NOT NULL COMMENT '序列名（lock/player/schedule）';
+
+SELECT Worker_ID, Owner, Lease_Expire FROM T_Snowflake_Worker;
@@ -13,10 +13,148 @@ DB_CONFIG = {
     'charset': 'utf8mb4'      # 字符集
 }
 
+# 数据库后端：'mysql'（默认）或 'sqlite'（嵌入式，无需 MySQL 服务器，用于基准测试/本地验证）
+DB_BACKEND = 'mysql'
+
+SQLITE_CONFIG = {
+    'path': 'murder_mystery.sqlite3',   # 数据库文件路径（首次使用前需 SQLiteBackend.create_schema() 建表）
+    'busy_timeout': 5                   # 等待写锁的秒数，超时按锁等待超时处理（会触发冲突重试）
+}
+
+# 只读副本配置（读写分离）：报表/列表等只读查询可路由到副本，为空时全部走主库
+# 示例：{'host': '127.0.0.1', 'port': 3307, 'user': 'root', 'password': '123456',
+#        'database': '剧本杀店务管理系统', 'charset': 'utf8mb4'}
+DB_REPLICAS = []
+
+REPLICA_CONFIG = {
+    'max_lag_seconds': 5,            # 副本复制延迟超过该值（或复制中断）时不再路由读请求
+    'lag_check_interval': 5,         # 复制延迟检测间隔（秒）
+    'read_your_writes_window': 10    # 调用方写入后该时间内的读请求固定走主库（秒），保证读到自己的写入
+}
+
 # 数据库连接池配置
 POOL_CONFIG = {
     'pool_size': 5,           # 连接池大小
     'max_overflow': 10,       # 最大溢出连接数
     'pool_timeout': 30,       # 连接超时时间（秒）
-    'pool_recycle': 3600      # 连接回收时间（秒）
+    'pool_recycle': 3600,     # 连接回收时间（秒）
+    'pre_ping': True,         # 借出连接前先 ping，剔除已被服务端断开的连接
+    'nested_overflow': 5      # 已持有连接的请求在事务外再借独立连接（取 ID 号段、加载座位库存）时额外允许的连接数
+}
+
+# 异步访问层（asgi.py）配置：阻塞的 pymysql 调用在有界线程池中执行
+ASYNC_CONFIG = {
+    'max_workers': None,      # 数据库线程数，None 表示与连接池容量一致（pool_size + max_overflow）
+    'max_waiting': 2000       # 等待数据库线程的请求上限，超出直接返回 503
+}
+
+# 死锁/锁等待超时自动重试配置（抢购高峰时 InnoDB 报 1213/1205，整体重做一次业务操作通常即可成功）
+RETRY_CONFIG = {
+    'max_attempts': 4,                  # 最多执行次数（含第一次）
+    'base_delay_ms': 20,                # 退避基数（毫秒），第 n 次重试前最多等待 base * 2^n
+    'max_delay_ms': 500,                # 单次退避上限（毫秒）
+    'retryable_errors': (1213, 1205),   # 1213 死锁，1205 锁等待超时
+    'lock_wait_timeout': 3              # 行锁等待上限（秒，innodb_lock_wait_timeout），默认 50 秒会让抢位请求长时间挂起
+}
+
+# 列表接口分页配置（键集分页：按 (排序列, 主键) 定位下一页，翻页耗时与历史数据量无关）
+PAGINATION_CONFIG = {
+    'default_page_size': 50,  # 传了 cursor 但没传 limit 时的每页条数
+    'max_page_size': 200      # 每页条数上限
+}
+
+# 查询结果缓存（读多写少的查询声明依赖的表，写入这些表并提交后自动失效）
+QUERY_CACHE_CONFIG = {
+    'enabled': True,
+    'backend': 'memory',                   # memory：进程内；sqlite：本机多 worker 进程共享（shared_path）
+    'shared_path': 'query_cache.sqlite3',  # sqlite 后端的缓存文件
+    'max_entries': 2000,                   # 最多缓存的结果数（LRU 淘汰）
+    'default_ttl': 60,                     # 默认缓存秒数（兜底：绕过本应用的写入最迟在 TTL 后可见）
+    'replica_fill_delay': 5                # 依赖的表写入后该时间内，缓存未命中改读主库（与副本最大延迟一致）
+}
+
+# 进程内座位库存（热门场次的锁位/下单准入在内存中判断，“已满/重复”直接拒绝，不再访问数据库）
+SEAT_INVENTORY_CONFIG = {
+    'enabled': True,
+    'warm_on_start': True,      # 启动时加载所有未开始场次（否则在第一次访问某场次时加载）
+    'trust_seconds': 2,         # 场次快照加载后该时间内，内存中的“已满/重复”结论直接返回；
+                                # 更旧时先重新加载该场次（多 worker 部署时其它进程释放的名额最迟这么久后可见）
+    'max_schedules': 5000       # 内存中最多保留的场次数（按最近访问淘汰）
+}
+
+# 锁位过期调度器（lock_expiry.py）：后台线程按 ExpireTime 排队，到期后立即过期锁位，不依赖 MySQL event_scheduler
+LOCK_EXPIRY_CONFIG = {
+    'enabled': True,
+    'resync_seconds': 30,       # 每隔该秒数从数据库重新加载待过期锁位（其它进程创建的锁位）并补扫已超时的锁位
+    'max_batch': 500,           # 每轮最多处理的到期锁位数
+    'lag_samples': 1024         # 保留的最近过期延迟样本数（用于 p50/p95）
+}
+
+# 场次候补：空出名额（锁位过期/取消锁位/取消订单）后按加入顺序自动为候补玩家锁位（waitlist_promoter.py）
+WAITLIST_CONFIG = {
+    'enabled': True,
+    'batch_size': 20,           # 单个场次一个事务最多提升的候补人数
+    'lock_minutes': 15,         # 自动创建的锁位有效期（分钟），与直接锁位一致
+    'resync_seconds': 30,       # 每隔该秒数补扫有候补且有空位的场次（其它进程释放的名额、漏掉的事件）
+    'lag_samples': 1024         # 保留的最近提升延迟样本数（名额释放到候补锁位提交，用于 p50/p95）
+}
+
+# 幂等键（Idempotency-Key 请求头，下单/支付）：进程内缓存 + T_Idempotency_Key 表（idempotency.py）
+IDEMPOTENCY_CONFIG = {
+    'enabled': True,
+    'persist': True,            # 同时写入 T_Idempotency_Key（多进程/重启后仍能命中）；False 时只在进程内去重
+    'ttl_seconds': 86400,       # 成功响应保留时长（超过后同一个键视为新请求）
+    'lock_seconds': 60,         # 处理中的键被占用的最长时间（处理者异常退出后可被接管）
+    'max_entries': 10000,       # 进程内最多缓存的键数（超出时淘汰最久未用的）
+    'max_key_length': 128,
+    'cleanup_every': 500        # 每占用该数量的键，顺带删除一次表中已过期的记录
+}
+
+# 锁位/下单争用统计（contention_stats.py）：尝试/拒绝次数、等待场次行锁耗时、滑动窗口内最热场次
+CONTENTION_CONFIG = {
+    'enabled': True,
+    'bucket_seconds': 10,           # 按场次计数的时间桶宽度（秒），窗口统计按桶合并
+    'windows': (60, 300, 900),      # 热点场次的滑动窗口（秒），最长的窗口决定保留多少个桶
+    'top_n': 10,                    # 每个窗口返回的最热场次数
+    'sample_size': 2048,            # 每类操作保留的最近耗时样本数（用于 p50/p95/p99）
+    'log_interval': 60              # 每隔该秒数写一条争用摘要日志（期间没有锁位/下单时不写），0 表示不写
+}
+
+# ID 号段分配（hi/lo，替代 SELECT MAX(id) + 1）：每个进程一次从 T_Sequence 取一段 ID，在内存中逐个发放
+ID_ALLOCATOR_CONFIG = {
+    'block_size': 100,          # 每次取的号段大小（进程退出时未用完的部分作废，ID 不连续但不会重复）
+    'sequences': {
+        # 序列名: (表, 主键列, 表为空时从该值 + 1 开始)
+        'lock': ('t_lock_record', 'LockID', 7000),
+        'player': ('T_Player', 'Player_ID', 3000),
+        'schedule': ('T_Schedule', 'Schedule_ID', 4000),
+    }
+}
+
+# 订单号/交易流水号（snowflake.py：53 位按时间递增，进程内生成；只在确定 worker 号时访问数据库）
+SNOWFLAKE_CONFIG = {
+    'worker_id': None,          # 0 ~ 31，同时写库的每个进程各不相同；None 时读环境变量 SNOWFLAKE_WORKER_ID，
+                                # 仍没有时从 T_Snowflake_Worker 租用一个未被占用的 worker 号（迁移 014）
+    'lease_seconds': 60         # 租约时长（秒）：每 1/3 时长续约一次，进程异常退出后该号最迟这么久后可被其它进程租用
+}
+
+# SQL 执行统计与慢查询日志配置
+QUERY_STATS_CONFIG = {
+    'enabled': True,                    # 是否统计每类语句的耗时
+    'slow_query_ms': 200,               # 慢查询阈值（毫秒），超过即写慢查询日志
+    'sample_size': 1024,                # 每类语句保留的最近耗时样本数（用于计算 p50/p95/p99）
+    'max_fingerprints': 500,            # 最多统计的语句种类，超出后新语句不再单独统计
+    'slow_log_file': 'slow_query.log'   # 慢查询日志文件（每行一条 JSON），为空则只写普通日志
+}
+
+# 请求链路追踪（tracing.py）：路由 → 模型方法 → SQL 的调用树，内存保留最近若干个，慢 trace 导出到 JSONL 文件
+TRACING_CONFIG = {
+    'enabled': True,
+    'sample_rate': 0.1,                 # 采样率（0~1）：只有被采样的请求才记录 span 并可能导出
+    'buffer_size': 200,                 # 内存中保留的最近 trace 数（管理端查看）
+    'max_spans': 1000,                  # 单个 trace 最多记录的 span 数，超出只计数
+    'export_file': 'traces.jsonl',      # 导出文件（每行一个 trace），为空则不导出
+    'export_min_ms': 200,               # 只导出耗时不低于该值（毫秒）的 trace
+    'export_max_bytes': 20 * 1024 * 1024,   # 导出文件超过该大小时轮转为 <文件>.1（只保留一份旧文件）
+    'trace_id_pattern': r'[0-9a-f]{16,32}'  # 请求头 X-Trace-ID 须完整匹配（小写十六进制），否则生成新的 trace ID
 }
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+日期范围条件：按日期筛选改写为原始列上的半开区间 [start, end)
+
+    DATE(o.Create_Time) >= '2025-12-01' AND DATE(o.Create_Time) <= '2025-12-31'
+ => o.Create_Time >= '2025-12-01 00:00:00' AND o.Create_Time < '2026-01-01 00:00:00'
+
+对列套 DATE()/YEARWEEK()/DATE_FORMAT() 后 MySQL 只能逐行计算再比较，列上的索引用不上；
+改成原始列上的区间后是一次索引范围扫描，筛选结果与原写法相同（当天带小数秒的时间也包含在内）。
+"""
+
+from datetime import date, datetime, timedelta
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def parse_date(value, label='日期'):
+    """
+    解析日期参数：接受 date/datetime 对象或 'YYYY-MM-DD' 字符串；为空返回 None，格式错误抛出 ValueError
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value).strip(), DATE_FORMAT).date()
+    except ValueError:
+        raise ValueError(f"{label}格式错误，应为YYYY-MM-DD") from None
+
+
+def day_range(start_date=None, end_date=None):
+    """
+    起止日期（都包含在内）-> (start, end)：start 为开始日期 00:00:00，end 为结束日期次日 00:00:00（不包含）
+
+    未传的一端返回 None
+    """
+    start = parse_date(start_date, '开始日期')
+    end = parse_date(end_date, '结束日期')
+    return (
+        datetime.combine(start, datetime.min.time()) if start else None,
+        datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None,
+    )
+
+
+def range_condition(column, start_date=None, end_date=None):
+    """
+    生成 WHERE 子句片段：column 在 [开始日期 00:00, 结束日期次日 00:00) 内
+
+    Args:
+        column: 原始时间列（如 o.Create_Time），不要套函数
+        start_date, end_date: 起止日期（包含），未传的一端不限制
+
+    Returns:
+        (sql, params)：sql 以 " AND " 开头，可直接拼在已有 WHERE 之后；没有条件时为 ('', [])
+    """
+    start, end = day_range(start_date, end_date)
+    sql, params = '', []
+    if start is not None:
+        sql += f" AND {column} >= %s"
+        params.append(start)
+    if end is not None:
+        sql += f" AND {column} < %s"
+        params.append(end)
+    return sql, params
+
+
+def period_range(period, today=None):
+    """
+    自然周期 -> (start, end) 半开区间
+
+    Args:
+        period: 'day' 当天；'week' 本周（周一开始，与 YEARWEEK(x, 1) 一致）；'month' 本月
+        today: 参照日期，默认今天
+    """
+    today = parse_date(today) or date.today()
+    if period == 'day':
+        start, end = today, today + timedelta(days=1)
+    elif period == 'week':
+        start = today - timedelta(days=today.weekday())
+        end = start + timedelta(days=7)
+    elif period == 'month':
+        start = today.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+    else:
+        raise ValueError(f"未知的统计周期: {period}")
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
@@ -0,0 +1,546 @@
+# -*- coding: utf-8 -*-
+"""
+数据库后端 - 连接池通过后端对象创建连接，模型层 SQL 不需要改动
+
+- MySQLBackend：默认后端（pymysql）
+- SQLiteBackend：嵌入式后端，用于没有 MySQL 服务器时跑基准测试/本地验证；
+  负责把模型里用到的少量 MySQL 语法翻译成 SQLite 语法，并从设计文档的建表脚本生成表结构
+
+SQLite 后端抛出的异常统一转换成 pymysql 的异常类型（锁冲突 -> 1205），
+数据库层的错误处理（连接丢弃、冲突重试）无需区分后端。
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+import logging
+import re
+import sqlite3
+
+import pymysql
+from pymysql.cursors import Cursor, DictCursor, SSCursor, SSDictCursor
+
+from database_config import RETRY_CONFIG
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+
+# 生成 SQLite 表结构的来源（按顺序执行，同名表以后出现的定义为准）
+SCHEMA_SOURCES = [
+    PROJECT_ROOT / 'docs' / 'design' / 'exports' / 'crebas2.sql',
+    PROJECT_ROOT / 'database' / 'migrations',
+]
+
+# 迁移脚本中通过 PREPARE 动态执行、无法直接解析的结构变更
+_EXTRA_DDL = [
+    # 001_add_auth.sql：按 information_schema 判断后动态添加
+    "ALTER TABLE T_Script ADD COLUMN Cover_Image VARCHAR(255) DEFAULT 'default.jpg'",
+    # 员工账号表：AuthModel 登录时先查该表，MySQL 上由部署环境提供，建表/迁移脚本中没有它的定义
+    """CREATE TABLE IF NOT EXISTS T_Staff_Account (
+        Staff_ID INTEGER NOT NULL PRIMARY KEY,
+        Username VARCHAR(50) NOT NULL UNIQUE,
+        Phone VARCHAR(20),
+        Password VARCHAR(255) NOT NULL,
+        Real_Name VARCHAR(50),
+        Role VARCHAR(20) NOT NULL DEFAULT 'staff',
+        Status INT NOT NULL DEFAULT 1,
+        Last_Login DATETIME
+    )""",
+]
+
+
+class MySQLBackend:
+    """MySQL 后端（pymysql）"""
+
+    name = 'mysql'
+
+    def connect(self, db_config):
+        return pymysql.connect(
+            host=db_config['host'],
+            port=db_config['port'],
+            user=db_config['user'],
+            password=db_config['password'],
+            database=db_config['database'],
+            charset=db_config['charset'],
+            cursorclass=DictCursor,  # 返回字典格式结果
+            autocommit=False,  # 手动控制事务
+            # 行锁等待上限：抢同一场次时排队不超过该秒数，超时报 1205 由 retry_on_conflict 重试
+            init_command=f"SET SESSION innodb_lock_wait_timeout = {int(RETRY_CONFIG['lock_wait_timeout'])}"
+        )
+
+    def stream_cursor(self, connection, compact=False):
+        """无缓冲的服务端游标（compact=True 时每行返回元组）"""
+        return connection.cursor(SSCursor if compact else SSDictCursor)
+
+    def compact_cursor(self, connection):
+        """每行返回元组的游标"""
+        return connection.cursor(Cursor)
+
+
+class SQLiteBackend:
+    """
+    SQLite 后端
+
+    Args:
+        path: 数据库文件路径（多条连接共享同一个文件，不支持 :memory:）
+        busy_timeout: 等待其它连接释放写锁的秒数，超时按锁等待超时（1205）处理
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, busy_timeout=5):
+        if path == ':memory:':
+            raise ValueError("SQLite 后端需要数据库文件路径（连接池中的多条连接要共享数据）")
+        self.path = str(path)
+        self.busy_timeout = busy_timeout
+
+    def connect(self, db_config=None):
+        return SQLiteConnection(self.path, self.busy_timeout)
+
+    def stream_cursor(self, connection, compact=False):
+        # sqlite3 游标本身按需逐行读取
+        return connection.cursor(tuples=compact)
+
+    def compact_cursor(self, connection):
+        return connection.cursor(tuples=True)
+
+    def create_schema(self, sources=None):
+        """按建表脚本和迁移脚本创建表结构（已存在的表跳过）"""
+        statements = build_sqlite_schema(sources or SCHEMA_SOURCES)
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for sql in statements:
+                try:
+                    connection.execute(sql)
+                except sqlite3.OperationalError as e:
+                    # 重复执行时 ADD COLUMN 会报列已存在
+                    if 'duplicate column' not in str(e):
+                        raise
+        finally:
+            connection.close()
+        logger.info(f"SQLite 表结构已创建: {self.path}（{len(statements)} 条语句）")
+
+
+# ==================== SQL 翻译 ====================
+
+_PLACEHOLDER = re.compile(r"%%|%s")
+_INTERVAL_UNITS = {
+    'SECOND': 'seconds', 'MINUTE': 'minutes', 'HOUR': 'hours',
+    'DAY': 'days', 'MONTH': 'months', 'YEAR': 'years',
+}
+_DATE_ARITH = re.compile(
+    r"DATE_(ADD|SUB)\(\s*((?:[^(),]|\([^()]*\))+?)\s*,\s*INTERVAL\s+([^\s()]+)\s+"
+    r"(SECOND|MINUTE|HOUR|DAY|MONTH|YEAR)\s*\)",
+    re.IGNORECASE
+)
+_LOCKING_READ = re.compile(r"\s+(?:FOR\s+UPDATE|LOCK\s+IN\s+SHARE\s+MODE)\b", re.IGNORECASE)
+_FOR_UPDATE = re.compile(r"\bFOR\s+UPDATE\b", re.IGNORECASE)
+_INSERT_IGNORE = re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE)
+
+
+def _date_arith(match):
+    op, expr, amount, unit = match.groups()
+    sign = '-' if op.upper() == 'SUB' else ''
+    return f"DATETIME({expr}, ({sign}({amount})) || ' {_INTERVAL_UNITS[unit.upper()]}')"
+
+
+@lru_cache(maxsize=2048)
+def translate_sql(sql):
+    """
+    把模型中的 MySQL 语句翻译成 SQLite 语句
+
+    - %s 占位符 -> ?，%% -> %
+    - DATE_ADD/DATE_SUB(expr, INTERVAL n UNIT) -> DATETIME(expr, 'n unit')
+    - INSERT IGNORE -> INSERT OR IGNORE；去掉 FOR UPDATE / LOCK IN SHARE MODE
+      （SQLite 写事务本身串行，FOR UPDATE 由游标改为以 BEGIN IMMEDIATE 开启事务）
+    - NOW/CURDATE/YEARWEEK/DATE_FORMAT/CONCAT 以自定义函数注册，IFNULL/COALESCE/DATE 为内置函数
+    """
+    text = _PLACEHOLDER.sub(lambda m: '%' if m.group(0) == '%%' else '?', sql)
+    text = _DATE_ARITH.sub(_date_arith, text)
+    text = _LOCKING_READ.sub('', text)
+    text = _INSERT_IGNORE.sub('INSERT OR IGNORE', text)
+    return text
+
+
+@lru_cache(maxsize=65536)
+def _parse_datetime(value):
+    """文本时间 -> datetime（自定义函数逐行调用，按值缓存）"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _fn_now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _fn_curdate():
+    return date.today().isoformat()
+
+
+@lru_cache(maxsize=65536)
+def _fn_yearweek(value, mode=0):
+    """MySQL YEARWEEK：mode 1/3 为 ISO 周（周一开始）；其它 mode 按周日开始近似"""
+    moment = _parse_datetime(value)
+    if moment is None:
+        return None
+    if mode in (1, 3):
+        iso_year, iso_week, _ = moment.isocalendar()
+        return iso_year * 100 + iso_week
+    return moment.year * 100 + int(moment.strftime('%U'))
+
+
+_DATE_FORMAT_SPECIFIERS = {
+    '%Y': '%Y', '%y': '%y', '%m': '%m', '%d': '%d', '%H': '%H', '%h': '%I',
+    '%i': '%M', '%s': '%S', '%S': '%S', '%p': '%p', '%W': '%A', '%a': '%a',
+    '%M': '%B', '%b': '%b', '%j': '%j', '%T': '%H:%M:%S', '%%': '%%',
+}
+
+
+@lru_cache(maxsize=65536)
+def _fn_date_format(value, fmt):
+    moment = _parse_datetime(value)
+    if moment is None or fmt is None:
+        return None
+
+    def convert(match):
+        token = match.group(0)
+        if token == '%e':
+            return str(moment.day)
+        if token == '%c':
+            return str(moment.month)
+        return _DATE_FORMAT_SPECIFIERS.get(token, token[1])
+
+    return moment.strftime(re.sub(r"%.", convert, fmt))
+
+
+def _fn_concat(*args):
+    if any(arg is None for arg in args):
+        return None
+    return ''.join(str(arg) for arg in args)
+
+
+# 参数/结果类型：Decimal 与时间按 MySQL 的文本格式存储，读取时按列声明类型还原
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' ', timespec='seconds'))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('decimal', lambda raw: Decimal(raw.decode()))
+sqlite3.register_converter('timestamp', lambda raw: _parse_datetime(raw.decode()))
+sqlite3.register_converter('datetime', lambda raw: _parse_datetime(raw.decode()))
+sqlite3.register_converter('date', lambda raw: date.fromisoformat(raw.decode()[:10]))
+
+
+def _translate_error(error):
+    """sqlite3 异常 -> pymysql 异常"""
+    message = str(error)
+    if isinstance(error, sqlite3.IntegrityError):
+        return pymysql.err.IntegrityError(1062, message)
+    if isinstance(error, sqlite3.OperationalError):
+        if 'locked' in message or 'busy' in message:
+            return pymysql.err.OperationalError(1205, message)
+        return pymysql.err.ProgrammingError(1064, message)
+    if isinstance(error, sqlite3.ProgrammingError):
+        return pymysql.err.InterfaceError(0, message)
+    return pymysql.err.DatabaseError(0, message)
+
+
+def _dict_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteConnection:
+    """
+    接口与 pymysql 连接一致的 SQLite 连接（手动提交，字典结果）
+
+    与 autocommit=False 的 pymysql 一样，第一条语句（包括 SELECT）执行前隐式开启事务。
+    """
+
+    def __init__(self, path, busy_timeout=5):
+        self._conn = sqlite3.connect(
+            path,
+            timeout=busy_timeout,
+            isolation_level=None,          # 事务由本类显式管理
+            check_same_thread=False,       # 连接池会跨线程借出
+            detect_types=sqlite3.PARSE_DECLTYPES,
+        )
+        self._conn.row_factory = _dict_factory
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.create_function('NOW', 0, _fn_now)
+        self._conn.create_function('CURDATE', 0, _fn_curdate)
+        self._conn.create_function('YEARWEEK', 1, _fn_yearweek)
+        self._conn.create_function('YEARWEEK', 2, _fn_yearweek)
+        self._conn.create_function('DATE_FORMAT', 2, _fn_date_format)
+        self._conn.create_function('CONCAT', -1, _fn_concat)
+        self.open = True
+
+    def _begin(self, immediate=False):
+        if not self._conn.in_transaction:
+            # 以 FOR UPDATE 开始的事务立即取得写锁，相当于对行加排他锁（其它写事务在 busy_timeout 内排队）
+            self._conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+    def cursor(self, cursorclass=None, tuples=False):
+        return SQLiteCursor(self, tuples)
+
+    def commit(self):
+        try:
+            if self._conn.in_transaction:
+                self._conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+
+    def rollback(self):
+        try:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+
+    def ping(self, reconnect=False):
+        if not self.open:
+            raise pymysql.err.InterfaceError(0, "连接已关闭")
+        try:
+            self._conn.execute("SELECT 1")
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+
+    def close(self):
+        self.open = False
+        self._conn.close()
+
+
+class SQLiteCursor:
+    """接口与 pymysql DictCursor 一致的游标（tuples=True 时与 pymysql Cursor 一致，每行返回元组）"""
+
+    def __init__(self, connection, tuples=False):
+        self.connection = connection
+        self._cursor = connection._conn.cursor()
+        if tuples:
+            self._cursor.row_factory = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql, params=None):
+        try:
+            self.connection._begin(immediate=_FOR_UPDATE.search(sql) is not None)
+            self._cursor.execute(translate_sql(sql), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        return max(self.rowcount, 0)
+
+    def executemany(self, sql, seq_of_params):
+        try:
+            self.connection._begin()
+            self._cursor.executemany(translate_sql(sql), [tuple(params) for params in seq_of_params])
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+        self.rowcount = self._cursor.rowcount
+        return max(self.rowcount, 0)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ==================== 表结构生成 ====================
+
+_COMMENTS = re.compile(r"/\*.*?\*/|--[^\n]*", re.DOTALL)
+_CREATE_TABLE = re.compile(r"^CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?\s*\(", re.IGNORECASE)
+_CREATE_INDEX = re.compile(r"^CREATE\s+(UNIQUE\s+)?INDEX\s+(\w+)\s+ON\s+`?(\w+)`?\s*(\([^)]*\))", re.IGNORECASE)
+_ALTER_ADD_COLUMN = re.compile(r"^ALTER\s+TABLE\s+`?(\w+)`?\s+ADD\s+COLUMN\s+(.+)$", re.IGNORECASE | re.DOTALL)
+_ALTER_ADD_INDEX = re.compile(r"^ALTER\s+TABLE\s+`?(\w+)`?\s+ADD\s+(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*(\([^)]*\))",
+                              re.IGNORECASE)
+_FOREIGN_KEY = re.compile(r"FOREIGN\s+KEY\s*(\([^)]*\))", re.IGNORECASE)
+_ALTER_ADD_FOREIGN_KEY = re.compile(r"^ALTER\s+TABLE\s+`?(\w+)`?\s+ADD\s+(?:CONSTRAINT\s+\S+\s+)?FOREIGN\s+KEY\s*(\([^)]*\))",
+                                    re.IGNORECASE)
+# 迁移脚本中按 information_schema 判断后动态执行的 DDL：SET @sql := IF(@exists = 0, 'ALTER TABLE ...', 'SELECT 1')
+_CONDITIONAL_DDL = re.compile(r"^SET\s+@\w+\s*:?=\s*IF\s*\([^']*'((?:[^']|'')*)'", re.IGNORECASE | re.DOTALL)
+_INDEX_ITEM = re.compile(r"^(UNIQUE\s+)?(?:INDEX|KEY)\s+`?(\w+)`?\s*(\([^)]*\))", re.IGNORECASE)
+_COLUMN_STRIP = [
+    re.compile(r"\s+COMMENT\s+'(?:[^']|'')*'", re.IGNORECASE),
+    re.compile(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP", re.IGNORECASE),
+    re.compile(r"\s+(?:CHARACTER\s+SET|CHARSET|COLLATE)\s+\w+", re.IGNORECASE),
+    re.compile(r"\s+UNSIGNED\b", re.IGNORECASE),
+    re.compile(r"\s+(?:AFTER\s+`?\w+`?|FIRST)\s*$", re.IGNORECASE),
+]
+_ENUM_TYPE = re.compile(r"\bENUM\s*\((?:[^()']|'(?:[^']|'')*')*\)", re.IGNORECASE)
+
+
+def _split_statements(text):
+    """按分号切分语句（忽略引号内的分号）"""
+    statements, current, quote = [], [], None
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == ';':
+            statements.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if ''.join(current).strip():
+        statements.append(''.join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+def _split_top_level(body):
+    """按最外层逗号切分建表语句的列/约束定义"""
+    items, current, depth, quote = [], [], 0, None
+    for char in body:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            items.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if ''.join(current).strip():
+        items.append(''.join(current).strip())
+    return items
+
+
+def _table_body(statement, start):
+    depth = 0
+    for index in range(start, len(statement)):
+        if statement[index] == '(':
+            depth += 1
+        elif statement[index] == ')':
+            depth -= 1
+            if depth == 0:
+                return statement[start + 1:index]
+    raise ValueError(f"建表语句括号不匹配: {statement[:80]}")
+
+
+def _foreign_key_index(table, cols):
+    name = '_'.join(re.findall(r"\w+", cols))
+    return f"CREATE INDEX IF NOT EXISTS {table}_fk_{name} ON {table} {cols}"
+
+
+def _convert_column(definition):
+    for pattern in _COLUMN_STRIP:
+        definition = pattern.sub('', definition)
+    return _ENUM_TYPE.sub('TEXT', definition)
+
+
+def _convert_create_table(statement):
+    """MySQL CREATE TABLE -> (表名, SQLite CREATE TABLE, [CREATE INDEX ...])"""
+    match = _CREATE_TABLE.match(statement)
+    table = match.group(1)
+    items = _split_top_level(_table_body(statement, match.end() - 1))
+
+    columns, indexes, primary_key, auto_column = [], [], None, None
+    for item in items:
+        upper = item.upper()
+        if upper.startswith('PRIMARY KEY'):
+            primary_key = item
+        elif upper.startswith(('CONSTRAINT', 'FOREIGN KEY')):
+            # 外键在 SQLite 中默认不生效，只保留 InnoDB 会为外键自动建立的索引
+            fk = _FOREIGN_KEY.search(item)
+            if fk:
+                indexes.append(_foreign_key_index(table, fk.group(1)))
+        elif _INDEX_ITEM.match(item):
+            unique, name, cols = _INDEX_ITEM.match(item).groups()
+            indexes.append(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {table}_{name} ON {table} {cols}")
+        elif upper.startswith('UNIQUE'):
+            columns.append(item)
+        else:
+            column = _convert_column(item)
+            if re.search(r"\bAUTO_INCREMENT\b", column, re.IGNORECASE):
+                auto_column = column.split()[0]
+                column = f"{auto_column} INTEGER PRIMARY KEY AUTOINCREMENT"
+            columns.append(column)
+
+    if primary_key and not auto_column:
+        columns.append(primary_key)
+    sql = f"CREATE TABLE IF NOT EXISTS {table} (\n    " + ",\n    ".join(columns) + "\n)"
+    return table, sql, indexes
+
+
+def _source_files(sources):
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            yield from sorted(source.glob('*.sql'))
+        elif source.exists():
+            yield source
+
+
+def build_sqlite_schema(sources=None):
+    """
+    从 MySQL 建表/迁移脚本生成 SQLite 建表语句
+
+    只处理 CREATE TABLE、CREATE INDEX、ALTER TABLE ... ADD COLUMN/INDEX/FOREIGN KEY（外键只建索引，
+    包括 SET @sql := IF(..., 'ALTER TABLE ...', ...) 形式的条件 DDL），
+    数据初始化、存储过程/触发器/事件等语句忽略（SQLite 后端不模拟 MySQL 的触发器）。
+    """
+    tables = {}          # 小写表名 -> (建表语句, 索引列表)；同名表以后出现的定义为准
+    alters = []
+
+    for path in _source_files(sources or SCHEMA_SOURCES):
+        text = _COMMENTS.sub('', path.read_text(encoding='utf-8-sig'))
+        for statement in _split_statements(text):
+            conditional = _CONDITIONAL_DDL.match(statement)
+            if conditional:
+                statement = conditional.group(1).replace("''", "'")
+            if _CREATE_TABLE.match(statement):
+                table, sql, indexes = _convert_create_table(statement)
+                tables[table.lower()] = (sql, indexes)
+            elif _CREATE_INDEX.match(statement):
+                unique, name, table, cols = _CREATE_INDEX.match(statement).groups()
+                alters.append(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {table}_{name} ON {table} {cols}")
+            elif _ALTER_ADD_INDEX.match(statement):
+                table, unique, name, cols = _ALTER_ADD_INDEX.match(statement).groups()
+                alters.append(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {table}_{name} ON {table} {cols}")
+            elif _ALTER_ADD_FOREIGN_KEY.match(statement):
+                table, cols = _ALTER_ADD_FOREIGN_KEY.match(statement).groups()
+                alters.append(_foreign_key_index(table, cols))
+            elif _ALTER_ADD_COLUMN.match(statement):
+                table, column = _ALTER_ADD_COLUMN.match(statement).groups()
+                alters.append(f"ALTER TABLE {table} ADD COLUMN {_convert_column(column.strip())}")
+
+    statements = []
+    for sql, indexes in tables.values():
+        statements.append(sql)
+        statements.extend(indexes)
+    statements.extend(_EXTRA_DDL)
+    statements.extend(alters)
+    return statements
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+ID 号段分配（hi/lo）- 替代 SELECT MAX(id) + 1
+
+每个序列在 T_Sequence 中有一行 Next_Value（迁移 009）。进程需要 ID 时一次取走一段：
+    UPDATE T_Sequence SET Next_Value = Next_Value + block_size WHERE Seq_Name = 'lock'
+之后在内存中逐个发放，block_size 次分配才访问一次数据库：
+    from id_allocator import next_id
+    lock_id = next_id('lock')
+
+取号段的事务单独借一条连接并立即提交（不加入当前工作单元），序列行锁只持有一瞬间，
+业务事务回滚时号段不回滚；未用完的 ID 在进程退出后作废，ID 不连续但不会重复。
+SQLite 后端同一时刻只有一个写事务：调用方应在锁场次行（FOR UPDATE）之前取号，
+否则取号段的连接要等业务事务提交。
+"""
+
+import logging
+import threading
+
+from database import DatabaseConnection, get_pool
+from database_config import ID_ALLOCATOR_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class HiLoAllocator:
+    """
+    单个序列的号段分配器（线程安全）
+
+    Args:
+        name: 序列名（T_Sequence.Seq_Name）
+        table, column: 该序列对应的表和主键列，序列行不存在时按 MAX(column) + 1 初始化
+        floor: 表为空时从 floor + 1 开始
+        block_size: 每次取的号段大小
+    """
+
+    def __init__(self, name, table, column, floor, block_size):
+        self.name = name
+        self.table = table
+        self.column = column
+        self.floor = floor
+        self.block_size = block_size
+        self._next = 0
+        self._high = 0          # 当前号段的上界（不含）
+        self._pool = None       # 号段所属的连接池（切换数据库后端后作废）
+        self._lock = threading.Lock()
+        self.blocks = 0         # 已取号段数
+
+    def next_id(self):
+        with self._lock:
+            pool = get_pool()
+            if self._next >= self._high or pool is not self._pool:
+                self._reserve(pool)
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve(self, pool):
+        """在独立连接上取一个号段：[Next_Value, Next_Value + block_size)"""
+        try:
+            with DatabaseConnection(pool=pool) as db:
+                bump_sql = "UPDATE T_Sequence SET Next_Value = Next_Value + %s WHERE Seq_Name = %s"
+                if not db.cursor.execute(bump_sql, (self.block_size, self.name)):
+                    # 序列行不存在（未执行迁移 009 的初始化或新加的序列）：按现有最大主键补齐
+                    db.cursor.execute(
+                        f"INSERT IGNORE INTO T_Sequence (Seq_Name, Next_Value) "
+                        f"SELECT %s, IFNULL(MAX({self.column}), %s) + 1 FROM {self.table}",
+                        (self.name, self.floor)
+                    )
+                    db.cursor.execute(bump_sql, (self.block_size, self.name))
+                db.cursor.execute("SELECT Next_Value FROM T_Sequence WHERE Seq_Name = %s", (self.name,))
+                high = db.cursor.fetchone()['Next_Value']
+        except Exception as e:
+            logger.error(f"分配ID号段失败: {self.name}: {str(e)}")
+            raise
+
+        self._next, self._high, self._pool = high - self.block_size, high, pool
+        self.blocks += 1
+        logger.debug(f"分配ID号段: {self.name} [{self._next}, {self._high})")
+
+    def resync(self):
+        """
+        把序列推到表中最大主键之后（绕过后端按主键直接插入数据后调用），并丢弃当前号段
+
+        Returns:
+            调整后的 Next_Value
+        """
+        with self._lock:
+            try:
+                with DatabaseConnection(pool=get_pool()) as db:
+                    db.cursor.execute(
+                        f"SELECT IFNULL(MAX({self.column}), %s) + 1 AS next_value FROM {self.table}", (self.floor,))
+                    floor = db.cursor.fetchone()['next_value']
+                    db.cursor.execute(
+                        "INSERT IGNORE INTO T_Sequence (Seq_Name, Next_Value) VALUES (%s, %s)", (self.name, floor))
+                    db.cursor.execute(
+                        "UPDATE T_Sequence SET Next_Value = %s WHERE Seq_Name = %s AND Next_Value < %s",
+                        (floor, self.name, floor))
+                    db.cursor.execute("SELECT Next_Value FROM T_Sequence WHERE Seq_Name = %s", (self.name,))
+                    next_value = db.cursor.fetchone()['Next_Value']
+            except Exception as e:
+                logger.error(f"同步ID序列失败: {self.name}: {str(e)}")
+                raise
+            self._next = self._high = 0
+            return next_value
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_allocator(name):
+    """获取序列的分配器（序列定义见 ID_ALLOCATOR_CONFIG['sequences']）"""
+    allocator = _allocators.get(name)
+    if allocator is None:
+        with _allocators_lock:
+            allocator = _allocators.get(name)
+            if allocator is None:
+                if name not in ID_ALLOCATOR_CONFIG['sequences']:
+                    raise ValueError(f"未定义的ID序列: {name}")
+                table, column, floor = ID_ALLOCATOR_CONFIG['sequences'][name]
+                allocator = HiLoAllocator(name, table, column, floor, ID_ALLOCATOR_CONFIG['block_size'])
+                _allocators[name] = allocator
+    return allocator
+
+
+def next_id(name):
+    """分配一个新 ID（lock/player/schedule）"""
+    return get_allocator(name).next_id()
+
+
+def resync_all():
+    """所有序列推到各自表中最大主键之后，返回 {序列名: Next_Value}"""
+    return {name: get_allocator(name).resync() for name in ID_ALLOCATOR_CONFIG['sequences']}
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+幂等键存储 - 客户端重试下单/支付时返回第一次的响应，不重复执行业务逻辑
+
+请求带 Idempotency-Key 头时（键按用户隔离）：
+    outcome, entry = idempotency_store.begin(user_id, key, fingerprint(method, path, body))
+- PROCEED：本请求占用了该键，照常执行；成功后 complete() 在同一个业务事务内写入响应，失败时 release() 释放该键
+- REPLAY：之前已成功处理，entry.code / entry.body 即当时的响应
+- IN_PROGRESS：同一个键的请求正在处理中（并发重试）
+- MISMATCH：同一个键已用于请求内容不同的请求
+
+两层存储：进程内 LRU（命中时不访问数据库）+ T_Idempotency_Key 表（迁移 011，跨进程/重启后仍然有效）。
+占用键在独立连接上立即提交（其它进程马上能看到“处理中”）；写入响应与订单/流水在同一个事务中提交，
+业务事务回滚时键被释放，客户端可以用同一个键重试。
+"""
+
+from collections import OrderedDict, Counter
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import threading
+
+from database import DatabaseConnection, SafeDatabase, current_unit_of_work, get_pool
+from database_config import IDEMPOTENCY_CONFIG
+
+logger = logging.getLogger(__name__)
+
+PROCEED = 'proceed'
+REPLAY = 'replay'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+
+
+def fingerprint(method, path, body):
+    """请求指纹：方法 + 路径 + 原始请求体的 SHA-256（同一个键换了请求内容时拒绝）"""
+    digest = hashlib.sha256(f"{method} {path}\n".encode('utf-8'))
+    digest.update(body or b'')
+    return digest.hexdigest()
+
+
+class IdempotencyEntry:
+    """一个幂等键的状态（done 为 False 时表示处理中）"""
+
+    __slots__ = ('fingerprint', 'done', 'code', 'body', 'expires_at')
+
+    def __init__(self, fingerprint, done, code, body, expires_at):
+        self.fingerprint = fingerprint
+        self.done = done
+        self.code = code
+        self.body = body
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """进程内 LRU + T_Idempotency_Key 表"""
+
+    def __init__(self, config=None):
+        config = config or IDEMPOTENCY_CONFIG
+        self.enabled = config.get('enabled', True)
+        self.persist = config.get('persist', True)
+        self.ttl = timedelta(seconds=config.get('ttl_seconds', 86400))
+        self.lock_timeout = timedelta(seconds=config.get('lock_seconds', 60))
+        self.max_entries = config.get('max_entries', 10000)
+        self.max_key_length = config.get('max_key_length', 128)
+        self.cleanup_every = config.get('cleanup_every', 500)
+        self._entries = OrderedDict()      # (用户ID, 键) -> IdempotencyEntry（按最近访问排序）
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    # ==================== 进程内缓存 ====================
+
+    def _get(self, scope, now):
+        """读取未过期的条目（调用方持有 self._lock）"""
+        entry = self._entries.get(scope)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            del self._entries[scope]
+            return None
+        self._entries.move_to_end(scope)
+        return entry
+
+    def _put(self, scope, entry):
+        """写入条目并淘汰最久未用的（调用方持有 self._lock）"""
+        self._entries[scope] = entry
+        self._entries.move_to_end(scope)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evicted'] += 1
+
+    @staticmethod
+    def _judge(entry, request_fingerprint):
+        if entry.fingerprint != request_fingerprint:
+            return MISMATCH
+        return REPLAY if entry.done else IN_PROGRESS
+
+    # ==================== 占用/完成/释放 ====================
+
+    def begin(self, user_id, key, request_fingerprint):
+        """
+        尝试占用幂等键
+
+        Returns:
+            (outcome, entry)：outcome 为 PROCEED / REPLAY / IN_PROGRESS / MISMATCH，REPLAY 时 entry 为保存的响应
+        """
+        scope = (user_id, key)
+        now = datetime.now().replace(microsecond=0)     # 与 DATETIME 列一致
+        with self._lock:
+            entry = self._get(scope, now)
+            if entry is not None:
+                outcome = self._judge(entry, request_fingerprint)
+                self._counters[outcome] += 1
+                return outcome, entry
+            # 先在进程内占位：同一进程内的并发重试不必访问数据库
+            self._put(scope, IdempotencyEntry(request_fingerprint, False, None, None, now + self.lock_timeout))
+
+        if not self.persist:
+            self._counters['reserved'] += 1
+            return PROCEED, None
+
+        try:
+            outcome, entry = self._reserve(user_id, key, request_fingerprint, now)
+        except Exception:
+            with self._lock:
+                self._entries.pop(scope, None)
+            raise
+
+        with self._lock:
+            if outcome == REPLAY:
+                self._put(scope, entry)
+            elif outcome != PROCEED:
+                self._entries.pop(scope, None)
+            self._counters['reserved' if outcome == PROCEED else outcome] += 1
+            reservations = self._counters['reserved']
+
+        if outcome == PROCEED and self.cleanup_every and reservations % self.cleanup_every == 0:
+            self.purge_expired()
+        return outcome, entry
+
+    def _reserve(self, user_id, key, request_fingerprint, now):
+        """在独立连接上占用表中的键（立即提交，不加入当前工作单元）"""
+        try:
+            with DatabaseConnection(pool=get_pool()) as db:
+                params = (request_fingerprint, now, now + self.lock_timeout, now + self.ttl)
+                if db.cursor.execute("""
+                    INSERT IGNORE INTO T_Idempotency_Key
+                    (User_ID, Idem_Key, Request_Hash, Status, Create_Time, Lock_Until, Expire_Time)
+                    VALUES (%s, %s, %s, 0, %s, %s, %s)
+                """, (user_id, key) + params):
+                    return PROCEED, None
+
+                db.cursor.execute("""
+                    SELECT Request_Hash, Status, Response_Code, Response_Body, Lock_Until, Expire_Time
+                    FROM T_Idempotency_Key
+                    WHERE User_ID = %s AND Idem_Key = %s
+                    FOR UPDATE
+                """, (user_id, key))
+                row = db.cursor.fetchone()
+                self._counters['db_lookups'] += 1
+
+                if row is not None and row['Expire_Time'] > now and (row['Status'] == 1 or row['Lock_Until'] > now):
+                    entry = IdempotencyEntry(row['Request_Hash'], row['Status'] == 1, row['Response_Code'],
+                                             row['Response_Body'], row['Expire_Time'])
+                    return self._judge(entry, request_fingerprint), entry
+
+                # 记录已过期，或处理中的请求超过 lock_seconds 仍未完成（处理者已退出）：接管该键
+                db.cursor.execute("""
+                    REPLACE INTO T_Idempotency_Key
+                    (User_ID, Idem_Key, Request_Hash, Status, Create_Time, Lock_Until, Expire_Time)
+                    VALUES (%s, %s, %s, 0, %s, %s, %s)
+                """, (user_id, key) + params)
+                self._counters['taken_over'] += 1
+                return PROCEED, None
+
+        except Exception as e:
+            logger.error(f"占用幂等键失败: {str(e)}")
+            raise
+
+    def complete(self, user_id, key, request_fingerprint, code, body):
+        """
+        保存成功的响应（在业务事务内调用，与订单/流水一起提交）
+
+        提交后更新进程内缓存；事务回滚时释放该键。
+        """
+        scope = (user_id, key)
+        expires_at = datetime.now().replace(microsecond=0) + self.ttl
+        if self.persist:
+            SafeDatabase.execute_update("""
+                UPDATE T_Idempotency_Key
+                SET Status = 1, Response_Code = %s, Response_Body = %s, Expire_Time = %s
+                WHERE User_ID = %s AND Idem_Key = %s AND Request_Hash = %s
+            """, (code, body, expires_at, user_id, key, request_fingerprint))
+
+        def remember():
+            with self._lock:
+                self._put(scope, IdempotencyEntry(request_fingerprint, True, code, body, expires_at))
+
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.after_commit(remember)
+            uow.after_rollback(lambda: self.release(user_id, key))
+        else:
+            remember()
+
+    def release(self, user_id, key):
+        """
+        释放处理中的键（请求失败），客户端可以用同一个键重试
+
+        在工作单元内时等事务结束（提交或回滚、连接归还）后再释放。
+        """
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.after_commit(lambda: self._release(user_id, key))
+            uow.after_rollback(lambda: self._release(user_id, key))
+        else:
+            self._release(user_id, key)
+
+    def _release(self, user_id, key):
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None and not entry.done:
+                del self._entries[(user_id, key)]
+            self._counters['released'] += 1
+        if self.persist:
+            try:
+                with DatabaseConnection(pool=get_pool()) as db:
+                    db.cursor.execute(
+                        "DELETE FROM T_Idempotency_Key WHERE User_ID = %s AND Idem_Key = %s AND Status = 0",
+                        (user_id, key))
+            except Exception as e:
+                # 释放失败时该键在 lock_seconds 后可被接管
+                logger.error(f"释放幂等键失败: {str(e)}")
+
+    # ==================== 清理与统计 ====================
+
+    def purge_expired(self):
+        """删除表中已过期的记录（进程内缓存在访问时惰性淘汰），返回删除条数"""
+        if not self.persist:
+            return 0
+        try:
+            with DatabaseConnection(pool=get_pool()) as db:
+                deleted = db.cursor.execute(
+                    "DELETE FROM T_Idempotency_Key WHERE Expire_Time <= %s", (datetime.now().replace(microsecond=0),))
+            self._counters['purged'] += deleted
+            return deleted
+        except Exception as e:
+            logger.error(f"清理过期幂等键失败: {str(e)}")
+            return 0
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        return {
+            'enabled': self.enabled,
+            'persist': self.persist,
+            'entries': entries,
+            'reserved': counters.get('reserved', 0),
+            'replayed': counters.get(REPLAY, 0),
+            'in_progress': counters.get(IN_PROGRESS, 0),
+            'mismatched': counters.get(MISMATCH, 0),
+            'released': counters.get('released', 0),
+            'taken_over': counters.get('taken_over', 0),
+            'db_lookups': counters.get('db_lookups', 0),
+            'evicted': counters.get('evicted', 0),
+            'purged': counters.get('purged', 0),
+        }
+
+
+idempotency_store = IdempotencyStore()
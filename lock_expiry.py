@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+锁位过期调度器 - 到期的锁位由应用后台线程及时过期，不依赖 MySQL event_scheduler
+
+待过期锁位按 ExpireTime 放在小顶堆中，线程睡到最近的到期时间醒来，把已到期的锁位按场次分批过期
+（每个场次一个短事务、一条 UPDATE，见 LockModel.expire_schedule_locks），提交后发布 seat_freed 事件。
+
+- 本进程创建的锁位通过 lock_created 事件加入堆；其它进程创建的锁位每 resync_seconds 秒从数据库重新加载，
+  同时补扫已超时的锁位（LockModel.expire_locks），进程重启或调度落后时不会漏掉
+- 多个进程各自运行调度器时重复过期是安全的（UPDATE 只改 Status = 0 的锁位，计数按实际影响行数扣减）
+- 过期延迟（实际过期时间 - ExpireTime）对所有途径的过期都统计，见 stats()
+
+    from lock_expiry import lock_expiry_worker
+    lock_expiry_worker.start()
+"""
+
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta
+import heapq
+import logging
+import threading
+import time
+
+from database import SafeDatabase
+from database_config import LOCK_EXPIRY_CONFIG
+from models.lock_model import LockModel
+from query_stats import _percentile
+import seat_events
+
+logger = logging.getLogger(__name__)
+
+
+def _deadline(expire_time):
+    # DATETIME 列只到秒（小数部分写入时会被舍入），按整秒向上取，醒来时数据库里的 ExpireTime <= NOW() 一定成立
+    if expire_time.microsecond:
+        expire_time = expire_time.replace(microsecond=0) + timedelta(seconds=1)
+    return expire_time
+
+
+class LockExpiryWorker:
+    """锁位过期后台线程"""
+
+    def __init__(self, config=None):
+        config = config or LOCK_EXPIRY_CONFIG
+        self.enabled = config.get('enabled', True)
+        self.resync_seconds = config.get('resync_seconds', 30)
+        self.max_batch = config.get('max_batch', 500)
+        self._heap = []                 # (到期时间, 锁位ID, 场次ID)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lags = deque(maxlen=config.get('lag_samples', 1024))
+        self._counters = Counter()
+        self._last_error = None
+
+    # ==================== 生命周期 ====================
+
+    def start(self):
+        """启动后台线程（重复调用无副作用）"""
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        seat_events.subscribe(seat_events.LOCK_CREATED, self._on_lock_created)
+        seat_events.subscribe(seat_events.SEAT_FREED, self._on_seat_freed)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='lock-expiry', daemon=True)
+        self._thread.start()
+        logger.info("锁位过期调度器已启动")
+
+    def stop(self, timeout=5):
+        if self._thread is None:
+            return
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+        seat_events.unsubscribe(seat_events.LOCK_CREATED, self._on_lock_created)
+        seat_events.unsubscribe(seat_events.SEAT_FREED, self._on_seat_freed)
+        logger.info("锁位过期调度器已停止")
+
+    # ==================== 事件 ====================
+
+    def track(self, lock_id, schedule_id, expire_time):
+        """把一个锁位加入待过期队列（到期时间早于当前最早的一个时唤醒线程）"""
+        deadline = _deadline(expire_time)
+        with self._cond:
+            wake = not self._heap or deadline < self._heap[0][0]
+            heapq.heappush(self._heap, (deadline, lock_id, schedule_id))
+            if wake:
+                self._cond.notify()
+
+    def _on_lock_created(self, lock_id, schedule_id, expire_time, **_):
+        self.track(lock_id, schedule_id, expire_time)
+
+    def _on_seat_freed(self, reason, expire_time=None, **_):
+        if reason == 'expired' and expire_time is not None:
+            lag_ms = (datetime.now() - expire_time).total_seconds() * 1000
+            with self._cond:
+                self._lags.append(max(lag_ms, 0.0))
+                self._counters['expired'] += 1
+
+    # ==================== 调度 ====================
+
+    def _run(self):
+        next_resync = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= next_resync:
+                    self._resync()
+                    next_resync = time.monotonic() + self.resync_seconds
+                self._sweep_due()
+            except Exception as e:
+                self._counters['errors'] += 1
+                self._last_error = str(e)
+                logger.error(f"锁位过期调度失败: {str(e)}")
+
+            with self._cond:
+                timeout = next_resync - time.monotonic()
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - datetime.now()).total_seconds())
+                if timeout > 0 and not self._stop.is_set():
+                    self._cond.wait(timeout)
+
+    def _resync(self):
+        """补扫已超时的锁位，并从数据库重新加载所有待过期锁位"""
+        LockModel.expire_locks(batch_size=self.max_batch)
+        rows = SafeDatabase.execute_query(
+            "SELECT LockID, Schedule_ID, ExpireTime FROM t_lock_record WHERE Status = 0 AND ExpireTime > NOW()")
+        with self._cond:
+            # 与队列中已有的合并：查询之后才提交、经事件加入的锁位不会丢
+            entries = {lock_id: (deadline, lock_id, schedule_id) for deadline, lock_id, schedule_id in self._heap}
+            for row in rows:
+                entries[row['LockID']] = (_deadline(row['ExpireTime']), row['LockID'], row['Schedule_ID'])
+            self._heap = list(entries.values())
+            heapq.heapify(self._heap)
+            self._counters['resyncs'] += 1
+
+    def _sweep_due(self):
+        """弹出已到期的锁位，按场次分批过期"""
+        now = datetime.now()
+        due = defaultdict(int)
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now and sum(due.values()) < self.max_batch:
+                _, _, schedule_id = heapq.heappop(self._heap)
+                due[schedule_id] += 1
+        if not due:
+            return
+
+        for schedule_id in due:
+            try:
+                LockModel.expire_schedule_locks([schedule_id])
+            except Exception as e:
+                # 单个场次失败（如场次已删除）不影响其它场次，剩下的锁位由下次补扫处理
+                self._counters['errors'] += 1
+                self._last_error = str(e)
+                logger.error(f"过期场次锁位失败: Schedule_ID={schedule_id}: {str(e)}")
+        self._counters['sweeps'] += 1
+        self._counters['swept_schedules'] += len(due)
+
+    # ==================== 统计 ====================
+
+    def stats(self):
+        """待过期数、下一个到期时间、过期条数、过期延迟（毫秒）"""
+        with self._cond:
+            lags = sorted(self._lags)
+            pending = len(self._heap)
+            next_due = self._heap[0][0] if self._heap else None
+            counters = dict(self._counters)
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'pending': pending,
+            'next_due': next_due.strftime('%Y-%m-%d %H:%M:%S') if next_due else None,
+            'expired': counters.get('expired', 0),
+            'sweeps': counters.get('sweeps', 0),
+            'swept_schedules': counters.get('swept_schedules', 0),
+            'resyncs': counters.get('resyncs', 0),
+            'errors': counters.get('errors', 0),
+            'last_error': self._last_error,
+            'lag_p50_ms': round(_percentile(lags, 50), 1),
+            'lag_p95_ms': round(_percentile(lags, 95), 1),
+            'lag_max_ms': round(lags[-1], 1) if lags else 0.0,
+        }
+
+
+lock_expiry_worker = LockExpiryWorker()
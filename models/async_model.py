@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+异步模型 - 剧本/场次/锁位读路径的 async 版本（供 asgi.py 使用）
+SQL 与校验逻辑仍在同步模型中，这里只负责把整个模型方法放到数据库线程池执行
+"""
+
+from async_database import AsyncSafeDatabase
+from models.script_model import ScriptModel
+from models.schedule_model import ScheduleModel
+from models.lock_model import LockModel
+
+
+class AsyncScriptModel:
+    """剧本模型（异步）"""
+
+    @staticmethod
+    async def get_all_scripts(status=None):
+        return await AsyncSafeDatabase.run_sync(ScriptModel.get_all_scripts, status)
+
+    @staticmethod
+    async def get_script_by_id(script_id):
+        return await AsyncSafeDatabase.run_sync(ScriptModel.get_script_by_id, script_id)
+
+    @staticmethod
+    async def get_hot_scripts(limit=10):
+        return await AsyncSafeDatabase.run_sync(ScriptModel.get_hot_scripts, limit)
+
+
+class AsyncScheduleModel:
+    """场次模型（异步）"""
+
+    @staticmethod
+    async def get_schedules_by_script(script_id, player_id=None):
+        return await AsyncSafeDatabase.run_sync(ScheduleModel.get_schedules_by_script, script_id, player_id)
+
+
+class AsyncLockModel:
+    """锁位模型（异步）"""
+
+    @staticmethod
+    async def create_lock(player_id, schedule_id, lock_minutes=15):
+        # 在一个工作单元内执行，冲突重试（retry_on_conflict）照常生效
+        return await AsyncSafeDatabase.run_sync(LockModel.create_lock, player_id, schedule_id, lock_minutes)
+
+    @staticmethod
+    async def get_locks_by_player(player_id, limit=None, cursor=None):
+        return await AsyncSafeDatabase.run_sync(LockModel.get_locks_by_player, player_id, limit, cursor)
@@ -3,10 +3,14 @@
 用户认证模型 - 处理登录、注册、JWT token
 """
 
-from database import SafeDatabase
+from database import SafeDatabase, DatabaseConnection, get_pool
+from database_config import RETRY_CONFIG
+from id_allocator import next_id
+from tracing import traced_model
 from security_utils import InputValidator
 import logging
 import hashlib
+import pymysql
 import secrets
 import jwt
 from datetime import datetime, timedelta
@@ -20,6 +24,7 @@ JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24
 
 
+@traced_model
 class AuthModel:
     """用户认证模型类"""
 
@@ -104,10 +109,8 @@ class AuthModel:
             # 如果是玩家角色，需要先创建T_Player记录
             if role == 'player':
                 import uuid
-                # 生成新的Player_ID
-                player_id_sql = "SELECT IFNULL(MAX(Player_ID), 3000) + 1 AS new_id FROM T_Player"
-                result = SafeDatabase.execute_query(player_id_sql, fetch_one=True)
-                new_player_id = result['new_id']
+                # 生成新的Player_ID（号段分配，并发注册不会取到同一个 ID）
+                new_player_id = next_id('player')
 
                 # 将插入T_Player记录加入事务
                 player_sql = """
@@ -138,6 +141,22 @@ class AuthModel:
             logger.error(f"用户注册失败: {str(e)}")
             raise
 
+    @staticmethod
+    def _record_last_login(user_id):
+        """
+        记录玩家最后登录时间
+
+        在独立连接上立即提交，不加入请求的工作单元：只有锁等待超时/死锁时放弃本次记录（不影响登录），
+        其它错误照常抛出；请求事务不会因为这条更新被数据库回滚
+        """
+        try:
+            with DatabaseConnection(pool=get_pool()) as db:
+                db.cursor.execute("UPDATE T_User SET Last_Login=NOW() WHERE User_ID=%s", (user_id,))
+        except pymysql.err.OperationalError as e:
+            if e.args[0] not in RETRY_CONFIG['retryable_errors']:
+                raise
+            logger.warning(f"更新最后登录时间失败，跳过: User_ID={user_id}: {str(e)}")
+
     @staticmethod
     def login(username, password):
         """
@@ -196,8 +215,7 @@ class AuthModel:
                 raise ValueError("用户名或密码错误")
 
             # 更新最后登录时间
-            update_sql = "UPDATE T_User SET Last_Login=NOW() WHERE User_ID=%s"
-            SafeDatabase.execute_update(update_sql, (user['User_ID'],))
+            AuthModel._record_last_login(user['User_ID'])
 
             # 生成token
             token = AuthModel.generate_token(user['User_ID'], user['Role'])
@@ -3,17 +3,27 @@
 锁位模型 - 处理场次锁位逻辑
 """
 
-from database import SafeDatabase
+from database import SafeDatabase, retry_on_conflict
+from contention_stats import contention_stats
+from id_allocator import next_id
+from pagination import paginate
+from models.schedule_model import ScheduleModel
+from models.waitlist_model import WaitlistModel
+from seat_inventory import seat_inventory
+import seat_events
+from tracing import traced_model
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@traced_model
 class LockModel:
     """锁位模型类"""
 
     @staticmethod
+    @retry_on_conflict
     def create_lock(player_id, schedule_id, lock_minutes=15):
         """
         创建锁位记录
@@ -27,51 +37,46 @@ class LockModel:
             lock_id: 锁位记录ID
         """
         try:
-            # 检查该玩家是否已经锁定了这个场次
-            check_sql = """
-                SELECT LockID FROM t_lock_record
-                WHERE Player_ID=%s AND Schedule_ID=%s AND Status=0
-            """
-            existing = SafeDatabase.execute_query(check_sql, (player_id, schedule_id), fetch_one=True)
-            if existing:
-                raise ValueError("您已经锁定了该场次")
+            # 每次执行（含冲突重做）记入争用统计：结果、等待场次行锁耗时、按场次的热度
+            with contention_stats.attempt('lock', schedule_id) as attempt:
+                # 先问内存库存：已满/重复锁位直接拒绝，不占用数据库连接和场次行锁
+                admitted = seat_inventory.check_lock(schedule_id, player_id)
 
-            # 检查场次是否已满（包括已锁定的位置）
-            capacity_sql = """
-                SELECT
-                    sc.Max_Players,
-                    COUNT(DISTINCT o.Order_ID) as booked_count,
-                    COUNT(DISTINCT l.LockID) as locked_count
-                FROM T_Schedule s
-                JOIN T_Script sc ON s.Script_ID = sc.Script_ID
-                LEFT JOIN T_Order o ON s.Schedule_ID = o.Schedule_ID AND o.Pay_Status IN (0, 1)
-                LEFT JOIN t_lock_record l ON s.Schedule_ID = l.Schedule_ID AND l.Status = 0 AND l.ExpireTime > NOW()
-                WHERE s.Schedule_ID = %s
-                GROUP BY s.Schedule_ID, sc.Max_Players
-            """
-            capacity = SafeDatabase.execute_query(capacity_sql, (schedule_id,), fetch_one=True)
+                # 新 LockID 从本进程的号段中分配（在锁场次行之前取号，不在行锁内访问序列表）
+                new_id = next_id('lock')
 
-            if not capacity:
-                raise ValueError("场次不存在")
+                # 在一个短事务内：锁住场次行 -> 校验名额/重复 -> 插入锁位并计数，提交时释放行锁
+                with SafeDatabase.unit_of_work():
+                    with attempt.row_lock():
+                        seat = ScheduleModel.lock_for_booking(schedule_id, player_id)
+                    if seat['player_lock_id']:
+                        seat_inventory.mark_stale(schedule_id, admitted)
+                        raise ValueError("您已经锁定了该场次")
 
-            total_occupied = (capacity.get('booked_count') or 0) + (capacity.get('locked_count') or 0)
-            if total_occupied >= capacity['Max_Players']:
-                raise ValueError("该场次已满")
+                    # 检查场次是否已满（包括已锁定的位置）
+                    if seat['Booked_Count'] + seat['Locked_Count'] >= seat['Max_Players']:
+                        seat_inventory.mark_stale(schedule_id, admitted)
+                        raise ValueError("该场次已满")
 
-            # 计算过期时间
-            expire_time = datetime.now() + timedelta(minutes=lock_minutes)
+                    # 有候补时空出的名额先留给排在前面的候补玩家
+                    WaitlistModel.claim_seat(schedule_id, player_id,
+                                             seat['Max_Players'] - seat['Booked_Count'] - seat['Locked_Count'],
+                                             lock_id=new_id)
 
-            # 生成新的 LockID（表无自增）
-            new_id_sql = "SELECT IFNULL(MAX(LockID), 7000) + 1 AS new_id FROM t_lock_record"
-            new_id = SafeDatabase.execute_query(new_id_sql, fetch_one=True)['new_id']
+                    # 计算过期时间（取整到秒，与 DATETIME 列一致，过期调度器按该时间准点过期）
+                    expire_time = (datetime.now() + timedelta(minutes=lock_minutes)).replace(microsecond=0)
 
-            # 创建锁位记录（使用旧表字段名）
-            insert_sql = """
-                INSERT INTO t_lock_record
-                (LockID, Schedule_ID, Player_ID, LockTime, ExpireTime, Status)
-                VALUES (%s, %s, %s, NOW(), %s, 0)
-            """
-            SafeDatabase.execute_update(insert_sql, (new_id, schedule_id, player_id, expire_time))
+                    # 创建锁位记录（使用旧表字段名）
+                    insert_sql = """
+                        INSERT INTO t_lock_record
+                        (LockID, Schedule_ID, Player_ID, LockTime, ExpireTime, Status)
+                        VALUES (%s, %s, %s, NOW(), %s, 0)
+                    """
+                    SafeDatabase.execute_update(insert_sql, (new_id, schedule_id, player_id, expire_time))
+                    ScheduleModel.adjust_counts(schedule_id, locked=1)
+                    seat_inventory.record_lock(schedule_id, player_id, new_id, expire_time)
+                    seat_events.publish(seat_events.LOCK_CREATED, lock_id=new_id, schedule_id=schedule_id,
+                                        player_id=player_id, expire_time=expire_time)
 
             logger.info(f"创建锁位成功: LockID={new_id}, Player_ID={player_id}, Schedule_ID={schedule_id}")
             return new_id
@@ -81,6 +86,7 @@ class LockModel:
             raise
 
     @staticmethod
+    @retry_on_conflict
     def cancel_lock(lock_id, player_id):
         """
         取消锁位
@@ -94,7 +100,7 @@ class LockModel:
         """
         try:
             # 验证锁位归属
-            check_sql = "SELECT Player_ID, Status FROM t_lock_record WHERE LockID=%s"
+            check_sql = "SELECT Player_ID, Schedule_ID, Status FROM t_lock_record WHERE LockID=%s"
             lock = SafeDatabase.execute_query(check_sql, (lock_id,), fetch_one=True)
 
             if not lock:
@@ -106,9 +112,16 @@ class LockModel:
             if lock['Status'] != 0:
                 raise ValueError("该锁位已失效")
 
-            # 更新状态为已释放
-            update_sql = "UPDATE t_lock_record SET Status=2 WHERE LockID=%s"
-            SafeDatabase.execute_update(update_sql, (lock_id,))
+            # 锁住场次行后更新状态为已释放；期间已被过期/转订单时影响 0 行，不重复扣减计数
+            with SafeDatabase.unit_of_work():
+                ScheduleModel.lock_schedule_row(lock['Schedule_ID'])
+                update_sql = "UPDATE t_lock_record SET Status=2 WHERE LockID=%s AND Status=0"
+                if not SafeDatabase.execute_update(update_sql, (lock_id,)):
+                    raise ValueError("该锁位已失效")
+                ScheduleModel.adjust_counts(lock['Schedule_ID'], locked=-1)
+                seat_inventory.release_lock(lock['Schedule_ID'], player_id, lock_id)
+                seat_events.publish(seat_events.SEAT_FREED, schedule_id=lock['Schedule_ID'], player_id=player_id,
+                                    seats=1, reason='lock_cancelled', lock_id=lock_id)
 
             logger.info(f"取消锁位成功: Lock_ID={lock_id}")
             return True
@@ -118,8 +131,63 @@ class LockModel:
             raise
 
     @staticmethod
-    def get_locks_by_player(player_id):
-        """获取玩家的锁位记录"""
+    def expire_locks(batch_size=500):
+        """
+        过期清理：把所有已过期仍为锁定中的锁位标记为已过期（Status=3），并扣减对应场次的 Locked_Count
+
+        与 evt_expire_locks 事件作用相同（未开启 event_scheduler 时由定时任务调用
+        tools/reconcile_occupancy.py --expire）；每个场次一个短事务，先锁场次行再改锁位。
+
+        Returns:
+            过期的锁位条数
+        """
+        try:
+            total = 0
+            while True:
+                rows = SafeDatabase.execute_query("""
+                    SELECT DISTINCT Schedule_ID FROM t_lock_record
+                    WHERE Status = 0 AND ExpireTime <= NOW()
+                    LIMIT %s
+                """, (batch_size,))
+                if not rows:
+                    break
+                total += LockModel.expire_schedule_locks(row['Schedule_ID'] for row in rows)
+                if len(rows) < batch_size:
+                    break
+
+            if total:
+                logger.info(f"锁位过期清理完成: {total}条")
+            return total
+
+        except Exception as e:
+            logger.error(f"锁位过期清理失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def expire_schedule_locks(schedule_ids):
+        """
+        过期指定场次中已到期的锁位（锁位过期调度器按到期时间分批调用）
+
+        每个场次一个短事务：锁场次行 -> 一条 UPDATE 过期本场次所有到期锁位 -> 扣减计数，
+        提交后发布 seat_freed 事件。
+
+        Returns:
+            过期的锁位条数
+        """
+        total = 0
+        for schedule_id in sorted(set(schedule_ids)):
+            with SafeDatabase.unit_of_work():
+                ScheduleModel.lock_schedule_row(schedule_id)
+                total += ScheduleModel.expire_locks(schedule_id)
+        return total
+
+    @staticmethod
+    def get_locks_by_player(player_id, limit=None, cursor=None):
+        """
+        获取玩家的锁位记录
+
+        传 limit 或 cursor 时按键集分页返回 {'items': 锁位列表, 'next_cursor': 下一页游标}
+        """
         try:
             sql = """
                 SELECT
@@ -132,21 +200,29 @@ class LockModel:
                 JOIN T_Room r ON s.Room_ID = r.Room_ID
                 JOIN T_DM d ON s.DM_ID = d.DM_ID
                 WHERE l.Player_ID = %s
-                ORDER BY l.LockTime DESC
             """
-            locks = SafeDatabase.execute_query(sql, (player_id,))
+            if limit is not None or cursor:
+                return paginate(sql, [player_id], 'l.LockTime', 'l.LockID',
+                                'LockTime', 'LockID', limit, cursor)
+
+            sql += " ORDER BY l.LockTime DESC, l.LockID DESC"
+            locks = SafeDatabase.execute_query(sql, (player_id,), use_replica=True)
             return locks if locks else []
         except Exception as e:
             logger.error(f"查询玩家锁位失败: {str(e)}")
             raise
 
     @staticmethod
-    def get_all_locks(dm_id=None):
+    def get_all_locks(dm_id=None, stream=False, limit=None, cursor=None, compact=False):
         """
         获取锁位记录（员工/老板用）
 
         Args:
             dm_id: 可选，DM_ID 分域（staff 传入后仅返回自己 DM 的锁位）
+            stream: 为 True 时返回逐行产出的生成器（服务端游标，不整体加载到内存）
+            limit: 可选，每页条数（传 limit 或 cursor 时按键集分页返回，stream 不再生效）
+            cursor: 可选，上一页返回的 next_cursor
+            compact: 为 True 时返回 CompactResult（列名 + 元组行），分页时不生效
         """
         try:
             sql = """
@@ -170,10 +246,19 @@ class LockModel:
                 sql += " AND s.DM_ID = %s"
                 params.append(dm_id)
 
-            sql += " ORDER BY l.LockTime DESC"
+            if limit is not None or cursor:
+                return paginate(sql, params, 'l.LockTime', 'l.LockID',
+                                'LockTime', 'LockID', limit, cursor)
 
-            locks = SafeDatabase.execute_query(sql, tuple(params) if params else None)
-            return locks if locks else []
+            sql += " ORDER BY l.LockTime DESC, l.LockID DESC"
+
+            if stream:
+                return SafeDatabase.execute_query_stream(sql, tuple(params) if params else None,
+                                                         use_replica=True, compact=compact)
+
+            locks = SafeDatabase.execute_query(sql, tuple(params) if params else None,
+                                               use_replica=True, compact=compact)
+            return locks if locks or compact else []
         except Exception as e:
             logger.error(f"查询锁位失败: {str(e)}")
             raise
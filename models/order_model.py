@@ -4,14 +4,22 @@
 包含订单创建、支付、取消等核心业务逻辑
 """
 
-from database import SafeDatabase
+from database import SafeDatabase, retry_on_conflict
+from contention_stats import contention_stats
+import snowflake
+from pagination import paginate
+from models.schedule_model import ScheduleModel
+from models.waitlist_model import WaitlistModel
+from seat_inventory import seat_inventory
+import seat_events
+from tracing import traced_model
 from security_utils import InputValidator
 import logging
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
+@traced_model
 class OrderModel:
     """订单模型类 - 处理订单相关的业务逻辑"""
 
@@ -21,6 +29,7 @@ class OrderModel:
     STATUS_REFUNDED = 2  # 已退款
 
     @staticmethod
+    @retry_on_conflict
     def create_order(player_id, schedule_id, amount=None):
         """
         创建订单（安全版本 - 后端自动获取价格）
@@ -36,82 +45,63 @@ class OrderModel:
         安全措施：
         1. 后端自动从数据库获取Real_Price，忽略前端传入的金额
         2. 使用参数化查询
-        3. 使用事务确保数据一致性
+        3. 容量校验与插入在同一事务内，并对场次行加锁，并发下不会超卖
         """
         try:
             # 1. 验证输入
             player_id = InputValidator.validate_id(player_id, "玩家ID")
             schedule_id = InputValidator.validate_id(schedule_id, "场次ID")
 
-            # 2. 检查场次容量（包含锁位）
-            capacity_sql = """
-                SELECT
-                    sc.Max_Players,
-                    COUNT(DISTINCT o.Order_ID) AS booked_count,
-                    COUNT(DISTINCT l.LockID) AS locked_count
-                FROM T_Schedule sch
-                JOIN T_Script sc ON sch.Script_ID = sc.Script_ID
-                LEFT JOIN T_Order o ON sch.Schedule_ID = o.Schedule_ID AND o.Pay_Status IN (0, 1)
-                LEFT JOIN t_lock_record l ON sch.Schedule_ID = l.Schedule_ID AND l.Status = 0 AND l.ExpireTime > NOW()
-                WHERE sch.Schedule_ID = %s
-                GROUP BY sch.Schedule_ID, sc.Max_Players
-            """
-            cap = SafeDatabase.execute_query(capacity_sql, (schedule_id,), fetch_one=True)
-            if not cap:
-                raise ValueError(f"场次 {schedule_id} 不存在")
-            total_occupied = (cap.get('booked_count') or 0) + (cap.get('locked_count') or 0)
-            if total_occupied >= cap['Max_Players']:
-                raise ValueError("该场次已满")
-
-            # 2. 检查该玩家是否已预约该场次（防止重复预约）
-            duplicate_check_sql = """
-                SELECT Order_ID FROM T_Order
-                WHERE Player_ID = %s AND Schedule_ID = %s AND Pay_Status IN (0, 1)
-            """
-            existing_order = SafeDatabase.execute_query(duplicate_check_sql, (player_id, schedule_id), fetch_one=True)
-            if existing_order:
-                raise ValueError("您已经预约过该场次，请勿重复预约")
-
-            # 3. 若已锁位，允许继续创建订单（会把锁位标记为“已转订单”）
-            lock_check_sql = """
-                SELECT LockID FROM t_lock_record
-                WHERE Player_ID = %s AND Schedule_ID = %s AND Status = 0 AND ExpireTime > NOW()
-                ORDER BY LockTime DESC
-                LIMIT 1
-            """
-            existing_lock = SafeDatabase.execute_query(lock_check_sql, (player_id, schedule_id), fetch_one=True)
-
-            # 4. 从数据库获取场次价格（安全！）
-            price_sql = "SELECT Real_Price FROM T_Schedule WHERE Schedule_ID = %s"
-            schedule = SafeDatabase.execute_query(price_sql, (schedule_id,), fetch_one=True)
-
-            if not schedule:
-                raise ValueError(f"场次 {schedule_id} 不存在")
-
-            # 使用数据库中的价格，忽略前端传入的金额
-            actual_amount = schedule['Real_Price']
-
-            # 5. 生成订单ID（使用时间戳+随机数）
-            import random
-            order_id = int(datetime.now().strftime('%Y%m%d%H%M%S')) + random.randint(1000, 9999)
-
-            # 6. 使用事务：插入订单 +（可选）锁位转订单
-            operations = []
-
-            insert_sql = """
-                INSERT INTO T_Order (Order_ID, Player_ID, Schedule_ID, Amount,
-                                     Pay_Status, Create_Time)
-                VALUES (%s, %s, %s, %s, %s, NOW())
-            """
-            operations.append((insert_sql, (order_id, player_id, schedule_id, actual_amount, OrderModel.STATUS_UNPAID)))
-
-            if existing_lock:
-                operations.append((
-                    "UPDATE t_lock_record SET Status = 1 WHERE LockID = %s AND Status = 0",
-                    (existing_lock['LockID'],)
-                ))
-
-            SafeDatabase.execute_transaction(operations)
+            # 每次执行（含冲突重做）记入争用统计：结果、等待场次行锁耗时、按场次的热度
+            with contention_stats.attempt('order', schedule_id) as attempt:
+                # 先问内存库存：已满/重复预约直接拒绝，不占用数据库连接和场次行锁
+                admitted = seat_inventory.check_order(schedule_id, player_id)
+
+                # 生成订单ID（按时间递增的 53 位 ID，进程内生成；在锁场次行之前取，首次使用时可能要租用 worker 号）
+                order_id = snowflake.next_id()
+
+                # 在一个短事务内：锁住场次行 -> 校验名额/重复 -> 插入订单并计数，提交时释放行锁
+                with SafeDatabase.unit_of_work():
+                    with attempt.row_lock():
+                        seat = ScheduleModel.lock_for_booking(schedule_id, player_id)
+
+                    # 2. 检查该玩家是否已预约该场次（防止重复预约）
+                    if seat['player_order_id']:
+                        seat_inventory.mark_stale(schedule_id, admitted)
+                        raise ValueError("您已经预约过该场次，请勿重复预约")
+
+                    # 3. 检查场次容量（包含锁位）；已锁位的玩家转订单时占用的是自己锁住的名额
+                    own_lock = seat['player_lock_id']
+                    total_occupied = seat['Booked_Count'] + seat['Locked_Count'] - (1 if own_lock else 0)
+                    if total_occupied >= seat['Max_Players']:
+                        seat_inventory.mark_stale(schedule_id, admitted)
+                        raise ValueError("该场次已满")
+                    if not own_lock:
+                        # 有候补时空出的名额先留给排在前面的候补玩家
+                        WaitlistModel.claim_seat(schedule_id, player_id, seat['Max_Players'] - total_occupied)
+
+                    # 4. 使用数据库中的价格，忽略前端传入的金额
+                    actual_amount = seat['Real_Price']
+
+                    # 5. 插入订单 +（可选）锁位转订单
+                    operations = []
+
+                    insert_sql = """
+                        INSERT INTO T_Order (Order_ID, Player_ID, Schedule_ID, Amount,
+                                             Pay_Status, Create_Time)
+                        VALUES (%s, %s, %s, %s, %s, NOW())
+                    """
+                    operations.append((insert_sql, (order_id, player_id, schedule_id, actual_amount, OrderModel.STATUS_UNPAID)))
+
+                    if own_lock:
+                        operations.append((
+                            "UPDATE t_lock_record SET Status = 1 WHERE LockID = %s AND Status = 0",
+                            (own_lock,)
+                        ))
+
+                    SafeDatabase.execute_transaction(operations)
+                    ScheduleModel.adjust_counts(schedule_id, booked=1, locked=-1 if own_lock else 0)
+                    seat_inventory.record_order(schedule_id, player_id, order_id)
 
             logger.info(f"订单创建成功: Order_ID={order_id}")
             return order_id
@@ -121,6 +111,7 @@ class OrderModel:
             raise
 
     @staticmethod
+    @retry_on_conflict
     def pay_order(order_id, channel=1):
         """
         支付订单（使用事务确保数据一致性）
@@ -147,20 +138,24 @@ class OrderModel:
                 raise ValueError(f"订单 {order_id} 不存在")
             if order['Pay_Status'] == OrderModel.STATUS_PAID:
                 raise ValueError("订单已支付，无需重复支付")
+            if order['Pay_Status'] != OrderModel.STATUS_UNPAID:
+                raise ValueError("订单已取消或已退款，无法支付")
 
             # 生成交易流水ID
-            import random
-            trans_id = int(datetime.now().strftime('%Y%m%d%H%M%S')) + random.randint(1000, 9999)
-
-            # 使用事务：更新订单状态 + 插入流水记录
-            operations = [
-                ("UPDATE T_Order SET Pay_Status=%s WHERE Order_ID=%s",
-                 (OrderModel.STATUS_PAID, order_id)),
-                ("INSERT INTO T_Transaction (Trans_ID, Order_ID, Amount, Trans_Type, Channel, Trans_Time, Result) VALUES (%s, %s, %s, %s, %s, NOW(), %s)",
-                 (trans_id, order_id, order['Amount'], 1, channel, 1))
-            ]
-
-            SafeDatabase.execute_transaction(operations)
+            trans_id = snowflake.next_id()
+
+            # 使用事务：更新订单状态 + 插入流水记录；订单期间被取消时影响 0 行，整个事务回滚
+            with SafeDatabase.unit_of_work():
+                paid = SafeDatabase.execute_update(
+                    "UPDATE T_Order SET Pay_Status=%s WHERE Order_ID=%s AND Pay_Status=%s",
+                    (OrderModel.STATUS_PAID, order_id, OrderModel.STATUS_UNPAID)
+                )
+                if not paid:
+                    raise ValueError("订单状态已变化，请刷新后重试")
+                SafeDatabase.execute_update(
+                    "INSERT INTO T_Transaction (Trans_ID, Order_ID, Amount, Trans_Type, Channel, Trans_Time, Result) VALUES (%s, %s, %s, %s, %s, NOW(), %s)",
+                    (trans_id, order_id, order['Amount'], 1, channel, 1)
+                )
             logger.info(f"订单支付成功: Order_ID={order_id}, Trans_ID={trans_id}")
             return trans_id
 
@@ -169,6 +164,7 @@ class OrderModel:
             raise
 
     @staticmethod
+    @retry_on_conflict
     def cancel_order(order_id, player_id):
         """
         取消订单（仅限未支付订单）
@@ -208,22 +204,28 @@ class OrderModel:
             if order['Pay_Status'] not in [OrderModel.STATUS_UNPAID, OrderModel.STATUS_PAID]:
                 raise ValueError("该订单无法取消")
 
-            # 使用事务：更新订单状态 + 释放关联锁位
-            operations = []
-
+            # 使用事务：锁住场次行 -> 更新订单状态 + 释放关联锁位 -> 按实际变更行数扣减计数
             # 根据支付状态决定新状态：未支付->已取消(3)，已支付->已退款(2)
             new_status = 3 if order['Pay_Status'] == OrderModel.STATUS_UNPAID else 2
-            operations.append(
-                ("UPDATE T_Order SET Pay_Status = %s WHERE Order_ID = %s", (new_status, order_id))
-            )
+            with SafeDatabase.unit_of_work():
+                ScheduleModel.lock_schedule_row(order['Schedule_ID'])
+                cancelled = SafeDatabase.execute_update(
+                    "UPDATE T_Order SET Pay_Status = %s WHERE Order_ID = %s AND Pay_Status = %s",
+                    (new_status, order_id, order['Pay_Status'])
+                )
+                if not cancelled:
+                    raise ValueError("订单状态已变化，请刷新后重试")
+
+                # 释放该玩家在该场次的锁位（如果有）
+                released = SafeDatabase.execute_update(
+                    "UPDATE t_lock_record SET Status = 2 WHERE Player_ID = %s AND Schedule_ID = %s AND Status = 0",
+                    (player_id, order['Schedule_ID'])
+                )
+                ScheduleModel.adjust_counts(order['Schedule_ID'], booked=-1, locked=-released)
+                seat_inventory.release_order(order['Schedule_ID'], player_id, order_id)
+                seat_events.publish(seat_events.SEAT_FREED, schedule_id=order['Schedule_ID'], player_id=player_id,
+                                    seats=1 + released, reason='order_cancelled', order_id=order_id)
 
-            # 释放该玩家在该场次的锁位（如果有）
-            operations.append(
-                ("UPDATE t_lock_record SET Status = 2 WHERE Player_ID = %s AND Schedule_ID = %s AND Status = 0",
-                 (player_id, order['Schedule_ID']))
-            )
-
-            SafeDatabase.execute_transaction(operations)
             logger.info(f"订单取消成功: Order_ID={order_id}")
             return True
 
@@ -232,15 +234,73 @@ class OrderModel:
             raise
 
     @staticmethod
-    def get_orders_by_player(player_id):
+    def import_orders(orders, batch_size=500, commit_each_batch=True):
+        """
+        批量导入历史订单（迁移/补录数据用，类似 insert_history_orders.sql）
+
+        Args:
+            orders: 订单字典列表：order_id, player_id, schedule_id, amount, pay_status, create_time
+            batch_size: 每批写入行数（每批一条多行 INSERT）
+            commit_each_batch: 每批单独提交，导入中途失败时已提交的批次保留
+
+        Returns:
+            插入的行数
+
+        注意：trg_prevent_duplicate_order 触发器会让包含重复预约的整批失败，导入前应先去重；
+        导入后涉及场次的 Booked_Count 按明细重新统计，座位库存中这些场次重新加载
+        """
+        try:
+            rows = []
+            for item in orders:
+                rows.append((
+                    InputValidator.validate_id(item['order_id'], "订单ID"),
+                    InputValidator.validate_id(item['player_id'], "玩家ID"),
+                    InputValidator.validate_id(item['schedule_id'], "场次ID"),
+                    InputValidator.validate_decimal(item['amount'], "订单金额"),
+                    InputValidator.validate_enum(item['pay_status'], [0, 1, 2, 3], "支付状态"),
+                    item['create_time'],
+                ))
+
+            if not rows:
+                return 0
+
+            sql = """
+                INSERT INTO T_Order (Order_ID, Player_ID, Schedule_ID, Amount, Pay_Status, Create_Time)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """
+            schedule_ids = {row[2] for row in rows if row[4] in (0, 1)}
+            try:
+                affected = SafeDatabase.execute_many(
+                    sql, rows, batch_size=batch_size, commit_each_batch=commit_each_batch
+                )
+            except Exception:
+                # 逐批提交时失败前的批次已经入库，同样需要重新统计
+                if commit_each_batch and schedule_ids:
+                    ScheduleModel.reconcile_counts(schedule_ids)
+                    seat_inventory.invalidate(*schedule_ids)
+                raise
+            # 导入的有效订单计入场次占用（按明细重新统计，不逐条加减）
+            ScheduleModel.reconcile_counts(schedule_ids)
+            seat_inventory.invalidate(*schedule_ids)
+            logger.info(f"批量导入订单成功: 共{affected}条")
+            return affected
+
+        except Exception as e:
+            logger.error(f"批量导入订单失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_orders_by_player(player_id, limit=None, cursor=None):
         """
         查询玩家的所有订单
 
         Args:
             player_id: 玩家ID
+            limit: 可选，每页条数（传 limit 或 cursor 时按键集分页返回）
+            cursor: 可选，上一页返回的 next_cursor
 
         Returns:
-            订单列表
+            订单列表；分页时返回 {'items': 订单列表, 'next_cursor': 下一页游标}
 
         安全措施：参数化查询
         """
@@ -256,16 +316,21 @@ class OrderModel:
                 JOIN T_Script s ON sch.Script_ID = s.Script_ID
                 JOIN T_Room r ON sch.Room_ID = r.Room_ID
                 WHERE o.Player_ID = %s
-                ORDER BY o.Create_Time DESC
             """
-            return SafeDatabase.execute_query(sql, (player_id,))
+
+            if limit is not None or cursor:
+                return paginate(sql, [player_id], 'o.Create_Time', 'o.Order_ID',
+                                'Create_Time', 'Order_ID', limit, cursor)
+
+            sql += " ORDER BY o.Create_Time DESC, o.Order_ID DESC"
+            return SafeDatabase.execute_query(sql, (player_id,), use_replica=True)
 
         except Exception as e:
             logger.error(f"查询玩家订单失败: {str(e)}")
             raise
 
     @staticmethod
-    def get_all_orders(dm_id=None):
+    def get_all_orders(dm_id=None, stream=False, limit=None, cursor=None, compact=False):
         """
         查询订单（员工/老板用）
 
@@ -274,6 +339,10 @@ class OrderModel:
 
         Args:
             dm_id: 可选，DM_ID 分域
+            stream: 为 True 时返回逐行产出的生成器（服务端游标，不整体加载到内存）
+            limit: 可选，每页条数（传 limit 或 cursor 时按键集分页返回，stream 不再生效）
+            cursor: 可选，上一页返回的 next_cursor
+            compact: 为 True 时返回 CompactResult（列名 + 元组行），分页时不生效
         """
         try:
             sql = """
@@ -295,9 +364,17 @@ class OrderModel:
                 sql += " AND sch.DM_ID = %s"
                 params.append(dm_id)
 
-            sql += " ORDER BY o.Create_Time DESC"
+            if limit is not None or cursor:
+                return paginate(sql, params, 'o.Create_Time', 'o.Order_ID',
+                                'Create_Time', 'Order_ID', limit, cursor)
+
+            sql += " ORDER BY o.Create_Time DESC, o.Order_ID DESC"
 
-            return SafeDatabase.execute_query(sql, tuple(params) if params else None)
+            if stream:
+                return SafeDatabase.execute_query_stream(sql, tuple(params) if params else None,
+                                                         use_replica=True, compact=compact)
+            return SafeDatabase.execute_query(sql, tuple(params) if params else None,
+                                              use_replica=True, compact=compact)
 
         except Exception as e:
             logger.error(f"查询订单失败: {str(e)}")
@@ -4,11 +4,17 @@
 """
 
 from database import SafeDatabase
+from date_range import period_range, range_condition
+from tracing import traced_model
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 报表结果缓存秒数：写入相关表后立即失效；含 NOW() 的统计最多滞后这么久
+REPORT_CACHE_TTL = 30
 
+
+@traced_model
 class ReportModel:
     """报表模型类"""
 
@@ -21,28 +27,38 @@ class ReportModel:
             包含今日、本周、本月营收和订单数的统计数据
         """
         try:
+            # 今日/本周/本月按 Trans_Time 的半开区间统计；外层再限定为三个周期的并集，
+            # 让 (Trans_Type, Result, Trans_Time) 索引只扫描本周和本月内的交易
+            today = period_range('day')
+            week = period_range('week')
+            month = period_range('month')
             sql = """
                 SELECT
-                    COALESCE(SUM(CASE WHEN DATE(t.Trans_Time) = CURDATE() THEN t.Amount ELSE 0 END), 0) AS today_revenue,
-                    COUNT(CASE WHEN DATE(t.Trans_Time) = CURDATE() THEN 1 END) AS today_orders,
+                    COALESCE(SUM(CASE WHEN t.Trans_Time >= %s AND t.Trans_Time < %s THEN t.Amount ELSE 0 END), 0) AS today_revenue,
+                    COUNT(CASE WHEN t.Trans_Time >= %s AND t.Trans_Time < %s THEN 1 END) AS today_orders,
 
-                    COALESCE(SUM(CASE WHEN YEARWEEK(t.Trans_Time, 1) = YEARWEEK(CURDATE(), 1) THEN t.Amount ELSE 0 END), 0) AS week_revenue,
-                    COUNT(CASE WHEN YEARWEEK(t.Trans_Time, 1) = YEARWEEK(CURDATE(), 1) THEN 1 END) AS week_orders,
+                    COALESCE(SUM(CASE WHEN t.Trans_Time >= %s AND t.Trans_Time < %s THEN t.Amount ELSE 0 END), 0) AS week_revenue,
+                    COUNT(CASE WHEN t.Trans_Time >= %s AND t.Trans_Time < %s THEN 1 END) AS week_orders,
 
-                    COALESCE(SUM(CASE WHEN DATE_FORMAT(t.Trans_Time, '%%Y-%%m') = DATE_FORMAT(CURDATE(), '%%Y-%%m') THEN t.Amount ELSE 0 END), 0) AS month_revenue,
-                    COUNT(CASE WHEN DATE_FORMAT(t.Trans_Time, '%%Y-%%m') = DATE_FORMAT(CURDATE(), '%%Y-%%m') THEN 1 END) AS month_orders
+                    COALESCE(SUM(CASE WHEN t.Trans_Time >= %s AND t.Trans_Time < %s THEN t.Amount ELSE 0 END), 0) AS month_revenue,
+                    COUNT(CASE WHEN t.Trans_Time >= %s AND t.Trans_Time < %s THEN 1 END) AS month_orders
                 FROM T_Transaction t
                 JOIN T_Order o ON t.Order_ID = o.Order_ID
                 JOIN T_Schedule sch ON o.Schedule_ID = sch.Schedule_ID
                 WHERE t.Trans_Type = 1 AND t.Result = 1
+                  AND t.Trans_Time >= %s AND t.Trans_Time < %s
             """
 
-            params = []
+            params = [*today, *today, *week, *week, *month, *month,
+                      min(week[0], month[0]), max(week[1], month[1])]
             if dm_id is not None:
                 sql += " AND sch.DM_ID = %s"
                 params.append(dm_id)
 
-            stats = SafeDatabase.execute_query(sql, tuple(params) if params else None, fetch_one=True) or {}
+            stats = SafeDatabase.execute_query(
+                sql, tuple(params) if params else None, fetch_one=True, use_replica=True,
+                cache_tables=('T_Transaction', 'T_Order', 'T_Schedule'), cache_ttl=REPORT_CACHE_TTL
+            ) or {}
 
             # 活跃锁位数（未过期）
             lock_sql = """
@@ -55,7 +71,10 @@ class ReportModel:
             if dm_id is not None:
                 lock_sql += " AND sch.DM_ID = %s"
                 lock_params.append(dm_id)
-            lock_row = SafeDatabase.execute_query(lock_sql, tuple(lock_params) if lock_params else None, fetch_one=True) or {}
+            lock_row = SafeDatabase.execute_query(
+                lock_sql, tuple(lock_params) if lock_params else None, fetch_one=True, use_replica=True,
+                cache_tables=('t_lock_record', 'T_Schedule'), cache_ttl=REPORT_CACHE_TTL
+            ) or {}
             stats['active_locks'] = lock_row.get('active_locks', 0)
 
             # 未来7天上座率（预约+锁位 / 容量）
@@ -68,10 +87,7 @@ class ReportModel:
                         sch.Schedule_ID,
                         sch.DM_ID,
                         sc.Max_Players AS capacity,
-                        (SELECT COUNT(*) FROM T_Order o
-                         WHERE o.Schedule_ID = sch.Schedule_ID AND o.Pay_Status IN (0, 1)) +
-                        (SELECT COUNT(*) FROM t_lock_record l
-                         WHERE l.Schedule_ID = sch.Schedule_ID AND l.Status = 0 AND l.ExpireTime > NOW()) AS occupied
+                        sch.Booked_Count + sch.Locked_Count AS occupied
                     FROM T_Schedule sch
                     JOIN T_Script sc ON sch.Script_ID = sc.Script_ID
                     WHERE sch.Start_Time >= NOW()
@@ -84,7 +100,10 @@ class ReportModel:
             if dm_id is not None:
                 occ_sql += " AND t.DM_ID = %s"
                 occ_params.append(dm_id)
-            occ = SafeDatabase.execute_query(occ_sql, tuple(occ_params) if occ_params else None, fetch_one=True) or {}
+            occ = SafeDatabase.execute_query(
+                occ_sql, tuple(occ_params) if occ_params else None, fetch_one=True, use_replica=True,
+                cache_tables=('T_Schedule', 'T_Script'), cache_ttl=REPORT_CACHE_TTL
+            ) or {}
             occupied = float(occ.get('occupied', 0) or 0)
             capacity = float(occ.get('capacity', 0) or 0)
             stats['occupancy_rate'] = round((occupied / capacity) * 100, 2) if capacity > 0 else 0.0
@@ -109,7 +128,10 @@ class ReportModel:
                 recent_sql += " AND sch.DM_ID = %s"
                 recent_params.append(dm_id)
             recent_sql += " ORDER BY o.Create_Time DESC LIMIT 10"
-            stats['recent_orders'] = SafeDatabase.execute_query(recent_sql, tuple(recent_params) if recent_params else None) or []
+            stats['recent_orders'] = SafeDatabase.execute_query(
+                recent_sql, tuple(recent_params) if recent_params else None, use_replica=True,
+                cache_tables=('T_Order', 'T_Schedule', 'T_Script', 'T_Room', 'T_DM'), cache_ttl=REPORT_CACHE_TTL
+            ) or []
 
             # 即将开始的场次（10条）
             up_sql = """
@@ -124,10 +146,8 @@ class ReportModel:
                     sc.Script_ID,
                     sc.Title AS Script_Title,
                     sc.Max_Players,
-                    (SELECT COUNT(*) FROM T_Order o
-                     WHERE o.Schedule_ID = sch.Schedule_ID AND o.Pay_Status IN (0, 1)) AS Booked_Count,
-                    (SELECT COUNT(*) FROM t_lock_record l
-                     WHERE l.Schedule_ID = sch.Schedule_ID AND l.Status = 0 AND l.ExpireTime > NOW()) AS Locked_Count
+                    sch.Booked_Count,
+                    sch.Locked_Count
                 FROM T_Schedule sch
                 JOIN T_Room r ON sch.Room_ID = r.Room_ID
                 JOIN T_DM d ON sch.DM_ID = d.DM_ID
@@ -139,7 +159,11 @@ class ReportModel:
                 up_sql += " AND sch.DM_ID = %s"
                 up_params.append(dm_id)
             up_sql += " ORDER BY sch.Start_Time LIMIT 10"
-            stats['upcoming_schedules'] = SafeDatabase.execute_query(up_sql, tuple(up_params) if up_params else None) or []
+            stats['upcoming_schedules'] = SafeDatabase.execute_query(
+                up_sql, tuple(up_params) if up_params else None, use_replica=True,
+                cache_tables=('T_Schedule', 'T_Room', 'T_DM', 'T_Script'),
+                cache_ttl=REPORT_CACHE_TTL
+            ) or []
 
             logger.info("查询仪表盘统计成功")
             return stats
@@ -154,8 +178,8 @@ class ReportModel:
         获取热门剧本Top N
 
         Args:
-            start_date: 开始日期
-            end_date: 结束日期
+            start_date: 开始日期（YYYY-MM-DD）
+            end_date: 结束日期（YYYY-MM-DD，包含当天）
             limit: 返回数量
 
         Returns:
@@ -177,13 +201,9 @@ class ReportModel:
 
             params = []
 
-            if start_date:
-                sql += " AND DATE(o.Create_Time) >= %s"
-                params.append(start_date)
-
-            if end_date:
-                sql += " AND DATE(o.Create_Time) <= %s"
-                params.append(end_date)
+            date_sql, date_params = range_condition('o.Create_Time', start_date, end_date)
+            sql += date_sql
+            params.extend(date_params)
 
             if dm_id is not None:
                 sql += " AND sch.DM_ID = %s"
@@ -196,7 +216,10 @@ class ReportModel:
             """
             params.append(limit)
 
-            scripts = SafeDatabase.execute_query(sql, tuple(params))
+            scripts = SafeDatabase.execute_query(
+                sql, tuple(params), use_replica=True,
+                cache_tables=('T_Script', 'T_Schedule', 'T_Order'), cache_ttl=REPORT_CACHE_TTL
+            )
             logger.info(f"查询热门剧本成功，返回{len(scripts)}条")
             return scripts
 
@@ -210,8 +233,8 @@ class ReportModel:
         获取房间利用率统计
 
         Args:
-            start_date: 开始日期
-            end_date: 结束日期
+            start_date: 开始日期（YYYY-MM-DD）
+            end_date: 结束日期（YYYY-MM-DD，包含当天）
 
         Returns:
             房间利用率列表
@@ -239,13 +262,9 @@ class ReportModel:
 
             params = []
 
-            if start_date:
-                sql += " AND DATE(sch.Start_Time) >= %s"
-                params.append(start_date)
-
-            if end_date:
-                sql += " AND DATE(sch.Start_Time) <= %s"
-                params.append(end_date)
+            date_sql, date_params = range_condition('sch.Start_Time', start_date, end_date)
+            sql += date_sql
+            params.extend(date_params)
 
             if dm_id is not None:
                 sql += " AND sch.DM_ID = %s"
@@ -256,7 +275,10 @@ class ReportModel:
                 ORDER BY utilization_rate DESC
             """
 
-            rooms = SafeDatabase.execute_query(sql, tuple(params) if params else None)
+            rooms = SafeDatabase.execute_query(
+                sql, tuple(params) if params else None, use_replica=True,
+                cache_tables=('T_Room', 'T_Schedule', 'T_Order'), cache_ttl=REPORT_CACHE_TTL
+            )
             logger.info(f"查询房间利用率成功，返回{len(rooms)}条")
             return rooms
 
@@ -270,8 +292,8 @@ class ReportModel:
         获取锁位转化率统计
 
         Args:
-            start_date: 开始日期
-            end_date: 结束日期
+            start_date: 开始日期（YYYY-MM-DD）
+            end_date: 结束日期（YYYY-MM-DD，包含当天）
 
         Returns:
             锁位转化率数据
@@ -305,19 +327,18 @@ class ReportModel:
 
             params = []
 
-            if start_date:
-                sql += " AND DATE(l.LockTime) >= %s"
-                params.append(start_date)
-
-            if end_date:
-                sql += " AND DATE(l.LockTime) <= %s"
-                params.append(end_date)
+            date_sql, date_params = range_condition('l.LockTime', start_date, end_date)
+            sql += date_sql
+            params.extend(date_params)
 
             if dm_id is not None:
                 sql += " AND sch.DM_ID = %s"
                 params.append(dm_id)
 
-            result = SafeDatabase.execute_query(sql, tuple(params) if params else None, fetch_one=True) or {}
+            result = SafeDatabase.execute_query(
+                sql, tuple(params) if params else None, fetch_one=True, use_replica=True,
+                cache_tables=('t_lock_record', 'T_Order', 'T_Schedule'), cache_ttl=REPORT_CACHE_TTL
+            ) or {}
             logger.info("查询锁位转化率成功")
             return result
 
@@ -354,19 +375,20 @@ class ReportModel:
             """
 
             params = []
-            if start_date:
-                sql += " AND DATE(sch.Start_Time) >= %s"
-                params.append(start_date)
-            if end_date:
-                sql += " AND DATE(sch.Start_Time) <= %s"
-                params.append(end_date)
+            date_sql, date_params = range_condition('sch.Start_Time', start_date, end_date)
+            sql += date_sql
+            params.extend(date_params)
 
             sql += """
                 GROUP BY d.DM_ID, d.Name, d.Phone, d.Star_Level
                 ORDER BY revenue DESC, paid_orders DESC, order_count DESC
             """
 
-            return SafeDatabase.execute_query(sql, tuple(params) if params else None) or []
+            return SafeDatabase.execute_query(
+                sql, tuple(params) if params else None, use_replica=True,
+                cache_tables=('T_DM', 'T_Schedule', 'T_Order', 'T_Transaction', 't_lock_record'),
+                cache_ttl=REPORT_CACHE_TTL
+            ) or []
         except Exception as e:
             logger.error(f"查询DM业绩失败: {str(e)}")
             raise
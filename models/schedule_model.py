@@ -3,13 +3,22 @@
 场次模型 - 处理场次相关的业务逻辑
 """
 
-from database import SafeDatabase
+from database import SafeDatabase, current_unit_of_work
+from date_range import range_condition
+from id_allocator import next_id
+from pagination import paginate
+from tracing import traced_model
 from security_utils import InputValidator
+from seat_inventory import seat_inventory
+import seat_events
+from collections import Counter
+from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@traced_model
 class ScheduleModel:
     """场次模型类"""
 
@@ -23,12 +32,13 @@ class ScheduleModel:
             player_id: 玩家ID（可选，用于查询该玩家是否已预约）
 
         Returns:
-            场次列表（包含 User_Booked 字段表示当前玩家是否已预约）
+            场次列表（Booked_Count / Locked_Count / Next_Lock_Expire 为余位投影；
+            传 player_id 时包含 User_Booked / User_Locked 表示当前玩家是否已预约/锁位）
         """
         try:
             script_id = InputValidator.validate_id(script_id, "剧本ID")
 
-            # 基础查询
+            # 余位直接读场次行上的投影列（Booked_Count / Locked_Count / Next_Lock_Expire），不逐场次统计明细
             sql = """
                 SELECT
                     sch.Schedule_ID,
@@ -40,32 +50,9 @@ class ScheduleModel:
                     d.Name AS DM_Name,
                     s.Title AS Script_Title,
                     s.Max_Players,
-                    (SELECT COUNT(*) FROM T_Order o
-                     WHERE o.Schedule_ID = sch.Schedule_ID
-                     AND o.Pay_Status IN (0, 1)) AS Booked_Count,
-                    (SELECT COUNT(*) FROM t_lock_record l
-                     WHERE l.Schedule_ID = sch.Schedule_ID
-                     AND l.Status = 0
-                     AND l.ExpireTime > NOW()) AS Locked_Count
-            """
-
-            # 如果提供了玩家ID，添加该玩家的预约状态查询
-            if player_id:
-                sql += """,
-                    (SELECT COUNT(*) FROM T_Order o
-                     WHERE o.Schedule_ID = sch.Schedule_ID
-                     AND o.Player_ID = %s
-                     AND o.Pay_Status IN (0, 1)) AS User_Booked
-                """
-                sql += """,
-                    (SELECT COUNT(*) FROM t_lock_record l
-                     WHERE l.Schedule_ID = sch.Schedule_ID
-                     AND l.Player_ID = %s
-                     AND l.Status = 0
-                     AND l.ExpireTime > NOW()) AS User_Locked
-                """
-
-            sql += """
+                    sch.Booked_Count,
+                    sch.Locked_Count,
+                    sch.Next_Lock_Expire
                 FROM T_Schedule sch
                 JOIN T_Room r ON sch.Room_ID = r.Room_ID
                 JOIN T_DM d ON sch.DM_ID = d.DM_ID
@@ -75,10 +62,31 @@ class ScheduleModel:
                 AND sch.Status IN (0, 1)
                 ORDER BY sch.Start_Time
             """
+            schedules = SafeDatabase.execute_query(sql, (script_id,), use_replica=True)
+
+            # 如果提供了玩家ID，按玩家索引一次取出其有效订单/锁位（不再对每个场次执行两个相关子查询）；
+            # 该接口不需要登录，没有按调用方设置的读己之写窗口，玩家自己的预约/锁位固定读主库，
+            # 刚锁位/下单后不会因副本延迟显示为未预约
+            if player_id:
+                mine = SafeDatabase.execute_query("""
+                    SELECT o.Schedule_ID, 'order' AS Kind
+                    FROM T_Order o
+                    JOIN T_Schedule sch ON sch.Schedule_ID = o.Schedule_ID
+                    WHERE o.Player_ID = %s AND o.Pay_Status IN (0, 1)
+                    AND sch.Script_ID = %s AND sch.Start_Time > NOW()
+                    UNION ALL
+                    SELECT l.Schedule_ID, 'lock' AS Kind
+                    FROM t_lock_record l
+                    JOIN T_Schedule sch ON sch.Schedule_ID = l.Schedule_ID
+                    WHERE l.Player_ID = %s AND l.Status = 0 AND l.ExpireTime > NOW()
+                    AND sch.Script_ID = %s AND sch.Start_Time > NOW()
+                """, (player_id, script_id, player_id, script_id), use_replica=False)
+                booked = Counter(row['Schedule_ID'] for row in mine if row['Kind'] == 'order')
+                locked = Counter(row['Schedule_ID'] for row in mine if row['Kind'] == 'lock')
+                for schedule in schedules:
+                    schedule['User_Booked'] = booked[schedule['Schedule_ID']]
+                    schedule['User_Locked'] = locked[schedule['Schedule_ID']]
 
-            # 根据是否有玩家ID决定参数（User_Booked + User_Locked 都需要 player_id）
-            params = (player_id, player_id, script_id) if player_id else (script_id,)
-            schedules = SafeDatabase.execute_query(sql, params)
             logger.info(f"查询剧本场次成功: Script_ID={script_id}, 返回{len(schedules)}条")
             return schedules
 
@@ -87,7 +95,8 @@ class ScheduleModel:
             raise
 
     @staticmethod
-    def get_all_schedules(date=None, room_id=None, script_id=None, status=None, dm_id=None):
+    def get_all_schedules(date=None, room_id=None, script_id=None, status=None, dm_id=None,
+                          limit=None, cursor=None, compact=False):
         """
         获取所有场次列表（员工管理用）
 
@@ -96,9 +105,13 @@ class ScheduleModel:
             room_id: 房间ID筛选
             script_id: 剧本ID筛选
             status: 状态筛选
+            dm_id: DM_ID 分域
+            limit: 可选，每页条数（传 limit 或 cursor 时按键集分页返回）
+            cursor: 可选，上一页返回的 next_cursor
+            compact: 为 True 时返回 CompactResult（列名 + 元组行），分页时不生效
 
         Returns:
-            场次列表
+            场次列表；分页时返回 {'items': 场次列表, 'next_cursor': 下一页游标}
         """
         try:
             sql = """
@@ -115,13 +128,9 @@ class ScheduleModel:
                     s.Script_ID,
                     s.Title AS Script_Title,
                     s.Max_Players,
-                    (SELECT COUNT(*) FROM T_Order o
-                     WHERE o.Schedule_ID = sch.Schedule_ID
-                     AND o.Pay_Status IN (0, 1)) AS Booked_Count,
-                    (SELECT COUNT(*) FROM t_lock_record l
-                     WHERE l.Schedule_ID = sch.Schedule_ID
-                     AND l.Status = 0
-                     AND l.ExpireTime > NOW()) AS Locked_Count
+                    sch.Booked_Count,
+                    sch.Locked_Count,
+                    sch.Next_Lock_Expire
                 FROM T_Schedule sch
                 JOIN T_Room r ON sch.Room_ID = r.Room_ID
                 JOIN T_DM d ON sch.DM_ID = d.DM_ID
@@ -132,8 +141,9 @@ class ScheduleModel:
             params = []
 
             if date:
-                sql += " AND DATE(sch.Start_Time) = %s"
-                params.append(date)
+                date_sql, date_params = range_condition('sch.Start_Time', date, date)
+                sql += date_sql
+                params.extend(date_params)
 
             if room_id:
                 sql += " AND sch.Room_ID = %s"
@@ -151,9 +161,15 @@ class ScheduleModel:
                 sql += " AND sch.DM_ID = %s"
                 params.append(dm_id)
 
-            sql += " ORDER BY sch.Start_Time DESC"
+            if limit is not None or cursor:
+                page = paginate(sql, params, 'sch.Start_Time', 'sch.Schedule_ID',
+                                'Start_Time', 'Schedule_ID', limit, cursor)
+                logger.info(f"分页查询场次成功，返回{len(page['items'])}条")
+                return page
+
+            sql += " ORDER BY sch.Start_Time DESC, sch.Schedule_ID DESC"
 
-            schedules = SafeDatabase.execute_query(sql, tuple(params))
+            schedules = SafeDatabase.execute_query(sql, tuple(params), use_replica=True, compact=compact)
             logger.info(f"查询所有场次成功，返回{len(schedules)}条")
             return schedules
 
@@ -182,14 +198,16 @@ class ScheduleModel:
             room_id = InputValidator.validate_id(room_id, "房间ID")
             dm_id = InputValidator.validate_id(dm_id, "DM ID")
 
+            # Schedule_ID 无自增，从号段中分配
+            schedule_id = next_id('schedule')
             sql = """
-                INSERT INTO T_Schedule (Script_ID, Room_ID, DM_ID, Start_Time, End_Time, Real_Price, Status)
-                VALUES (%s, %s, %s, %s, %s, %s, 0)
+                INSERT INTO T_Schedule (Schedule_ID, Script_ID, Room_ID, DM_ID, Start_Time, End_Time, Real_Price, Status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 0)
             """
 
-            schedule_id = SafeDatabase.execute_update(
+            SafeDatabase.execute_update(
                 sql,
-                (script_id, room_id, dm_id, start_time, end_time, real_price)
+                (schedule_id, script_id, room_id, dm_id, start_time, end_time, real_price)
             )
 
             logger.info(f"创建场次成功: Schedule_ID={schedule_id}")
@@ -199,6 +217,49 @@ class ScheduleModel:
             logger.error(f"创建场次失败: {str(e)}")
             raise
 
+    @staticmethod
+    def bulk_create_schedules(schedules, batch_size=500):
+        """
+        批量创建场次（排期导入/演示数据初始化用）
+
+        Args:
+            schedules: 场次字典列表，字段同 create_schedule：
+                       script_id, room_id, dm_id, start_time, end_time, real_price
+            batch_size: 每批写入行数（每批一条多行 INSERT）
+
+        Returns:
+            插入的行数
+        """
+        try:
+            rows = []
+            for item in schedules:
+                rows.append((
+                    next_id('schedule'),
+                    InputValidator.validate_id(item['script_id'], "剧本ID"),
+                    InputValidator.validate_id(item['room_id'], "房间ID"),
+                    InputValidator.validate_id(item['dm_id'], "DM ID"),
+                    item['start_time'],
+                    item['end_time'],
+                    item['real_price'],
+                    0,
+                ))
+
+            if not rows:
+                return 0
+
+            sql = """
+                INSERT INTO T_Schedule (Schedule_ID, Script_ID, Room_ID, DM_ID, Start_Time, End_Time, Real_Price, Status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """
+            # VALUES 中只能出现占位符，pymysql 才会把整批改写成一条多行 INSERT
+            affected = SafeDatabase.execute_many(sql, rows, batch_size=batch_size)
+            logger.info(f"批量创建场次成功: 共{affected}条")
+            return affected
+
+        except Exception as e:
+            logger.error(f"批量创建场次失败: {str(e)}")
+            raise
+
     @staticmethod
     def update_schedule(schedule_id, script_id=None, room_id=None, dm_id=None,
                        start_time=None, end_time=None, real_price=None, status=None):
@@ -253,6 +314,9 @@ class ScheduleModel:
             sql = f"UPDATE T_Schedule SET {', '.join(updates)} WHERE Schedule_ID = %s"
 
             affected = SafeDatabase.execute_update(sql, tuple(params))
+            if script_id is not None or status is not None:
+                # 容量（剧本人数）或场次状态变化，座位库存重新加载
+                seat_inventory.invalidate(schedule_id)
             logger.info(f"更新场次成功: Schedule_ID={schedule_id}")
             return affected
 
@@ -287,6 +351,7 @@ class ScheduleModel:
 
             sql = "UPDATE T_Schedule SET Status = 2 WHERE Schedule_ID = %s"
             affected = SafeDatabase.execute_update(sql, (schedule_id,))
+            seat_inventory.invalidate(schedule_id)
 
             logger.info(f"取消场次成功: Schedule_ID={schedule_id}")
             return affected
@@ -294,3 +359,218 @@ class ScheduleModel:
         except Exception as e:
             logger.error(f"取消场次失败: {str(e)}")
             raise
+
+    @staticmethod
+    def lock_schedule_row(schedule_id):
+        """
+        对场次行加排他锁，返回价格、容量和占用计数（必须在事务内调用）
+
+        所有会改变占用计数的写操作（预约、锁位、取消、过期、核对）都先锁场次行再改订单/锁位，
+        同一场次的写操作在这里排队，加锁顺序一致，计数与明细在同一事务内一起变更。
+        等锁时间受 innodb_lock_wait_timeout 限制，超时（1205）由 retry_on_conflict 重试。
+        """
+        if current_unit_of_work() is None:
+            raise RuntimeError("场次行锁必须在工作单元内获取（with SafeDatabase.unit_of_work()）")
+
+        sql = """
+            SELECT sch.Schedule_ID, sch.Real_Price, sch.Booked_Count, sch.Locked_Count, sch.Next_Lock_Expire,
+                   (SELECT sc.Max_Players FROM T_Script sc WHERE sc.Script_ID = sch.Script_ID) AS Max_Players
+            FROM T_Schedule sch
+            WHERE sch.Schedule_ID = %s
+            FOR UPDATE
+        """
+        schedule = SafeDatabase.execute_query(sql, (schedule_id,), fetch_one=True)
+        if not schedule:
+            raise ValueError(f"场次 {schedule_id} 不存在")
+        return schedule
+
+    @staticmethod
+    def adjust_counts(schedule_id, booked=0, locked=0):
+        """
+        调整场次占用计数（调用方已持有场次行锁）
+
+        booked/locked 传本事务实际变更的订单/锁位行数（UPDATE ... AND Status = 0 的影响行数），
+        不按事先读到的状态推算，避免与并发的取消/过期重复加减。
+        锁位数有增减时按本场次剩余的锁位重新取 Next_Lock_Expire（idx_lock_schedule_expire 上的一次 MIN）。
+        """
+        if locked:
+            SafeDatabase.execute_update(
+                "UPDATE T_Schedule SET Booked_Count = Booked_Count + %s, Locked_Count = Locked_Count + %s, "
+                "Next_Lock_Expire = (SELECT MIN(l.ExpireTime) FROM t_lock_record l "
+                "WHERE l.Schedule_ID = %s AND l.Status = 0) "
+                "WHERE Schedule_ID = %s",
+                (booked, locked, schedule_id, schedule_id)
+            )
+        elif booked:
+            SafeDatabase.execute_update(
+                "UPDATE T_Schedule SET Booked_Count = Booked_Count + %s WHERE Schedule_ID = %s",
+                (booked, schedule_id)
+            )
+
+    @staticmethod
+    def expire_locks(schedule_id):
+        """
+        把本场次已过期的锁位标记为已过期（Status=3）并扣减 Locked_Count（调用方已持有场次行锁）
+
+        提交后每条过期的锁位发布一个 seat_freed 事件（reason='expired'）。
+
+        Returns:
+            过期的锁位条数
+        """
+        rows = SafeDatabase.execute_query(
+            "SELECT LockID, Player_ID, ExpireTime FROM t_lock_record "
+            "WHERE Schedule_ID = %s AND Status = 0 AND ExpireTime <= NOW() FOR UPDATE",
+            (schedule_id,)
+        )
+        if not rows:
+            return 0
+
+        expired = SafeDatabase.execute_update(
+            f"UPDATE t_lock_record SET Status = 3 WHERE LockID IN ({', '.join(['%s'] * len(rows))}) AND Status = 0",
+            tuple(row['LockID'] for row in rows)
+        )
+        ScheduleModel.adjust_counts(schedule_id, locked=-expired)
+        for row in rows:
+            seat_events.publish(seat_events.SEAT_FREED, schedule_id=schedule_id, player_id=row['Player_ID'],
+                                seats=1, reason='expired', lock_id=row['LockID'], expire_time=row['ExpireTime'])
+        return expired
+
+    @staticmethod
+    def lock_for_booking(schedule_id, player_id):
+        """
+        锁住场次并读取占用名额（预约/锁位的容量校验，必须在事务内调用）
+
+        先锁场次行（lock_schedule_row），顺带把本场次已过期的锁位置为过期，
+        容量校验读行上的 Booked_Count / Locked_Count，不再逐条统计订单和锁位；
+        该玩家自己的订单/锁位用当前读（LOCK IN SHARE MODE）按索引点查。
+        调用方在同一事务内完成校验、插入和计数调整，提交时释放行锁。
+
+        Args:
+            schedule_id: 场次ID
+            player_id: 玩家ID
+
+        Returns:
+            dict: Schedule_ID, Real_Price, Max_Players, Booked_Count, Locked_Count,
+                  player_order_id（该玩家在本场次的有效订单，没有为 None）,
+                  player_lock_id（该玩家在本场次的有效锁位，没有为 None）
+        """
+        schedule = ScheduleModel.lock_schedule_row(schedule_id)
+        schedule['Locked_Count'] -= ScheduleModel.expire_locks(schedule_id)
+
+        order = SafeDatabase.execute_query("""
+            SELECT Order_ID FROM T_Order
+            WHERE Schedule_ID = %s AND Player_ID = %s AND Pay_Status IN (0, 1)
+            LIMIT 1 LOCK IN SHARE MODE
+        """, (schedule_id, player_id), fetch_one=True)
+        lock = SafeDatabase.execute_query("""
+            SELECT LockID FROM t_lock_record
+            WHERE Schedule_ID = %s AND Player_ID = %s AND Status = 0
+            LIMIT 1 LOCK IN SHARE MODE
+        """, (schedule_id, player_id), fetch_one=True)
+
+        schedule['player_order_id'] = order['Order_ID'] if order else None
+        schedule['player_lock_id'] = lock['LockID'] if lock else None
+        return schedule
+
+    @staticmethod
+    def reconcile_counts(schedule_ids=None, dry_run=False):
+        """
+        核对并修复场次余位投影：占用计数和最早锁位到期时间（以订单/锁位明细为准）
+
+        不传 schedule_ids 时先用一条聚合查询找出计数与明细对不上的场次：计数和明细总在同一事务内提交，
+        一致性快照里对不上的就是漂移（绕过后端直接改库、手工修数据等）；
+        再逐个场次锁行、按当前数据重新统计后写回，不会与正在进行的预约/锁位互相覆盖。
+
+        Args:
+            schedule_ids: 只核对这些场次（批量导入订单后使用）
+            dry_run: 只报告不修复
+
+        Returns:
+            有漂移的场次列表：Schedule_ID, Booked_Count, Locked_Count, Next_Lock_Expire（原值）,
+            booked, locked, next_expire（按明细统计）
+        """
+        try:
+            if schedule_ids is None:
+                drift_sql = """
+                    SELECT sch.Schedule_ID
+                    FROM T_Schedule sch
+                    LEFT JOIN (
+                        SELECT Schedule_ID, COUNT(*) AS cnt FROM T_Order
+                        WHERE Pay_Status IN (0, 1) GROUP BY Schedule_ID
+                    ) o ON o.Schedule_ID = sch.Schedule_ID
+                    LEFT JOIN (
+                        SELECT Schedule_ID, COUNT(*) AS cnt, MIN(ExpireTime) AS next_expire FROM t_lock_record
+                        WHERE Status = 0 GROUP BY Schedule_ID
+                    ) l ON l.Schedule_ID = sch.Schedule_ID
+                    WHERE sch.Booked_Count <> COALESCE(o.cnt, 0)
+                       OR sch.Locked_Count <> COALESCE(l.cnt, 0)
+                       OR COALESCE(sch.Next_Lock_Expire, '1000-01-01') <> COALESCE(l.next_expire, '1000-01-01')
+                """
+                schedule_ids = [row['Schedule_ID'] for row in SafeDatabase.execute_query(drift_sql)]
+
+            drifted = []
+            for schedule_id in sorted(set(schedule_ids)):
+                with SafeDatabase.unit_of_work():
+                    schedule = ScheduleModel.lock_schedule_row(schedule_id)
+                    booked = SafeDatabase.execute_query(
+                        "SELECT COUNT(*) AS cnt FROM T_Order WHERE Schedule_ID = %s AND Pay_Status IN (0, 1) "
+                        "LOCK IN SHARE MODE", (schedule_id,), fetch_one=True)['cnt']
+                    locks = SafeDatabase.execute_query(
+                        "SELECT COUNT(*) AS cnt, MIN(ExpireTime) AS next_expire FROM t_lock_record "
+                        "WHERE Schedule_ID = %s AND Status = 0 LOCK IN SHARE MODE", (schedule_id,), fetch_one=True)
+                    locked, next_expire = locks['cnt'], locks['next_expire']
+                    if isinstance(next_expire, str):
+                        next_expire = datetime.fromisoformat(next_expire)   # SQLite 的聚合结果不带列类型
+                    if (booked, locked, next_expire) == (schedule['Booked_Count'], schedule['Locked_Count'],
+                                                         schedule['Next_Lock_Expire']):
+                        continue
+                    if not dry_run:
+                        SafeDatabase.execute_update(
+                            "UPDATE T_Schedule SET Booked_Count = %s, Locked_Count = %s, Next_Lock_Expire = %s "
+                            "WHERE Schedule_ID = %s",
+                            (booked, locked, next_expire, schedule_id)
+                        )
+                        # 明细被绕过后端改过，座位库存同样不可信
+                        seat_inventory.invalidate(schedule_id)
+                    drifted.append({
+                        'Schedule_ID': schedule_id,
+                        'Booked_Count': schedule['Booked_Count'], 'Locked_Count': schedule['Locked_Count'],
+                        'Next_Lock_Expire': schedule['Next_Lock_Expire'],
+                        'booked': booked, 'locked': locked, 'next_expire': next_expire,
+                    })
+
+            if drifted:
+                logger.warning(f"场次占用计数漂移{'（未修复）' if dry_run else '已修复'}: {len(drifted)} 个场次")
+            return drifted
+
+        except Exception as e:
+            logger.error(f"核对场次占用计数失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def rebuild_counts():
+        """
+        按订单/锁位明细整体重建所有场次的余位投影（Booked_Count / Locked_Count / Next_Lock_Expire）
+
+        一条语句更新整张 T_Schedule，执行期间锁住全部场次行，预约/锁位会排队等待；
+        用于迁移后、批量修数据后或维护窗口内，日常检查用 reconcile_counts。
+
+        Returns:
+            更新的场次数
+        """
+        try:
+            affected = SafeDatabase.execute_update("""
+                UPDATE T_Schedule
+                SET Booked_Count = (SELECT COUNT(*) FROM T_Order o
+                                    WHERE o.Schedule_ID = T_Schedule.Schedule_ID AND o.Pay_Status IN (0, 1)),
+                    Locked_Count = (SELECT COUNT(*) FROM t_lock_record l
+                                    WHERE l.Schedule_ID = T_Schedule.Schedule_ID AND l.Status = 0),
+                    Next_Lock_Expire = (SELECT MIN(l.ExpireTime) FROM t_lock_record l
+                                        WHERE l.Schedule_ID = T_Schedule.Schedule_ID AND l.Status = 0)
+            """)
+            logger.warning(f"场次余位投影已重建: {affected} 个场次")
+            return affected
+
+        except Exception as e:
+            logger.error(f"重建场次余位投影失败: {str(e)}")
+            raise
@@ -5,12 +5,17 @@
 """
 
 from database import SafeDatabase
+from tracing import traced_model
 from security_utils import InputValidator
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 剧本信息只在后台维护时变化，缓存依赖的表
+SCRIPT_TABLES = ('T_Script', 'T_Script_Profile')
 
+
+@traced_model
 class ScriptModel:
     """剧本模型类 - 处理剧本相关的业务逻辑"""
 
@@ -40,7 +45,7 @@ class ScriptModel:
                     WHERE s.Status = %s
                     ORDER BY s.Script_ID
                 """
-                return SafeDatabase.execute_query(sql, (status,))
+                return SafeDatabase.execute_query(sql, (status,), use_replica=True, cache_tables=SCRIPT_TABLES)
             else:
                 sql = """
                     SELECT s.Script_ID, s.Title, s.Type, s.Min_Players, s.Max_Players,
@@ -50,7 +55,7 @@ class ScriptModel:
                     LEFT JOIN T_Script_Profile p ON s.Script_ID = p.Script_ID
                     ORDER BY s.Script_ID
                 """
-                return SafeDatabase.execute_query(sql)
+                return SafeDatabase.execute_query(sql, use_replica=True, cache_tables=SCRIPT_TABLES)
 
         except Exception as e:
             logger.error(f"获取剧本列表失败: {str(e)}")
@@ -83,7 +88,8 @@ class ScriptModel:
                 LEFT JOIN T_Script_Profile p ON s.Script_ID = p.Script_ID
                 WHERE s.Script_ID = %s
             """
-            result = SafeDatabase.execute_query(sql, (script_id,), fetch_one=True)
+            result = SafeDatabase.execute_query(sql, (script_id,), fetch_one=True, use_replica=True,
+                                                 cache_tables=SCRIPT_TABLES)
 
             if not result:
                 raise ValueError(f"剧本ID {script_id} 不存在")
@@ -124,7 +130,8 @@ class ScriptModel:
                 ORDER BY paid_orders DESC, total_amount DESC
                 LIMIT %s
             """
-            results = SafeDatabase.execute_query(sql, (limit,))
+            results = SafeDatabase.execute_query(sql, (limit,), use_replica=True,
+                                                  cache_tables=SCRIPT_TABLES + ('T_Schedule', 'T_Order'))
 
             # 添加排名信息
             for idx, script in enumerate(results):
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+候补模型 - 场次已满时排队候补，空出名额后按加入顺序自动锁位
+"""
+
+from database import SafeDatabase, retry_on_conflict
+from database_config import WAITLIST_CONFIG
+from id_allocator import next_id
+from models.schedule_model import ScheduleModel
+from seat_inventory import seat_inventory
+from security_utils import InputValidator
+import seat_events
+import snowflake
+from tracing import traced_model
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@traced_model
+class WaitlistModel:
+    """候补模型类"""
+
+    # 候补状态
+    STATUS_WAITING = 0      # 候补中
+    STATUS_PROMOTED = 1     # 已获得名额
+    STATUS_CANCELLED = 2    # 已取消
+    STATUS_EXPIRED = 3      # 已失效（场次已开始/已取消）
+
+    # 空出的名额留给排在前面的候补玩家时，直接锁位/下单的拒绝原因
+    QUEUE_AHEAD = "该场次有玩家在候补，请加入候补队列"
+
+    @staticmethod
+    @retry_on_conflict
+    def join(player_id, schedule_id):
+        """
+        加入场次候补队列
+
+        只有场次已满（或空出的名额已被排在前面的候补占满）时才能候补；与锁位/预约一样先锁场次行，
+        同一场次的候补、锁位、提升在这里排队，排名与名额判断不会交错。
+
+        Returns:
+            dict: wait_id, position（从 1 开始的排名）
+        """
+        try:
+            player_id = InputValidator.validate_id(player_id, "玩家ID")
+            schedule_id = InputValidator.validate_id(schedule_id, "场次ID")
+
+            # Wait_ID 按时间递增，排队顺序即 Wait_ID 顺序（多进程下同样成立）
+            wait_id = snowflake.next_id()
+
+            with SafeDatabase.unit_of_work():
+                seat = ScheduleModel.lock_for_booking(schedule_id, player_id)
+                if seat['player_order_id']:
+                    raise ValueError("您已经预约过该场次")
+                if seat['player_lock_id']:
+                    raise ValueError("您已经锁定了该场次")
+
+                schedule = SafeDatabase.execute_query(
+                    "SELECT Status, Start_Time FROM T_Schedule WHERE Schedule_ID = %s",
+                    (schedule_id,), fetch_one=True)
+                if schedule['Status'] not in (0, 1) or schedule['Start_Time'] <= datetime.now():
+                    raise ValueError("该场次不可候补")
+
+                existing = SafeDatabase.execute_query("""
+                    SELECT Wait_ID FROM T_Waitlist
+                    WHERE Schedule_ID = %s AND Player_ID = %s AND Status = 0
+                    LIMIT 1 LOCK IN SHARE MODE
+                """, (schedule_id, player_id), fetch_one=True)
+                if existing:
+                    raise ValueError("您已在该场次的候补队列中")
+
+                waiting = SafeDatabase.execute_query(
+                    "SELECT COUNT(*) AS Cnt FROM T_Waitlist WHERE Schedule_ID = %s AND Status = 0 LOCK IN SHARE MODE",
+                    (schedule_id,), fetch_one=True)['Cnt']
+                if seat['Booked_Count'] + seat['Locked_Count'] + waiting < seat['Max_Players']:
+                    raise ValueError("该场次还有空位，请直接锁位")
+
+                SafeDatabase.execute_update("""
+                    INSERT INTO T_Waitlist (Wait_ID, Schedule_ID, Player_ID, Status, Join_Time)
+                    VALUES (%s, %s, %s, 0, NOW())
+                """, (wait_id, schedule_id, player_id))
+
+            logger.info(f"加入候补成功: Wait_ID={wait_id}, Player_ID={player_id}, Schedule_ID={schedule_id}")
+            return {'wait_id': wait_id, 'position': waiting + 1}
+
+        except Exception as e:
+            logger.error(f"加入候补失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def cancel(wait_id, player_id):
+        """取消候补（只能取消自己仍在候补中的记录）"""
+        try:
+            wait_id = InputValidator.validate_id(wait_id, "候补ID")
+            entry = SafeDatabase.execute_query(
+                "SELECT Player_ID, Status FROM T_Waitlist WHERE Wait_ID = %s", (wait_id,), fetch_one=True)
+            if not entry:
+                raise ValueError("候补记录不存在")
+            if entry['Player_ID'] != player_id:
+                raise ValueError("无权取消他人的候补")
+
+            updated = SafeDatabase.execute_update(
+                "UPDATE T_Waitlist SET Status = 2 WHERE Wait_ID = %s AND Status = 0", (wait_id,))
+            if not updated:
+                raise ValueError("该候补已结束")
+
+            logger.info(f"取消候补成功: Wait_ID={wait_id}")
+            return True
+
+        except Exception as e:
+            logger.error(f"取消候补失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_entry(wait_id):
+        """
+        查询单条候补及其当前排名（Position 仅候补中时有值）
+
+        排名是同场次候补中、Wait_ID 不大于自己的条数，走 (Schedule_ID, Status, Wait_ID) 索引范围计数，
+        不扫描整个队列。
+        """
+        try:
+            wait_id = InputValidator.validate_id(wait_id, "候补ID")
+            entry = SafeDatabase.execute_query("""
+                SELECT w.Wait_ID, w.Schedule_ID, w.Player_ID, w.Status, w.Join_Time,
+                       w.Promote_Time, w.Lock_ID,
+                       (SELECT COUNT(*) FROM T_Waitlist x
+                        WHERE x.Schedule_ID = w.Schedule_ID AND x.Status = 0
+                        AND x.Wait_ID <= w.Wait_ID) AS Position
+                FROM T_Waitlist w
+                WHERE w.Wait_ID = %s
+            """, (wait_id,), fetch_one=True)
+            if entry and entry['Status'] != WaitlistModel.STATUS_WAITING:
+                entry['Position'] = None
+            return entry
+        except Exception as e:
+            logger.error(f"查询候补失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_by_player(player_id):
+        """获取玩家的候补记录（最近加入的在前，候补中的带排名）"""
+        try:
+            entries = SafeDatabase.execute_query("""
+                SELECT w.Wait_ID, w.Schedule_ID, w.Status, w.Join_Time, w.Promote_Time, w.Lock_ID,
+                       sc.Title AS Script_Title, s.Start_Time, r.Room_Name,
+                       CASE WHEN w.Status = 0 THEN
+                           (SELECT COUNT(*) FROM T_Waitlist x
+                            WHERE x.Schedule_ID = w.Schedule_ID AND x.Status = 0
+                            AND x.Wait_ID <= w.Wait_ID)
+                       END AS Position
+                FROM T_Waitlist w
+                JOIN T_Schedule s ON w.Schedule_ID = s.Schedule_ID
+                JOIN T_Script sc ON s.Script_ID = sc.Script_ID
+                JOIN T_Room r ON s.Room_ID = r.Room_ID
+                WHERE w.Player_ID = %s
+                ORDER BY w.Wait_ID DESC
+            """, (player_id,))
+            return entries if entries else []
+        except Exception as e:
+            logger.error(f"查询玩家候补失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def claim_seat(schedule_id, player_id, free, lock_id=None):
+        """
+        直接锁位/预约时的候补公平性校验（调用方已持有场次行锁，且已确认 free > 0）
+
+        空出的名额先留给排在最前面的 free 个候补玩家：只读队首 free 条，
+        候补不足 free 人时任何人都可以直接占位；否则只有队首的候补玩家可以。
+        玩家自己在候补中时把记录标记为已获得名额（lock_id 为直接锁位的锁位ID，预约时为空）。
+        """
+        head = SafeDatabase.execute_query("""
+            SELECT Wait_ID, Player_ID FROM T_Waitlist
+            WHERE Schedule_ID = %s AND Status = 0
+            ORDER BY Wait_ID
+            LIMIT %s LOCK IN SHARE MODE
+        """, (schedule_id, free))
+        if not head:
+            return
+
+        if len(head) >= free and all(row['Player_ID'] != player_id for row in head):
+            raise ValueError(WaitlistModel.QUEUE_AHEAD)
+
+        SafeDatabase.execute_update("""
+            UPDATE T_Waitlist SET Status = 1, Promote_Time = NOW(), Lock_ID = %s
+            WHERE Schedule_ID = %s AND Player_ID = %s AND Status = 0
+        """, (lock_id, schedule_id, player_id))
+
+    @staticmethod
+    @retry_on_conflict
+    def promote(schedule_id, batch_size=None, lock_minutes=None):
+        """
+        把空出的名额按加入顺序分给候补玩家：为每人创建一条锁位（与直接锁位相同的有效期），
+        提交后发布 lock_created 事件（锁位过期调度器据此跟踪）
+
+        - 先按行上的计数估算本批人数，在锁场次行之前取好 LockID（不在行锁内访问序列表）
+        - 锁场次行后重新计算空位，FOR UPDATE 读取队首候补，一个事务内完成插锁位、计数、改候补状态
+        - 已经持有订单/锁位的候补玩家（例如已直接预约）直接标记为已获得名额，不占用名额
+        - 场次已开始或已取消时，本场次剩余候补全部标记为已失效
+
+        Returns:
+            dict: promoted（[{wait_id, player_id, lock_id}]）, closed（未分配锁位但结束候补的条数）
+        """
+        batch_size = batch_size or WAITLIST_CONFIG.get('batch_size', 20)
+        lock_minutes = lock_minutes or WAITLIST_CONFIG.get('lock_minutes', 15)
+        result = {'promoted': [], 'closed': 0}
+        try:
+            peek = SafeDatabase.execute_query("""
+                SELECT sch.Status, sch.Start_Time, sch.Booked_Count, sch.Locked_Count,
+                       (SELECT sc.Max_Players FROM T_Script sc WHERE sc.Script_ID = sch.Script_ID) AS Max_Players,
+                       (SELECT COUNT(*) FROM T_Waitlist w
+                        WHERE w.Schedule_ID = sch.Schedule_ID AND w.Status = 0) AS Waiting
+                FROM T_Schedule sch
+                WHERE sch.Schedule_ID = %s
+            """, (schedule_id,), fetch_one=True)
+            if not peek or not peek['Waiting']:
+                return result
+
+            if peek['Status'] not in (0, 1) or peek['Start_Time'] <= datetime.now():
+                result['closed'] = SafeDatabase.execute_update(
+                    "UPDATE T_Waitlist SET Status = 3 WHERE Schedule_ID = %s AND Status = 0", (schedule_id,))
+                return result
+
+            # 计数中还含未清理的过期锁位时这里估算为 0：锁位过期后会再发布 seat_freed，届时再提升
+            estimate = min(peek['Max_Players'] - peek['Booked_Count'] - peek['Locked_Count'],
+                           peek['Waiting'], batch_size)
+            if estimate <= 0:
+                return result
+            lock_ids = [next_id('lock') for _ in range(estimate)]
+
+            with SafeDatabase.unit_of_work():
+                seat = ScheduleModel.lock_schedule_row(schedule_id)
+                seat['Locked_Count'] -= ScheduleModel.expire_locks(schedule_id)
+                free = min(seat['Max_Players'] - seat['Booked_Count'] - seat['Locked_Count'], len(lock_ids))
+                if free <= 0:
+                    return result
+
+                waiters = SafeDatabase.execute_query("""
+                    SELECT Wait_ID, Player_ID FROM T_Waitlist
+                    WHERE Schedule_ID = %s AND Status = 0
+                    ORDER BY Wait_ID
+                    LIMIT %s FOR UPDATE
+                """, (schedule_id, free))
+
+                expire_time = (datetime.now() + timedelta(minutes=lock_minutes)).replace(microsecond=0)
+                for waiter in waiters:
+                    player_id = waiter['Player_ID']
+                    held = SafeDatabase.execute_query("""
+                        SELECT
+                            (SELECT COUNT(*) FROM T_Order WHERE Schedule_ID = %s AND Player_ID = %s
+                             AND Pay_Status IN (0, 1)) +
+                            (SELECT COUNT(*) FROM t_lock_record WHERE Schedule_ID = %s AND Player_ID = %s
+                             AND Status = 0) AS Cnt
+                    """, (schedule_id, player_id, schedule_id, player_id), fetch_one=True)['Cnt']
+                    if held:
+                        SafeDatabase.execute_update(
+                            "UPDATE T_Waitlist SET Status = 1, Promote_Time = NOW() WHERE Wait_ID = %s",
+                            (waiter['Wait_ID'],))
+                        result['closed'] += 1
+                        continue
+
+                    lock_id = lock_ids.pop()
+                    SafeDatabase.execute_update("""
+                        INSERT INTO t_lock_record
+                        (LockID, Schedule_ID, Player_ID, LockTime, ExpireTime, Status)
+                        VALUES (%s, %s, %s, NOW(), %s, 0)
+                    """, (lock_id, schedule_id, player_id, expire_time))
+                    SafeDatabase.execute_update(
+                        "UPDATE T_Waitlist SET Status = 1, Promote_Time = NOW(), Lock_ID = %s WHERE Wait_ID = %s",
+                        (lock_id, waiter['Wait_ID']))
+                    seat_inventory.record_lock(schedule_id, player_id, lock_id, expire_time)
+                    seat_events.publish(seat_events.LOCK_CREATED, lock_id=lock_id, schedule_id=schedule_id,
+                                        player_id=player_id, expire_time=expire_time)
+                    result['promoted'].append({'wait_id': waiter['Wait_ID'], 'player_id': player_id,
+                                               'lock_id': lock_id})
+
+                ScheduleModel.adjust_counts(schedule_id, locked=len(result['promoted']))
+
+            if result['promoted']:
+                logger.info(f"候补自动锁位: Schedule_ID={schedule_id}, "
+                            f"LockID={[p['lock_id'] for p in result['promoted']]}")
+            return result
+
+        except Exception as e:
+            logger.error(f"候补提升失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def pending_schedules(limit=500):
+        """有候补且当前有空位（或已开始/已取消、需要清理候补）的场次ID，供后台补扫"""
+        rows = SafeDatabase.execute_query("""
+            SELECT DISTINCT w.Schedule_ID
+            FROM T_Waitlist w
+            JOIN T_Schedule sch ON w.Schedule_ID = sch.Schedule_ID
+            JOIN T_Script sc ON sch.Script_ID = sc.Script_ID
+            WHERE w.Status = 0
+            AND (sch.Booked_Count + sch.Locked_Count < sc.Max_Players
+                 OR sch.Start_Time <= NOW() OR sch.Status NOT IN (0, 1))
+            LIMIT %s
+        """, (limit,))
+        return [row['Schedule_ID'] for row in rows]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+键集分页（游标分页）工具
+
+列表按 (排序列 DESC, 主键 DESC) 输出，下一页的位置由上一页最后一行的 (排序列, 主键) 决定：
+    WHERE ... AND (排序列 < %s OR (排序列 = %s AND 主键 < %s))
+    ORDER BY 排序列 DESC, 主键 DESC LIMIT n + 1
+配合 (过滤列, 排序列, 主键) 复合索引，每页只扫描 n + 1 行，不会像 OFFSET 那样随页码变慢。
+
+游标对调用方是不透明的字符串（base64 编码的 JSON），只用于“从哪里接着往下翻”。
+"""
+
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from database import SafeDatabase
+from database_config import PAGINATION_CONFIG
+
+
+def normalize_limit(limit):
+    """每页条数：未传/非法时用默认值，超过上限时截断"""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return PAGINATION_CONFIG['default_page_size']
+    if limit <= 0:
+        return PAGINATION_CONFIG['default_page_size']
+    return min(limit, PAGINATION_CONFIG['max_page_size'])
+
+
+def encode_cursor(sort_value, row_id):
+    """把最后一行的 (排序列, 主键) 编码为游标"""
+    if isinstance(sort_value, (datetime, date)):
+        sort_value = sort_value.isoformat(sep=' ') if isinstance(sort_value, datetime) else sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (排序列, 主键)；格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise ValueError("无效的分页游标")
+    if not isinstance(row_id, int) or isinstance(row_id, bool) or not isinstance(sort_value, (str, int, float)):
+        raise ValueError("无效的分页游标")
+    return sort_value, row_id
+
+
+def paginate(sql, params, sort_column, id_column, sort_key, id_key, limit=None, cursor=None, use_replica=True):
+    """
+    执行一页键集分页查询
+
+    Args:
+        sql: 不含 ORDER BY / LIMIT 的查询语句（必须已有 WHERE 子句）
+        params: sql 的参数列表
+        sort_column, id_column: SQL 中的排序列与主键列（如 o.Create_Time、o.Order_ID）
+        sort_key, id_key: 结果行中对应的字段名
+        limit: 每页条数
+        cursor: 上一页返回的 next_cursor，不传表示第一页
+
+    Returns:
+        {'items': 当前页记录, 'next_cursor': 下一页游标（没有更多数据时为 None）}
+    """
+    limit = normalize_limit(limit)
+    params = list(params or [])
+
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        sql += f" AND ({sort_column} < %s OR ({sort_column} = %s AND {id_column} < %s))"
+        params.extend([sort_value, sort_value, row_id])
+
+    # 多取一行用于判断是否还有下一页
+    sql += f" ORDER BY {sort_column} DESC, {id_column} DESC LIMIT %s"
+    params.append(limit + 1)
+
+    rows = SafeDatabase.execute_query(sql, tuple(params), use_replica=use_replica) or []
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last[sort_key], last[id_key])
+    return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+查询结果缓存 - 按表打标签，写入后按表失效
+
+剧本列表、DM/房间列表、报表等读多写少的查询声明自己依赖的表：
+    SafeDatabase.execute_query(sql, params, cache_tables=('T_Script', 'T_Script_Profile'))
+缓存键包含这些表当前的版本号；execute_update/execute_transaction/execute_many 写到某张表并提交后，
+该表版本号 +1，依赖它的缓存项随即失效（旧键不再被访问，由 LRU/TTL 淘汰）。
+
+后端：
+- memory：进程内 LRU（单进程部署）
+- sqlite：本机共享的 SQLite 文件（多 worker 部署时各进程共享缓存和版本号，写入后所有进程同时失效）
+"""
+
+from collections import OrderedDict, Counter
+import hashlib
+import logging
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from database_config import QUERY_CACHE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# 不能识别写入目标表的写语句（如 CALL 存储过程）按“所有表都可能被改”处理
+ALL_TABLES = '*'
+
+_WRITE_TARGET = re.compile(
+    r"^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE(?:\s+IGNORE)?|DELETE\s+FROM)\s+`?(\w+)`?",
+    re.IGNORECASE
+)
+_READ_ONLY = re.compile(r"^\s*(?:SELECT|SAVEPOINT|ROLLBACK|RELEASE|SET|SHOW)\b", re.IGNORECASE)
+
+
+def written_tables(sql):
+    """写语句影响的表（小写）；无法识别时返回 {'*'}，只读语句返回空集合"""
+    match = _WRITE_TARGET.match(sql)
+    if match:
+        return {match.group(1).lower()}
+    if _READ_ONLY.match(sql):
+        return set()
+    return {ALL_TABLES}
+
+
+class MemoryCacheBackend:
+    """进程内 LRU + TTL"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()      # key -> (过期时间, 序列化后的结果)
+        self._versions = {}                # 表名 -> (版本号, 最近写入时间)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def versions(self, tables):
+        with self._lock:
+            return {table: self._versions.get(table, (0, 0.0)) for table in tables}
+
+    def bump(self, tables):
+        now = time.time()
+        with self._lock:
+            for table in tables:
+                version = self._versions.get(table, (0, 0.0))[0]
+                self._versions[table] = (version + 1, now)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'evictions': self.evictions}
+
+
+class SQLiteCacheBackend:
+    """
+    本机共享的 SQLite 缓存文件（多 worker 进程共用，代替独立的缓存服务）
+
+    每个线程一条连接；LRU 按最近访问时间淘汰，每写入 evict_every 次检查一次容量。
+    """
+
+    name = 'sqlite'
+    evict_every = 64
+
+    def __init__(self, path, max_entries=2000, busy_timeout=2):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._writes = 0
+        self.evictions = 0
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " cache_key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS table_versions ("
+            " table_name TEXT PRIMARY KEY, version INTEGER NOT NULL, bumped_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")   # 缓存文件丢失只意味着重新查询
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute("SELECT value, expires FROM cache_entries WHERE cache_key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] <= now:
+            connection.execute("DELETE FROM cache_entries WHERE cache_key = ?", (key,))
+            return None
+        connection.execute("UPDATE cache_entries SET accessed = ? WHERE cache_key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache_entries (cache_key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, now + ttl, now)
+        )
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self._evict(connection, now)
+
+    def _evict(self, connection, now):
+        connection.execute("DELETE FROM cache_entries WHERE expires <= ?", (now,))
+        overflow = connection.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            connection.execute(
+                "DELETE FROM cache_entries WHERE cache_key IN "
+                "(SELECT cache_key FROM cache_entries ORDER BY accessed LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def versions(self, tables):
+        tables = list(tables)
+        placeholders = ','.join('?' * len(tables))
+        rows = self._connection().execute(
+            f"SELECT table_name, version, bumped_at FROM table_versions WHERE table_name IN ({placeholders})",
+            tables
+        ).fetchall()
+        found = {name: (version, bumped_at) for name, version, bumped_at in rows}
+        return {table: found.get(table, (0, 0.0)) for table in tables}
+
+    def bump(self, tables):
+        now = time.time()
+        self._connection().executemany(
+            "INSERT INTO table_versions (table_name, version, bumped_at) VALUES (?, 1, ?) "
+            "ON CONFLICT(table_name) DO UPDATE SET version = version + 1, bumped_at = excluded.bumped_at",
+            [(table, now) for table in tables]
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entries")
+
+    def stats(self):
+        entries = self._connection().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        return {'entries': entries, 'max_entries': self.max_entries, 'evictions': self.evictions,
+                'path': self.path}
+
+
+class QueryCache:
+    """
+    按表打标签的查询结果缓存
+
+    结果以 pickle 形式保存，每次命中都返回新的对象（调用方修改结果不会影响缓存）。
+    缓存后端出错时只记日志、按未命中处理，不影响查询本身。
+    """
+
+    def __init__(self, config=None, backend=None):
+        config = config or QUERY_CACHE_CONFIG
+        self.enabled = config.get('enabled', True)
+        self.default_ttl = config.get('default_ttl', 60)
+        self.replica_fill_delay = config.get('replica_fill_delay', 5)
+        self.backend = backend or self._create_backend(config)
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._tables = {}                  # 表名 -> Counter(hits/misses/invalidations)
+
+    @staticmethod
+    def _create_backend(config):
+        if config.get('backend', 'memory') == 'sqlite':
+            return SQLiteCacheBackend(config.get('shared_path', 'query_cache.sqlite3'),
+                                      max_entries=config.get('max_entries', 2000))
+        return MemoryCacheBackend(max_entries=config.get('max_entries', 2000))
+
+    def use_backend(self, backend):
+        """替换缓存后端（测试/基准脚本用）"""
+        self.backend = backend
+
+    def _count(self, event, tables=()):
+        with self._lock:
+            self._counters[event] += 1
+            for table in tables:
+                counter = self._tables.get(table)
+                if counter is None:
+                    counter = self._tables[table] = Counter()
+                counter[event] += 1
+
+    def count_bypass(self):
+        """本次读取绕过缓存（当前事务已有未提交的写入）"""
+        self._count('bypassed')
+
+    def get_or_load(self, key_parts, tables, loader, ttl=None):
+        """
+        命中时返回缓存结果，否则调用 loader 查询并写入缓存
+
+        Args:
+            key_parts: 能唯一确定查询结果的值（SQL、参数、取数方式）
+            tables: 该查询依赖的表
+            loader: loader(replica_ok) -> 查询结果；replica_ok 为 False 表示依赖的表刚被写过，
+                    副本可能还没追上，应读主库填充（否则旧数据会挂在新版本号下）
+            ttl: 缓存秒数，默认 default_ttl
+        """
+        tables = sorted({table.lower() for table in tables})
+        try:
+            versions = self.backend.versions(tables + [ALL_TABLES])
+            key = hashlib.sha1(repr((key_parts, sorted(versions.items()))).encode('utf-8')).hexdigest()
+            cached = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"查询缓存读取失败，直接查询数据库: {str(e)}")
+            self._count('errors')
+            return loader(True)
+
+        if cached is not None:
+            self._count('hits', tables)
+            return pickle.loads(cached)
+
+        self._count('misses', tables)
+        now = time.time()
+        replica_ok = all(now - bumped_at >= self.replica_fill_delay for _, bumped_at in versions.values())
+        result = loader(replica_ok)
+        try:
+            self.backend.set(key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL),
+                             self.default_ttl if ttl is None else ttl)
+            self._count('stores')
+        except Exception as e:
+            logger.warning(f"查询缓存写入失败: {str(e)}")
+            self._count('errors')
+        return result
+
+    def invalidate(self, tables):
+        """表版本号 +1，使依赖这些表的缓存项失效（在写入提交之后调用）"""
+        tables = sorted({table.lower() for table in tables})
+        if not tables:
+            return
+        try:
+            self.backend.bump(tables)
+            self._count('invalidations', tables)
+        except Exception as e:
+            logger.error(f"查询缓存失效失败（依赖 {tables} 的缓存最长在 TTL 后过期）: {str(e)}")
+            self._count('errors')
+
+    def clear(self):
+        self.backend.clear()
+
+    def snapshot(self):
+        """命中率、各表命中/失效次数及后端状态"""
+        with self._lock:
+            counters = dict(self._counters)
+            tables = {table: dict(counter) for table, counter in self._tables.items()}
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        try:
+            backend = self.backend.stats()
+        except Exception as e:
+            backend = {'error': str(e)}
+        return {
+            'enabled': self.enabled,
+            'backend': self.backend.name,
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'hit_rate': round(counters.get('hits', 0) / lookups, 4) if lookups else 0.0,
+            'bypassed': counters.get('bypassed', 0),
+            'stores': counters.get('stores', 0),
+            'invalidations': counters.get('invalidations', 0),
+            'errors': counters.get('errors', 0),
+            'tables': tables,
+            **backend,
+        }
+
+    def reset(self):
+        """清空统计（不清空缓存内容）"""
+        with self._lock:
+            self._counters.clear()
+            self._tables.clear()
+
+
+query_cache = QueryCache()
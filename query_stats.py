@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+SQL 执行统计 - 语句指纹、耗时分位数、慢查询日志
+按“去掉参数后的语句指纹”聚合，定位到底是哪条语句、哪个模型方法拖慢了系统
+"""
+
+from collections import deque, Counter
+from contextlib import contextmanager
+from functools import lru_cache
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from database_config import QUERY_STATS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# 慢查询单独使用一个 logger，便于输出到独立文件
+slow_logger = logging.getLogger('slow_query')
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+# 定位调用方时跳过的数据访问层文件：缓存（query_cache.get_or_load）、分页（pagination.paginate）代为执行的语句记到调用它们的模型方法上
+_SKIP_FILES = {'database.py', 'query_stats.py', 'contextlib.py', 'query_cache.py', 'pagination.py'}
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """
+    生成语句指纹：去掉字面量和占位符差异，合并空白
+
+    例：SELECT * FROM T_Order WHERE Order_ID = %s AND Pay_Status IN (0, 1)
+     -> SELECT * FROM T_Order WHERE Order_ID = ? AND Pay_Status IN (?+)
+    """
+    text = _STRING_LITERAL.sub('?', sql)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _NUMBER_LITERAL.sub('?', text)
+    text = _WHITESPACE.sub(' ', text).strip()
+    text = _IN_LIST.sub('IN (?+)', text)
+    return text
+
+
+def find_caller():
+    """
+    找到发起 SQL 的业务方法（跳过数据库层自身的栈帧）
+
+    Returns:
+        形如 "ReportModel.get_dashboard_stats" 的字符串；找不到时返回 None
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in _SKIP_FILES:
+            code = frame.f_code
+            # Python 3.11+ 的 co_qualname 自带类名；旧版本退化为 模块.函数
+            name = getattr(code, 'co_qualname', None)
+            if not name:
+                module = frame.f_globals.get('__name__', '')
+                name = f"{module.rsplit('.', 1)[-1]}.{code.co_name}"
+            return name
+        frame = frame.f_back
+    return None
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class _StatementStats:
+    """单个语句指纹的累计数据"""
+
+    __slots__ = ('count', 'errors', 'total_ms', 'max_ms', 'rows', 'slow', 'samples', 'callers', 'last_seen')
+
+    def __init__(self, sample_size):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.samples = deque(maxlen=sample_size)
+        self.callers = Counter()
+        self.last_seen = None
+
+
+class QueryStats:
+    """线程安全的语句统计器"""
+
+    def __init__(self, config=None):
+        config = config or QUERY_STATS_CONFIG
+        self.enabled = config.get('enabled', True)
+        self.slow_query_ms = config.get('slow_query_ms', 200)
+        self.sample_size = config.get('sample_size', 1024)
+        self.max_fingerprints = config.get('max_fingerprints', 500)
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._retries = {}
+        self._dropped = 0
+        self._since = time.time()
+
+    def record_retry(self, operation, event):
+        """
+        记录一次冲突重试事件
+
+        Args:
+            operation: 业务操作名（如 OrderModel.create_order）
+            event: deadlock/lock_wait（遇到冲突）、retried（已重做）、succeeded（重做后成功）、
+                   exhausted（重试次数用完）、not_retryable（本请求已有其它写入，无法安全重做）
+        """
+        with self._lock:
+            counter = self._retries.get(operation)
+            if counter is None:
+                counter = self._retries[operation] = Counter()
+            counter[event] += 1
+
+    def record(self, sql, elapsed_ms, rows=0, caller=None, error=None):
+        """记录一次执行"""
+        if not self.enabled:
+            return
+
+        key = fingerprint(sql)
+        is_slow = elapsed_ms >= self.slow_query_ms
+
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                if len(self._statements) >= self.max_fingerprints:
+                    self._dropped += 1
+                    stats = None
+                else:
+                    stats = self._statements[key] = _StatementStats(self.sample_size)
+            if stats is not None:
+                stats.count += 1
+                stats.total_ms += elapsed_ms
+                stats.max_ms = max(stats.max_ms, elapsed_ms)
+                stats.rows += rows or 0
+                stats.samples.append(elapsed_ms)
+                stats.last_seen = time.time()
+                if caller:
+                    stats.callers[caller] += 1
+                if error is not None:
+                    stats.errors += 1
+                if is_slow:
+                    stats.slow += 1
+
+        if is_slow:
+            self._log_slow(key, sql, elapsed_ms, rows, caller, error)
+
+    def _log_slow(self, key, sql, elapsed_ms, rows, caller, error):
+        record = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'elapsed_ms': round(elapsed_ms, 3),
+            'threshold_ms': self.slow_query_ms,
+            'rows': rows,
+            'caller': caller,
+            'fingerprint': key,
+            'sql': _WHITESPACE.sub(' ', sql).strip()[:500],  # 不记录参数，避免泄露敏感数据
+        }
+        if error is not None:
+            record['error'] = str(error)
+        slow_logger.warning(json.dumps(record, ensure_ascii=False))
+
+    @contextmanager
+    def track(self, sql):
+        """
+        统计一段 SQL 执行（包含取结果），调用方把返回行数写入 tracker.rows
+
+        with query_stats.track(sql) as tracker:
+            cursor.execute(sql, params)
+            result = cursor.fetchall()
+            tracker.rows = len(result)
+        """
+        tracker = _Tracker()
+        if not self.enabled:
+            yield tracker
+            return
+
+        caller = find_caller()
+        start = time.perf_counter()
+        try:
+            yield tracker
+        except Exception as e:
+            self.record(sql, (time.perf_counter() - start) * 1000, tracker.rows, caller, error=e)
+            raise
+        self.record(sql, (time.perf_counter() - start) * 1000, tracker.rows, caller)
+
+    def snapshot(self, top=50, order_by='total_ms'):
+        """
+        导出统计结果
+
+        Args:
+            top: 返回前 N 条
+            order_by: 排序字段（total_ms/count/p95_ms/max_ms/avg_ms/errors/slow）
+
+        Returns:
+            dict: {since, slow_query_ms, dropped, statements: [...], retries: {操作: {事件: 次数}}}
+        """
+        with self._lock:
+            items = [(key, s, list(s.samples)) for key, s in self._statements.items()]
+            retries = {operation: dict(counter) for operation, counter in self._retries.items()}
+            dropped = self._dropped
+
+        statements = []
+        for key, s, samples in items:
+            samples.sort()
+            statements.append({
+                'fingerprint': key,
+                'count': s.count,
+                'errors': s.errors,
+                'slow': s.slow,
+                'rows': s.rows,
+                'avg_rows': round(s.rows / s.count, 2) if s.count else 0,
+                'total_ms': round(s.total_ms, 3),
+                'avg_ms': round(s.total_ms / s.count, 3) if s.count else 0,
+                'p50_ms': round(_percentile(samples, 50), 3),
+                'p95_ms': round(_percentile(samples, 95), 3),
+                'p99_ms': round(_percentile(samples, 99), 3),
+                'max_ms': round(s.max_ms, 3),
+                'callers': dict(s.callers.most_common(5)),
+                'last_seen': datetime.fromtimestamp(s.last_seen).isoformat(timespec='seconds') if s.last_seen else None,
+            })
+
+        if statements and order_by not in statements[0]:
+            order_by = 'total_ms'
+        statements.sort(key=lambda item: item[order_by], reverse=True)
+
+        return {
+            'since': datetime.fromtimestamp(self._since).isoformat(timespec='seconds'),
+            'slow_query_ms': self.slow_query_ms,
+            'dropped': dropped,
+            'statements': statements[:top],
+            'retries': retries,
+        }
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._statements.clear()
+            self._retries.clear()
+            self._dropped = 0
+            self._since = time.time()
+
+
+class _Tracker:
+    __slots__ = ('rows',)
+
+    def __init__(self):
+        self.rows = 0
+
+
+def _setup_slow_log_file():
+    path = QUERY_STATS_CONFIG.get('slow_log_file')
+    if not path or slow_logger.handlers:
+        return
+    handler = logging.FileHandler(path, encoding='utf-8', delay=True)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    slow_logger.addHandler(handler)
+
+
+_setup_slow_log_file()
+
+# 全局统计实例
+query_stats = QueryStats()
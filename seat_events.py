@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+座位事件 - 进程内的发布/订阅（锁位创建、名额释放）
+
+    import seat_events
+    seat_events.subscribe(seat_events.SEAT_FREED, on_seat_freed)   # on_seat_freed(**payload)
+
+发布方在写入事务内调用 publish，事件在事务提交后才派发给订阅者（工作单元回滚时丢弃），
+订阅者看到的一定是已经生效的变更；订阅者在发布方的线程中同步执行，应尽快返回，异常只记日志。
+
+事件：
+- LOCK_CREATED：lock_id, schedule_id, player_id, expire_time
+- SEAT_FREED：schedule_id, player_id, seats（释放的名额数）, reason（expired / lock_cancelled / order_cancelled），
+  以及 lock_id / order_id / expire_time（视 reason 而定）
+"""
+
+from collections import defaultdict
+import logging
+import threading
+
+from database import current_unit_of_work
+
+logger = logging.getLogger(__name__)
+
+LOCK_CREATED = 'lock_created'
+SEAT_FREED = 'seat_freed'
+
+_subscribers = defaultdict(list)
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(event, callback):
+    """订阅事件（同一回调重复订阅只保留一次）"""
+    with _subscribers_lock:
+        if callback not in _subscribers[event]:
+            _subscribers[event].append(callback)
+
+
+def unsubscribe(event, callback):
+    with _subscribers_lock:
+        if callback in _subscribers[event]:
+            _subscribers[event].remove(callback)
+
+
+def _dispatch(event, payload):
+    with _subscribers_lock:
+        callbacks = list(_subscribers[event])
+    for callback in callbacks:
+        try:
+            callback(**payload)
+        except Exception as e:
+            logger.error(f"座位事件处理失败: {event}: {str(e)}")
+
+
+def publish(event, **payload):
+    """发布事件：在工作单元内时提交后派发，否则立即派发"""
+    uow = current_unit_of_work()
+    if uow is not None:
+        uow.after_commit(lambda: _dispatch(event, payload))
+    else:
+        _dispatch(event, payload)
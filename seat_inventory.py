@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+进程内座位库存 - 热门场次的锁位/下单准入不再逐次访问数据库
+
+每个场次在内存中保存：容量、有效订单（玩家 -> 订单ID）、锁定中的锁位（玩家 -> (锁位ID, 过期时间)）
+以及按过期时间排序的小顶堆。锁位/下单先问库存：
+    seat_inventory.check_lock(schedule_id, player_id)   # 已满/重复锁位时抛出 ValueError，微秒级
+通过后仍走数据库事务（锁场次行 + 占用计数，数据库是唯一可信来源）；
+record_*/release_* 在事务提交后才写回库存（工作单元回滚时不生效）。
+
+库存只用于提前拒绝：
+- 内存认为有空位而数据库已满（其它进程刚抢走）时，数据库照常拒绝，调用方 mark_stale 后重新加载该场次
+- 内存认为已满/重复的结论只在场次快照加载后 trust_seconds 秒内直接返回，更旧时先重新加载再判断，
+  多 worker 部署时其它进程释放的名额不会被长期挡在外面
+进程重启后从 T_Schedule / T_Order / t_lock_record 重新加载（warm），check() 与数据库逐场次核对。
+"""
+
+from collections import OrderedDict, Counter
+from datetime import datetime
+import heapq
+import logging
+import threading
+import time
+
+from database import SafeDatabase, current_unit_of_work
+from database_config import SEAT_INVENTORY_CONFIG
+
+logger = logging.getLogger(__name__)
+
+FULL = "该场次已满"
+DUPLICATE_LOCK = "您已经锁定了该场次"
+DUPLICATE_ORDER = "您已经预约过该场次，请勿重复预约"
+
+# 按场次ID加载/核对时每条 IN (...) 的最大长度
+LOAD_CHUNK = 500
+
+
+def _key(value):
+    """请求体里的场次/玩家ID可能是字符串，统一成 int；无法转换时返回 None（交给数据库校验）"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ScheduleSeats:
+    """单个场次的座位状态（读写都在 self.lock 内进行）"""
+
+    __slots__ = ('schedule_id', 'capacity', 'orders', 'locks', 'expiry', 'loaded_at', 'lock')
+
+    def __init__(self, schedule_id, capacity):
+        self.schedule_id = schedule_id
+        self.capacity = capacity
+        self.orders = {}        # 玩家ID -> 订单ID（Pay_Status IN (0, 1)）
+        self.locks = {}         # 玩家ID -> (锁位ID, 过期时间)
+        self.expiry = []        # 小顶堆：(过期时间, 锁位ID, 玩家ID)
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add_lock(self, player_id, lock_id, expire_at):
+        self.locks[player_id] = (lock_id, expire_at)
+        heapq.heappush(self.expiry, (expire_at, lock_id, player_id))
+
+    def remove_lock(self, player_id, lock_id=None):
+        # 堆中的旧条目不删除，到期弹出时与 locks 中的锁位ID比对后丢弃
+        held = self.locks.get(player_id)
+        if held and (lock_id is None or held[0] == lock_id):
+            del self.locks[player_id]
+
+    def purge(self, now):
+        """弹出已过期的锁位（与数据库 ExpireTime > NOW() 的判断一致）"""
+        expiry = self.expiry
+        while expiry and expiry[0][0] <= now:
+            _, lock_id, player_id = heapq.heappop(expiry)
+            self.remove_lock(player_id, lock_id)
+
+    def verdict(self, op, player_id, now):
+        """按与数据库事务相同的规则判断，返回拒绝原因，可以放行时返回 None"""
+        self.purge(now)
+        occupied = len(self.orders) + len(self.locks)
+        if op == 'lock':
+            if player_id in self.locks:
+                return DUPLICATE_LOCK
+            if occupied >= self.capacity:
+                return FULL
+        else:
+            if player_id in self.orders:
+                return DUPLICATE_ORDER
+            # 已锁位的玩家转订单时占用的是自己锁住的名额
+            if occupied - (1 if player_id in self.locks else 0) >= self.capacity:
+                return FULL
+        return None
+
+    def state(self, now):
+        """核对用的状态快照"""
+        self.purge(now)
+        return {
+            'capacity': self.capacity,
+            'orders': dict(self.orders),
+            'locks': {player_id: lock_id for player_id, (lock_id, _) in self.locks.items()},
+        }
+
+
+class SeatInventory:
+    """
+    按 Schedule_ID 组织的座位库存
+
+    数据库访问只发生在加载/重新加载/核对时（execute_snapshot 单独借主库连接，读最新已提交数据）。
+    """
+
+    def __init__(self, config=None):
+        config = config or SEAT_INVENTORY_CONFIG
+        self.enabled = config.get('enabled', True)
+        self.trust_seconds = config.get('trust_seconds', 2)
+        self.max_schedules = config.get('max_schedules', 5000)
+        self._schedules = OrderedDict()    # 场次ID -> ScheduleSeats（按最近访问排序）
+        self._reloading = {}               # 场次ID -> 重新加载锁（同一场次只让一个线程访问数据库）
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def _count(self, event, amount=1):
+        with self._lock:
+            self._counters[event] += amount
+
+    # ==================== 加载 ====================
+
+    @staticmethod
+    def _fetch(schedule_ids=None):
+        """从数据库读取座位状态（同一个一致性快照），返回 {场次ID: ScheduleSeats}；不传 schedule_ids 时读取所有未开始的场次"""
+        if schedule_ids is None:
+            scope, params = "sch.Start_Time > NOW() AND sch.Status IN (0, 1)", ()
+        else:
+            scope = f"sch.Schedule_ID IN ({', '.join(['%s'] * len(schedule_ids))})"
+            params = tuple(schedule_ids)
+
+        schedules, orders, locks = SafeDatabase.execute_snapshot([
+            (f"""
+                SELECT sch.Schedule_ID, sc.Max_Players
+                FROM T_Schedule sch
+                JOIN T_Script sc ON sch.Script_ID = sc.Script_ID
+                WHERE {scope}
+            """, params),
+            (f"""
+                SELECT o.Schedule_ID, o.Player_ID, o.Order_ID
+                FROM T_Order o
+                JOIN T_Schedule sch ON o.Schedule_ID = sch.Schedule_ID
+                WHERE {scope} AND o.Pay_Status IN (0, 1)
+            """, params),
+            (f"""
+                SELECT l.Schedule_ID, l.Player_ID, l.LockID, l.ExpireTime
+                FROM t_lock_record l
+                JOIN T_Schedule sch ON l.Schedule_ID = sch.Schedule_ID
+                WHERE {scope} AND l.Status = 0 AND l.ExpireTime > NOW()
+            """, params),
+        ])
+
+        loaded = {row['Schedule_ID']: ScheduleSeats(row['Schedule_ID'], row['Max_Players']) for row in schedules}
+        for row in orders:
+            seats = loaded.get(row['Schedule_ID'])
+            if seats is not None:
+                seats.orders[row['Player_ID']] = row['Order_ID']
+        for row in locks:
+            seats = loaded.get(row['Schedule_ID'])
+            if seats is not None:
+                seats.add_lock(row['Player_ID'], row['LockID'], row['ExpireTime'])
+        return loaded
+
+    def _store(self, loaded, missing=()):
+        with self._lock:
+            for schedule_id in missing:
+                self._schedules.pop(schedule_id, None)
+            for schedule_id, seats in loaded.items():
+                self._schedules[schedule_id] = seats
+                self._schedules.move_to_end(schedule_id)
+            while len(self._schedules) > self.max_schedules:
+                self._schedules.popitem(last=False)
+                self._counters['evictions'] += 1
+            self._counters['loads'] += 1
+
+    def warm(self):
+        """
+        从数据库重建库存（服务启动时调用）：加载所有未开始的场次，替换内存中的全部状态
+
+        Returns:
+            加载的场次数；失败时只记日志并返回 0（之后按需逐场次加载）
+        """
+        if not self.enabled:
+            return 0
+        try:
+            started = time.perf_counter()
+            loaded = self._fetch()
+            with self._lock:
+                self._schedules.clear()
+            self._store(loaded)
+            logger.info(f"座位库存加载完成: {len(loaded)} 个场次，耗时 {(time.perf_counter() - started) * 1000:.0f}ms")
+            return len(loaded)
+        except Exception as e:
+            logger.error(f"座位库存加载失败（改为按需加载）: {str(e)}")
+            return 0
+
+    def _get(self, schedule_id):
+        with self._lock:
+            seats = self._schedules.get(schedule_id)
+            if seats is not None:
+                self._schedules.move_to_end(schedule_id)
+            return seats
+
+    def _reload(self, schedule_id, stale=None):
+        """
+        重新加载一个场次；已被其它线程加载过时直接用新的结果
+
+        其它线程正在加载时不等待、返回 None（本次交给数据库判断）：调用方通常已持有请求工作单元的连接，
+        排队等加载的线程会占满连接池，而加载本身还要再借一条连接
+        """
+        with self._lock:
+            guard = self._reloading.setdefault(schedule_id, threading.Lock())
+        if not guard.acquire(blocking=False):
+            self._count('reload_skipped')
+            return None
+        try:
+            current = self._get(schedule_id)
+            if current is not None and current is not stale:
+                return current
+            self._count('reloads')
+            loaded = self._fetch([schedule_id])
+            self._store(loaded, missing=[schedule_id])
+            return loaded.get(schedule_id)
+        finally:
+            guard.release()
+
+    # ==================== 准入 ====================
+
+    def _admit(self, op, schedule_id, player_id, reload):
+        """返回 True 表示库存判断后放行；False 表示库存没有做判断（未启用/未加载），直接交给数据库"""
+        schedule_id, player_id = _key(schedule_id), _key(player_id)
+        if not self.enabled or schedule_id is None or player_id is None:
+            return False
+        seats = self._get(schedule_id)
+        if seats is None:
+            if not reload:
+                return False
+            seats = self._reload(schedule_id)
+            if seats is None:
+                return False    # 场次不存在或正由其它线程加载，交给数据库判断
+
+        now = datetime.now()
+        with seats.lock:
+            reason = seats.verdict(op, player_id, now)
+        if reason and time.monotonic() - seats.loaded_at > self.trust_seconds:
+            if not reload:
+                return False
+            seats = self._reload(schedule_id, stale=seats)
+            if seats is None:
+                return False
+            with seats.lock:
+                reason = seats.verdict(op, player_id, now)
+
+        if reason:
+            self._count('rejected')
+            raise ValueError(reason)
+        self._count('admitted')
+        return True
+
+    def check_lock(self, schedule_id, player_id, reload=True):
+        """
+        锁位准入：场次已满或玩家已锁定该场次时抛出 ValueError（提示与数据库事务一致）
+
+        reload=False 时不访问数据库：只有内存结论可信时才拒绝，否则放行交给数据库判断（供事件循环直接调用）
+
+        Returns:
+            是否经库存判断后放行（数据库随后拒绝时作为 mark_stale 的 admitted 传入）
+        """
+        return self._admit('lock', schedule_id, player_id, reload)
+
+    def check_order(self, schedule_id, player_id, reload=True):
+        """下单准入：场次已满（不计玩家自己的锁位）或玩家已预约该场次时抛出 ValueError，返回值同 check_lock"""
+        return self._admit('order', schedule_id, player_id, reload)
+
+    # ==================== 写回 ====================
+
+    @staticmethod
+    def _after_commit(callback):
+        """在工作单元内时提交后执行（回滚丢弃），否则立即执行"""
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.after_commit(callback)
+        else:
+            callback()
+
+    def _apply(self, schedule_id, change):
+        schedule_id = _key(schedule_id)
+
+        def apply():
+            seats = self._get(schedule_id)
+            if seats is None:
+                return          # 未加载的场次下次访问时从数据库加载
+            with seats.lock:
+                change(seats)
+            self._count('writes')
+        if self.enabled:
+            self._after_commit(apply)
+
+    def record_lock(self, schedule_id, player_id, lock_id, expire_at):
+        """锁位已写入数据库"""
+        self._apply(schedule_id, lambda seats: seats.add_lock(player_id, lock_id, expire_at))
+
+    def release_lock(self, schedule_id, player_id, lock_id):
+        """锁位已释放"""
+        self._apply(schedule_id, lambda seats: seats.remove_lock(player_id, lock_id))
+
+    def record_order(self, schedule_id, player_id, order_id):
+        """订单已写入数据库（玩家在该场次的锁位同时转为订单）"""
+        def change(seats):
+            seats.orders[player_id] = order_id
+            seats.remove_lock(player_id)
+        self._apply(schedule_id, change)
+
+    def release_order(self, schedule_id, player_id, order_id):
+        """订单已取消/退款（玩家在该场次的锁位同时释放）"""
+        def change(seats):
+            if seats.orders.get(player_id) == order_id:
+                del seats.orders[player_id]
+            seats.remove_lock(player_id)
+        self._apply(schedule_id, change)
+
+    def invalidate(self, *schedule_ids):
+        """丢弃这些场次的内存状态，下次访问时从数据库加载（容量变更、批量导入等）"""
+        def drop():
+            with self._lock:
+                for schedule_id in schedule_ids:
+                    self._schedules.pop(_key(schedule_id), None)
+        self._after_commit(drop)
+
+    def mark_stale(self, schedule_id, admitted):
+        """
+        数据库拒绝了锁位/下单：立即丢弃该场次，下次访问重新加载
+
+        admitted 为 check_lock/check_order 的返回值；只有库存确实放行过（内存状态落后于数据库，
+        如其它进程/绕过本进程的写入）才计入 stale_admits
+        """
+        if admitted:
+            self._count('stale_admits')
+        with self._lock:
+            self._schedules.pop(_key(schedule_id), None)
+
+    # ==================== 核对与统计 ====================
+
+    def check(self, schedule_ids=None, repair=False):
+        """
+        与数据库逐场次核对容量、有效订单和锁定中的锁位
+
+        只核对已加载的场次；核对期间正在提交的预约可能造成瞬时差异，可稍后再核对一次确认。
+
+        Args:
+            schedule_ids: 只核对这些场次，默认全部已加载场次
+            repair: 用数据库状态替换不一致的场次
+
+        Returns:
+            不一致的场次列表：Schedule_ID, memory, database（场次已删除时为 None）
+        """
+        with self._lock:
+            loaded = list(self._schedules) if schedule_ids is None else [
+                schedule_id for schedule_id in schedule_ids if schedule_id in self._schedules]
+
+        mismatches = []
+        for start in range(0, len(loaded), LOAD_CHUNK):
+            chunk = loaded[start:start + LOAD_CHUNK]
+            fresh = self._fetch(chunk)
+            now = datetime.now()
+            for schedule_id in chunk:
+                seats = self._get(schedule_id)
+                if seats is None:
+                    continue
+                with seats.lock:
+                    memory = seats.state(now)
+                database = fresh[schedule_id].state(now) if schedule_id in fresh else None
+                if memory != database:
+                    mismatches.append({'Schedule_ID': schedule_id, 'memory': memory, 'database': database})
+                    if repair:
+                        self._store({schedule_id: fresh[schedule_id]} if database else {}, missing=[schedule_id])
+
+        self._count('checks')
+        self._count('check_mismatches', len(mismatches))
+        if mismatches:
+            logger.warning(f"座位库存与数据库不一致{'（已修复）' if repair else ''}: {len(mismatches)} 个场次")
+        return mismatches
+
+    def stats(self):
+        """准入/拒绝/重新加载次数及当前场次数"""
+        with self._lock:
+            counters = dict(self._counters)
+            schedules = len(self._schedules)
+        decided = counters.get('admitted', 0) + counters.get('rejected', 0)
+        return {
+            'enabled': self.enabled,
+            'schedules': schedules,
+            'max_schedules': self.max_schedules,
+            'admitted': counters.get('admitted', 0),
+            'rejected': counters.get('rejected', 0),
+            'reject_rate': round(counters.get('rejected', 0) / decided, 4) if decided else 0.0,
+            'stale_admits': counters.get('stale_admits', 0),
+            'reloads': counters.get('reloads', 0),
+            'reload_skipped': counters.get('reload_skipped', 0),
+            'loads': counters.get('loads', 0),
+            'writes': counters.get('writes', 0),
+            'evictions': counters.get('evictions', 0),
+            'checks': counters.get('checks', 0),
+            'check_mismatches': counters.get('check_mismatches', 0),
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self._counters.clear()
+
+
+seat_inventory = SeatInventory()
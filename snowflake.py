@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+按时间递增的 64 位 ID（Snowflake 变体）- 订单号、交易流水号
+
+原来的 int(strftime('%Y%m%d%H%M%S')) + random.randint(1000, 9999) 同一秒内的两个订单有可观的概率撞号。
+新 ID 在进程内生成，生成时不访问数据库：
+
+    | 41 位 毫秒时间戳（自 2025-01-01 起，约 69 年） | 5 位 worker | 7 位 毫秒内序号 |
+
+- 总长 53 位，不超过 JavaScript Number.MAX_SAFE_INTEGER，前端按数字处理不会丢精度
+- 同一 worker 每毫秒最多 128 个，用完后借用下一毫秒；时钟回拨时沿用上次的时间戳继续递增，不会重复
+- 按时间递增，InnoDB 聚簇索引只在末尾追加；当前生成的 ID 已大于旧格式（yyyymmddHHMMSS + 随机数）的订单号
+
+worker 号取 SNOWFLAKE_CONFIG['worker_id']，或环境变量 SNOWFLAKE_WORKER_ID；
+都没有时从 T_Snowflake_Worker（迁移 014）租用一个当前没有其它进程持有的 worker 号，
+后台线程定期续约，续约失败超过一定时间后停止使用该号并重新租用；32 个都被占用时生成 ID 报错，不会退回可能重复的号。
+"""
+
+import atexit
+from datetime import datetime, timedelta
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from database import DatabaseConnection, get_pool
+from database_config import SNOWFLAKE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_BITS = 41
+WORKER_BITS = 5
+SEQUENCE_BITS = 7
+
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+EPOCH = datetime(2025, 1, 1)
+
+
+class SnowflakeGenerator:
+    """
+    单个 worker 的 ID 生成器（线程安全）
+
+    Args:
+        worker_id: 0 ~ 31，同时写库的进程各不相同
+        epoch: 时间戳起点
+        clock: 返回 Unix 秒数的时钟（测试用）
+    """
+
+    def __init__(self, worker_id, epoch=EPOCH, clock=time.time):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id 必须在 0 ~ {MAX_WORKER_ID} 之间")
+        self.worker_id = worker_id
+        self.epoch = epoch
+        self._epoch_ms = int(time.mktime(epoch.timetuple()) * 1000)
+        self._clock = clock
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self.clock_backwards = 0    # 检测到时钟回拨的次数
+        self.borrowed_ms = 0        # 序号用完或时钟回拨时借用后续毫秒的次数
+
+    def next_id(self):
+        with self._lock:
+            now_ms = int(self._clock() * 1000) - self._epoch_ms
+            if now_ms > self._last_ms:
+                self._last_ms, self._sequence = now_ms, 0
+            else:
+                if now_ms < self._last_ms:
+                    self.clock_backwards += 1
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # 本毫秒的序号已用完（或时钟回拨）：借用下一毫秒，始终单调递增，不等待时钟
+                    self._last_ms += 1
+                    self._sequence = 0
+                    self.borrowed_ms += 1
+
+            if self._last_ms >> TIMESTAMP_BITS:
+                raise OverflowError("Snowflake 时间戳超出 41 位")
+            return (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+    def parse(self, value):
+        """拆出 ID 的生成时间、worker 号和序号（排查问题用）"""
+        return {
+            'time': self.epoch + timedelta(milliseconds=value >> (WORKER_BITS + SEQUENCE_BITS)),
+            'worker_id': (value >> SEQUENCE_BITS) & MAX_WORKER_ID,
+            'sequence': value & MAX_SEQUENCE,
+        }
+
+    def stats(self):
+        return {
+            'worker_id': self.worker_id,
+            'clock_backwards': self.clock_backwards,
+            'borrowed_ms': self.borrowed_ms,
+        }
+
+
+class WorkerLease:
+    """
+    在 T_Snowflake_Worker 中租用一个 worker 号
+
+    租约到期时间按数据库时间计算（各主机时钟不一致不影响）；每 lease_seconds / 3 秒续约一次，
+    本地超过 lease_seconds * 2 / 3 秒没有续约成功即视为失效（留出余量，保证数据库中的租约到期前已停止使用）。
+    取号、续约、释放都在独立连接上立即提交，不加入当前工作单元。
+    """
+
+    def __init__(self, lease_seconds):
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()[:80]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.worker_id = None
+        self._pool = None
+        self._renewed_at = None     # 最近一次续约成功的本地 monotonic 时间
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self):
+        """租用一个空闲或租约已过期的 worker 号；全部被占用时抛出 RuntimeError"""
+        pool = get_pool()
+        with DatabaseConnection(pool=pool) as db:
+            db.cursor.execute("SELECT Worker_ID FROM T_Snowflake_Worker WHERE Lease_Expire >= NOW()")
+            busy = {row['Worker_ID'] for row in db.cursor.fetchall()}
+        for worker_id in range(MAX_WORKER_ID + 1):
+            if worker_id in busy:
+                continue
+            with DatabaseConnection(pool=pool) as db:
+                # 已有行：租约过期才能接管；没有行：插入，两个进程同时插入时只有一个成功
+                claimed = db.cursor.execute(
+                    "UPDATE T_Snowflake_Worker SET Owner = %s, Lease_Expire = DATE_ADD(NOW(), INTERVAL %s SECOND) "
+                    "WHERE Worker_ID = %s AND Lease_Expire < NOW()",
+                    (self.owner, self.lease_seconds, worker_id)
+                ) or db.cursor.execute(
+                    "INSERT IGNORE INTO T_Snowflake_Worker (Worker_ID, Owner, Lease_Expire) "
+                    "VALUES (%s, %s, DATE_ADD(NOW(), INTERVAL %s SECOND))",
+                    (worker_id, self.owner, self.lease_seconds)
+                )
+            if claimed:
+                self.worker_id, self._pool, self._renewed_at = worker_id, pool, time.monotonic()
+                return worker_id
+        raise RuntimeError(f"没有可用的 Snowflake worker 号（{MAX_WORKER_ID + 1} 个均被占用），"
+                           f"请减少进程数或为进程显式配置 SNOWFLAKE_WORKER_ID")
+
+    def valid(self):
+        """租约是否仍可使用（续约及时且数据库后端未切换）"""
+        return (self._renewed_at is not None and self._pool is get_pool()
+                and time.monotonic() - self._renewed_at < self.lease_seconds * 2 / 3)
+
+    def renew(self):
+        """续约；租约已被其它进程接管时返回 False"""
+        with DatabaseConnection(pool=self._pool) as db:
+            renewed = db.cursor.execute(
+                "UPDATE T_Snowflake_Worker SET Lease_Expire = DATE_ADD(NOW(), INTERVAL %s SECOND) "
+                "WHERE Worker_ID = %s AND Owner = %s",
+                (self.lease_seconds, self.worker_id, self.owner)
+            )
+        if renewed:
+            self._renewed_at = time.monotonic()
+        return bool(renewed)
+
+    def release(self):
+        """停止续约并释放（租约到期时间改为当前时间，下一秒起可被其它进程租用）"""
+        self._stop.set()
+        self._renewed_at = None
+        if self.worker_id is None:
+            return
+        try:
+            with DatabaseConnection(pool=self._pool) as db:
+                db.cursor.execute(
+                    "UPDATE T_Snowflake_Worker SET Lease_Expire = NOW() WHERE Worker_ID = %s AND Owner = %s",
+                    (self.worker_id, self.owner)
+                )
+        except Exception as e:
+            logger.warning(f"释放 Snowflake worker 号失败: worker_id={self.worker_id}: {str(e)}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='snowflake-lease', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                if not self.renew():
+                    logger.error(f"Snowflake worker 号租约已被接管: worker_id={self.worker_id}，将重新租用")
+                    self._renewed_at = None
+                    return
+            except Exception as e:
+                logger.warning(f"Snowflake worker 号续约失败: worker_id={self.worker_id}: {str(e)}")
+
+
+def _configured_worker_id():
+    configured = SNOWFLAKE_CONFIG.get('worker_id')
+    if configured is None and os.environ.get('SNOWFLAKE_WORKER_ID'):
+        configured = int(os.environ['SNOWFLAKE_WORKER_ID'])
+    return configured
+
+
+_generator = None
+_lease = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    """当前进程的生成器（首次使用时确定 worker 号；租用的 worker 号失效后重新租用）"""
+    global _generator, _lease
+    generator, lease = _generator, _lease
+    if generator is not None and (lease is None or lease.valid()):
+        return generator
+    with _generator_lock:
+        if _generator is None or (_lease is not None and not _lease.valid()):
+            if _lease is not None:
+                _lease.release()
+                _lease = None
+            worker_id = _configured_worker_id()
+            if worker_id is None:
+                lease = WorkerLease(SNOWFLAKE_CONFIG['lease_seconds'])
+                worker_id = lease.acquire()
+                lease.start()
+                _lease = lease
+            _generator = SnowflakeGenerator(worker_id)
+            logger.info(f"Snowflake ID 生成器: worker_id={worker_id}"
+                        + (f"（租用，owner={_lease.owner}）" if _lease is not None else ""))
+        return _generator
+
+
+def next_id():
+    """生成一个新的订单号/交易流水号"""
+    return get_generator().next_id()
+
+
+def release():
+    """释放租用的 worker 号（进程退出时自动调用）"""
+    global _generator, _lease
+    with _generator_lock:
+        if _lease is not None:
+            _lease.release()
+            _lease = None
+            _generator = None
+
+
+def _reset_after_fork():
+    # fork 出的子进程不能沿用父进程的序号状态和 worker 号租约（续约线程也不会被复制），首次生成 ID 时重新确定
+    global _generator, _lease, _generator_lock
+    _generator = None
+    _lease = None
+    _generator_lock = threading.Lock()
+
+
+atexit.register(release)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+抢位并发基准
+功能：N 个玩家同时对同一个场次发起锁位/下单，检查是否超卖，并统计吞吐与耗时
+用法：
+    python tools/bench_contention.py                          # SQLite，200 人抢一个场次的锁位
+    python tools/bench_contention.py --op order --players 500 # 下单
+    python tools/bench_contention.py --capacity 50            # 把场次名额调大，观察排队吞吐
+    python tools/bench_contention.py --no-inventory           # 关闭座位库存，所有请求都进数据库排队
+    python tools/bench_contention.py --mysql --schedule 4001  # 对配置中的 MySQL 跑（会写入真实数据）
+
+每次调用放在一个工作单元中（与一次 API 请求相同）；结束时按数据库中的实际记录核对：
+成功数 == 实际占用名额 == 场次占用计数，且不超过场次容量，座位库存与数据库核对一致，否则退出码为 1。
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_models import prepare_sqlite_database, _empty_schedules, _percentile
+
+from database import SafeDatabase, use_backend
+from seat_inventory import seat_inventory
+
+# ==================== 配置区 ====================
+DEFAULT_PLAYERS = 200          # 同时抢位的玩家数
+DEFAULT_CONCURRENCY = 32       # 并发线程数
+DEFAULT_CAPACITY = 6           # 场次名额（SQLite 模式下设置到剧本的 Max_Players）
+
+
+def _occupied(schedule_id):
+    """按数据库中的实际记录统计场次占用（不依赖模型的计数逻辑），同时返回场次行上的占用计数"""
+    row = SafeDatabase.execute_query("""
+        SELECT
+            (SELECT COUNT(*) FROM T_Order WHERE Schedule_ID = %s AND Pay_Status IN (0, 1)) AS booked,
+            (SELECT COUNT(*) FROM t_lock_record
+             WHERE Schedule_ID = %s AND Status = 0 AND ExpireTime > NOW()) AS locked,
+            (SELECT sc.Max_Players FROM T_Schedule sch JOIN T_Script sc ON sch.Script_ID = sc.Script_ID
+             WHERE sch.Schedule_ID = %s) AS capacity,
+            (SELECT Booked_Count + Locked_Count FROM T_Schedule WHERE Schedule_ID = %s) AS counted
+    """, (schedule_id, schedule_id, schedule_id, schedule_id), fetch_one=True)
+    return row['booked'] + row['locked'], row['capacity'], row['counted']
+
+
+def run_contention(schedule_id, players, op, concurrency):
+    """所有线程就绪后同时开始，每个玩家发起一次锁位/下单"""
+    from models.lock_model import LockModel
+    from models.order_model import OrderModel
+
+    action = LockModel.create_lock if op == 'lock' else OrderModel.create_order
+    barrier = threading.Barrier(min(concurrency, len(players)))
+    started = threading.local()
+    outcomes = Counter()
+    timings = []
+    lock = threading.Lock()
+
+    def book(player_id):
+        if not getattr(started, 'done', False):
+            started.done = True
+            barrier.wait()
+        begin = time.perf_counter()
+        try:
+            with SafeDatabase.unit_of_work():
+                action(player_id, schedule_id)
+            outcome = 'success'
+        except ValueError as e:
+            outcome = str(e)
+        except Exception as e:
+            outcome = f"{type(e).__name__}: {e}"
+        elapsed = (time.perf_counter() - begin) * 1000
+        with lock:
+            outcomes[outcome] += 1
+            timings.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(book, players))
+    wall = time.perf_counter() - start
+    timings.sort()
+    return outcomes, timings, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="抢位并发基准（检查超卖）")
+    parser.add_argument('--op', choices=['lock', 'order'], default='lock')
+    parser.add_argument('--players', type=int, default=DEFAULT_PLAYERS)
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY, help="场次名额（仅 SQLite 模式）")
+    parser.add_argument('--mysql', action='store_true', help="使用 database_config.py 中的 MySQL")
+    parser.add_argument('--schedule', type=int, help="MySQL 模式下抢位的场次ID")
+    parser.add_argument('--no-inventory', action='store_true', help="关闭座位库存（对比用）")
+    args = parser.parse_args()
+    seat_inventory.enabled = not args.no_inventory
+
+    logging.disable(logging.CRITICAL)  # 名额已满等业务失败会大量写 ERROR 日志
+
+    info = None
+    if args.mysql:
+        if not args.schedule:
+            parser.error("--mysql 需要同时指定 --schedule")
+        schedule_id = args.schedule
+        rows = SafeDatabase.execute_query(
+            "SELECT Player_ID FROM T_Player ORDER BY Player_ID LIMIT %s", (args.players,))
+        players = [row['Player_ID'] for row in rows]
+    else:
+        backend, info = prepare_sqlite_database(players=max(args.players, 100), schedules=100)
+        schedule_id = _empty_schedules(info, 1)[0]
+        SafeDatabase.execute_update("UPDATE T_Script SET Max_Players = %s WHERE Script_ID = 1001", (args.capacity,))
+        players = info['players'][:args.players]
+
+    occupied_before, capacity, _ = _occupied(schedule_id)
+    print("=" * 70)
+    print(f"抢位并发基准：{len(players)} 个玩家 / {args.concurrency} 线程 -> 场次 {schedule_id}"
+          f"（{'锁位' if args.op == 'lock' else '下单'}，名额 {capacity}，已占用 {occupied_before}）")
+    print("=" * 70)
+
+    outcomes, timings, wall = run_contention(schedule_id, players, args.op, args.concurrency)
+    occupied_after, _, counted = _occupied(schedule_id)
+
+    for outcome, count in outcomes.most_common():
+        print(f"  {outcome:<40}{count:>8}")
+    print("-" * 70)
+    print(f"  耗时 {wall:.2f}s，吞吐 {len(players) / wall:.0f} 次/秒，"
+          f"p50 {_percentile(timings, 50):.1f}ms，p95 {_percentile(timings, 95):.1f}ms，"
+          f"max {timings[-1]:.1f}ms")
+    retries = SafeDatabase.get_query_stats(top=0)['retries']
+    if retries:
+        print(f"  冲突重试: {retries}")
+
+    gained = occupied_after - occupied_before
+    oversold = occupied_after > capacity or gained != outcomes['success'] or counted != occupied_after
+    print(f"  成功 {outcomes['success']}，实际新增占用 {gained}，最终占用 {occupied_after}/{capacity}"
+          f"（场次计数 {counted}） -> {'✗ 超卖/计数不一致' if oversold else '✓ 无超卖'}")
+
+    if seat_inventory.enabled:
+        stats = seat_inventory.stats()
+        mismatches = seat_inventory.check([schedule_id])
+        print(f"  座位库存: 内存拒绝 {stats['rejected']}，放行 {stats['admitted']}，"
+              f"放行后被数据库拒绝 {stats['stale_admits']}，重新加载 {stats['reloads']} -> "
+              f"{'✗ 与数据库不一致' if mismatches else '✓ 与数据库一致'}")
+        oversold = oversold or bool(mismatches)
+
+    if info is not None:
+        use_backend(None)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(info['path'] + suffix):
+                os.remove(info['path'] + suffix)
+    sys.exit(1 if oversold else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ID 分配吞吐基准
+功能：多个进程同时从同一个序列取 ID（id_allocator.py 的 hi/lo 号段），统计吞吐并检查是否有重复；
+      同样对订单号/流水号（snowflake.py，每个进程一个 worker 号）检查重复和单调递增
+用法：
+    python tools/bench_ids.py                                  # SQLite，4 进程 × 20000 个 ID，号段 1/10/100/1000 对比
+    python tools/bench_ids.py --processes 8 --block-size 100
+    python tools/bench_ids.py --mysql --count 5000             # 对配置中的 MySQL 跑（会推进真实序列，只产生 ID 空洞）
+
+号段大小为 1 时每个 ID 都要一次取号事务，相当于数据库序列/MAX(id)+1 的往返次数；
+出现重复 ID（或订单号不单调递增、超出 53 位）时退出码为 1。
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from database import use_backend
+from database_config import ID_ALLOCATOR_CONFIG
+from db_backends import SQLiteBackend
+from id_allocator import HiLoAllocator
+from snowflake import SnowflakeGenerator
+
+# ==================== 配置区 ====================
+DEFAULT_PROCESSES = 4          # 同时取号的进程数
+DEFAULT_COUNT = 20000          # 每个进程取的 ID 数
+DEFAULT_BLOCK_SIZES = [1, 10, 100, 1000]
+SEQUENCE = 'lock'
+
+
+def _worker(task):
+    """子进程：切换到同一个数据库，等所有进程就绪后连续取 count 个 ID"""
+    sqlite_path, block_size, count, start_at = task
+    logging.disable(logging.CRITICAL)
+    if sqlite_path:
+        use_backend(SQLiteBackend(sqlite_path, busy_timeout=30))
+    table, column, floor = ID_ALLOCATOR_CONFIG['sequences'][SEQUENCE]
+    allocator = HiLoAllocator(SEQUENCE, table, column, floor, block_size)
+
+    time.sleep(max(0.0, start_at - time.time()))
+    begin = time.perf_counter()
+    ids = [allocator.next_id() for _ in range(count)]
+    return ids, time.perf_counter() - begin, allocator.blocks
+
+
+def _snowflake_worker(task):
+    worker_id, count, start_at = task
+    generator = SnowflakeGenerator(worker_id)
+    time.sleep(max(0.0, start_at - time.time()))
+    begin = time.perf_counter()
+    ids = [generator.next_id() for _ in range(count)]
+    elapsed = time.perf_counter() - begin
+    monotonic = all(a < b for a, b in zip(ids, ids[1:]))
+    return ids, elapsed, monotonic, generator.borrowed_ms
+
+
+def run_snowflake(processes, count):
+    start_at = time.time() + 1.0
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_snowflake_worker, [(worker_id, count, start_at) for worker_id in range(processes)])
+    all_ids = [i for ids, _, _, _ in results for i in ids]
+    wall = max(elapsed for _, elapsed, _, _ in results)
+    monotonic = all(ok for _, _, ok, _ in results)
+    borrowed = sum(b for _, _, _, b in results)
+    return len(all_ids), len(all_ids) - len(set(all_ids)), wall, monotonic, borrowed, max(all_ids)
+
+
+def run(sqlite_path, processes, count, block_size):
+    start_at = time.time() + 1.0    # 给子进程留出启动时间，同时开始
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_worker, [(sqlite_path, block_size, count, start_at)] * processes)
+    all_ids = [i for ids, _, _ in results for i in ids]
+    wall = max(elapsed for _, elapsed, _ in results)
+    blocks = sum(b for _, _, b in results)
+    return len(all_ids), len(all_ids) - len(set(all_ids)), wall, blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ID 分配吞吐基准（多进程）")
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES)
+    parser.add_argument('--count', type=int, default=DEFAULT_COUNT, help="每个进程取的 ID 数")
+    parser.add_argument('--block-size', type=int, action='append', help="号段大小（可重复），默认 1/10/100/1000")
+    parser.add_argument('--mysql', action='store_true', help="使用 database_config.py 中的 MySQL")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    sqlite_path = None
+    if not args.mysql:
+        fd, sqlite_path = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_ids_')
+        os.close(fd)
+        os.remove(sqlite_path)
+        SQLiteBackend(sqlite_path).create_schema()
+
+    print("=" * 70)
+    print(f"ID 分配基准：{args.processes} 个进程 × {args.count} 个 ID（序列 {SEQUENCE}）")
+    print("=" * 70)
+    print(f"  {'号段大小':<10}{'取号事务':>10}{'耗时(s)':>10}{'ID/秒':>12}{'重复':>8}")
+
+    failed = False
+    try:
+        for block_size in args.block_size or DEFAULT_BLOCK_SIZES:
+            total, duplicates, wall, blocks = run(sqlite_path, args.processes, args.count, block_size)
+            failed = failed or duplicates > 0
+            print(f"  {block_size:<10}{blocks:>10}{wall:>10.2f}{total / wall:>12.0f}{duplicates:>8}")
+
+        total, duplicates, wall, monotonic, borrowed, largest = run_snowflake(args.processes, args.count)
+        failed = failed or duplicates > 0 or not monotonic or largest > 2 ** 53 - 1
+        print(f"  {'snowflake':<10}{'-':>10}{wall:>10.2f}{total / wall:>12.0f}{duplicates:>8}"
+              f"   单调递增 {'是' if monotonic else '否'}，借用毫秒 {borrowed}，最大 ID {largest}")
+    finally:
+        if sqlite_path:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(sqlite_path + suffix):
+                    os.remove(sqlite_path + suffix)
+
+    print("-" * 70)
+    print("  ✗ 出现重复 ID" if failed else "  ✓ 所有进程分配的 ID 均不重复")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模型方法性能基准（无需 MySQL）
+功能：在临时 SQLite 数据库中生成演示规模的数据，逐个调用模型方法并统计耗时，
+      可与上一次的结果对比，发现性能回退
+用法：
+    python tools/bench_models.py                         # 默认规模跑一遍
+    python tools/bench_models.py --json bench.json       # 保存结果
+    python tools/bench_models.py --baseline bench.json   # 与基线对比，回退时退出码为 1
+    python tools/bench_models.py --cache                 # 开启查询缓存（默认关闭，测的是 SQL 本身）
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from database import SafeDatabase, use_backend
+from db_backends import SQLiteBackend
+from query_cache import query_cache
+
+# ==================== 配置区 ====================
+DEFAULT_PLAYERS = 2000         # 玩家数
+DEFAULT_SCHEDULES = 2000       # 历史 + 未来场次数
+DEFAULT_ITERATIONS = 200       # 每个方法的调用次数
+REGRESSION_RATIO = 1.3         # p50 超过基线的该倍数视为回退
+REGRESSION_MIN_MS = 0.5        # 且至少慢这么多毫秒（忽略亚毫秒级抖动）
+
+SCRIPT_COUNT = 12
+ROOM_COUNT = 6
+DM_COUNT = 8
+FIRST_PLAYER_ID = 3001
+FIRST_SCHEDULE_ID = 4001
+FIRST_ORDER_ID = 100000
+FIRST_LOCK_ID = 7001
+
+
+def prepare_sqlite_database(path=None, players=DEFAULT_PLAYERS, schedules=DEFAULT_SCHEDULES, seed=42):
+    """
+    创建 SQLite 数据库、建表、生成数据，并把 SafeDatabase 切换到该数据库
+
+    Returns:
+        (backend, info)：info 包含生成的 ID 范围，供基准场景选择参数
+    """
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_')
+        os.close(fd)
+        os.remove(path)
+    backend = SQLiteBackend(path)
+    backend.create_schema()
+    use_backend(backend)
+
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    insert = SafeDatabase.execute_many
+
+    insert("INSERT INTO T_DM (DM_ID, Name, Phone, Star_Level) VALUES (%s, %s, %s, %s)",
+           [(i, f"DM{i}", f"138{i:08d}", rng.randint(3, 5)) for i in range(1, DM_COUNT + 1)])
+    insert("INSERT INTO T_Room (Room_ID, Room_Name, Capacity) VALUES (%s, %s, %s)",
+           [(i, f"房间{i}", 8) for i in range(1, ROOM_COUNT + 1)])
+
+    scripts = []
+    for i in range(SCRIPT_COUNT):
+        max_players = rng.randint(5, 8)
+        scripts.append((1001 + i, f"剧本{i + 1}", rng.choice(['硬核推理', '情感沉浸', '欢乐机制', '惊悚IP']),
+                        max_players - 1, max_players, Decimal(rng.choice([88, 98, 128, 168])), 1))
+    insert("INSERT INTO T_Script (Script_ID, Title, Type, Min_Players, Max_Players, Base_Price, Status) "
+           "VALUES (%s, %s, %s, %s, %s, %s, %s)", scripts)
+    max_players = {row[0]: row[4] for row in scripts}
+
+    player_ids = list(range(FIRST_PLAYER_ID, FIRST_PLAYER_ID + players))
+    insert("INSERT INTO T_Player (Player_ID, Open_ID, Nickname, Phone) VALUES (%s, %s, %s, %s)",
+           [(pid, f"open_{pid}", f"玩家{pid}", f"139{pid:08d}") for pid in player_ids])
+    insert("INSERT INTO T_User (Username, Phone, Password_Hash, Role, Ref_ID, Create_Time) "
+           "VALUES (%s, %s, %s, %s, %s, %s)",
+           [(f"player_{pid}", f"139{pid:08d}", 'default$bench', 'player', pid, now) for pid in player_ids])
+
+    schedule_rows, order_rows, trans_rows, lock_rows = [], [], [], []
+    order_id, lock_id = FIRST_ORDER_ID, FIRST_LOCK_ID
+    future_ids = []
+    for i in range(schedules):
+        schedule_id = FIRST_SCHEDULE_ID + i
+        script_id = rng.choice(list(max_players))
+        start = now + timedelta(days=rng.randint(-60, 30), hours=rng.choice([10, 14, 19]))
+        status = 2 if start < now else 0
+        schedule_rows.append((schedule_id, rng.randint(1, ROOM_COUNT), script_id, rng.randint(1, DM_COUNT),
+                              start, start + timedelta(hours=4), status, Decimal('98.00')))
+        if start > now:
+            future_ids.append(schedule_id)
+
+        for player_id in rng.sample(player_ids, rng.randint(0, max_players[script_id] - 1)):
+            pay_status = rng.choices([0, 1, 2, 3], weights=[1, 7, 1, 1])[0]
+            created = min(start, now) - timedelta(days=rng.randint(0, 10))
+            order_rows.append((order_id, player_id, schedule_id, Decimal('98.00'), pay_status, created))
+            if pay_status in (1, 2):
+                trans_rows.append((order_id, order_id, Decimal('98.00'), 1, rng.randint(1, 3), created, 1))
+            order_id += 1
+
+        if start > now and rng.random() < 0.3:
+            lock_time = now - timedelta(minutes=rng.randint(0, 30))
+            lock_rows.append((lock_id, schedule_id, rng.choice(player_ids), lock_time,
+                              lock_time + timedelta(minutes=15), rng.choice([0, 1, 2, 3])))
+            lock_id += 1
+
+    insert("INSERT INTO T_Schedule (Schedule_ID, Room_ID, Script_ID, DM_ID, Start_Time, End_Time, Status, Real_Price) "
+           "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", schedule_rows)
+    insert("INSERT INTO T_Order (Order_ID, Player_ID, Schedule_ID, Amount, Pay_Status, Create_Time) "
+           "VALUES (%s, %s, %s, %s, %s, %s)", order_rows)
+    insert("INSERT INTO T_Transaction (Trans_ID, Order_ID, Amount, Trans_Type, Channel, Trans_Time, Result) "
+           "VALUES (%s, %s, %s, %s, %s, %s, %s)", trans_rows)
+    insert("INSERT INTO t_lock_record (LockID, Schedule_ID, Player_ID, LockTime, ExpireTime, Status) "
+           "VALUES (%s, %s, %s, %s, %s, %s)", lock_rows)
+
+    # 与迁移 008 的回填相同：按订单/锁位明细统计场次占用计数
+    from models.schedule_model import ScheduleModel
+    ScheduleModel.reconcile_counts()
+
+    info = {
+        'path': path,
+        'players': player_ids,
+        'future_schedules': future_ids,
+        'next_schedule_id': FIRST_SCHEDULE_ID + schedules,
+        'counts': {
+            'schedules': len(schedule_rows), 'orders': len(order_rows),
+            'transactions': len(trans_rows), 'locks': len(lock_rows),
+        },
+    }
+    return backend, info
+
+
+def _empty_schedules(info, count):
+    """为写操作基准准备空场次（避免名额已满/重复预约影响计时）"""
+    start_id = info['next_schedule_id']
+    info['next_schedule_id'] += count
+    start = datetime.now().replace(microsecond=0) + timedelta(days=7)
+    SafeDatabase.execute_many(
+        "INSERT INTO T_Schedule (Schedule_ID, Room_ID, Script_ID, DM_ID, Start_Time, End_Time, Status, Real_Price) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        [(start_id + i, 1, 1001, 1, start + timedelta(hours=i), start + timedelta(hours=i + 4), 0, Decimal('98.00'))
+         for i in range(count)]
+    )
+    return list(range(start_id, start_id + count))
+
+
+def build_scenarios(info, iterations, rng):
+    """返回 [(名称, 每次调用的函数)]；写操作按 下单 -> 支付 -> 取消 的顺序串联"""
+    from models.auth_model import AuthModel
+    from models.lock_model import LockModel
+    from models.order_model import OrderModel
+    from models.report_model import ReportModel
+    from models.schedule_model import ScheduleModel
+    from models.script_model import ScriptModel
+
+    players = info['players']
+    today = datetime.now().date()
+    month_ago = (today - timedelta(days=30)).isoformat()
+
+    lock_schedules = _empty_schedules(info, iterations)
+    order_schedules = _empty_schedules(info, iterations)
+    created_locks, created_orders = [], []
+
+    def sequence(items):
+        iterator = iter(items)
+
+        def take():
+            try:
+                return next(iterator)
+            except StopIteration:
+                raise RuntimeError("没有可用的前置数据（前面的写操作有失败）") from None
+        return take
+
+    next_lock_slot = sequence(zip(players, lock_schedules))
+    next_order_slot = sequence(zip(players, order_schedules))
+    next_created_lock = sequence(created_locks)
+    next_created_order = sequence(created_orders)
+    next_paid_order = sequence(created_orders)
+
+    def create_lock():
+        player_id, schedule_id = next_lock_slot()
+        created_locks.append((LockModel.create_lock(player_id, schedule_id), player_id))
+
+    def cancel_lock():
+        lock_id, player_id = next_created_lock()
+        LockModel.cancel_lock(lock_id, player_id)
+
+    def create_order():
+        player_id, schedule_id = next_order_slot()
+        created_orders.append((OrderModel.create_order(player_id, schedule_id), player_id))
+
+    def pay_order():
+        OrderModel.pay_order(next_paid_order()[0])
+
+    def cancel_order():
+        order_id, player_id = next_created_order()
+        OrderModel.cancel_order(order_id, player_id)
+
+    return [
+        ('ScriptModel.get_all_scripts', lambda: ScriptModel.get_all_scripts(1)),
+        ('ScriptModel.get_script_by_id', lambda: ScriptModel.get_script_by_id(rng.randint(1001, 1000 + SCRIPT_COUNT))),
+        ('ScriptModel.get_hot_scripts', lambda: ScriptModel.get_hot_scripts(10)),
+        ('ScheduleModel.get_schedules_by_script',
+         lambda: ScheduleModel.get_schedules_by_script(rng.randint(1001, 1000 + SCRIPT_COUNT), rng.choice(players))),
+        ('ScheduleModel.get_all_schedules', lambda: ScheduleModel.get_all_schedules(date=today.isoformat())),
+        ('OrderModel.get_orders_by_player', lambda: OrderModel.get_orders_by_player(rng.choice(players))),
+        ('OrderModel.get_all_orders', lambda: OrderModel.get_all_orders(dm_id=rng.randint(1, DM_COUNT))),
+        ('LockModel.get_locks_by_player', lambda: LockModel.get_locks_by_player(rng.choice(players))),
+        ('LockModel.get_all_locks', lambda: LockModel.get_all_locks(dm_id=rng.randint(1, DM_COUNT))),
+        ('AuthModel.get_current_user_info', lambda: AuthModel.get_current_user_info(rng.randint(1, len(players)), 'player')),
+        ('ReportModel.get_dashboard_stats', lambda: ReportModel.get_dashboard_stats()),
+        ('ReportModel.get_top_scripts', lambda: ReportModel.get_top_scripts(month_ago, today.isoformat())),
+        ('ReportModel.get_room_utilization', lambda: ReportModel.get_room_utilization(month_ago, today.isoformat())),
+        ('ReportModel.get_lock_conversion_rate', lambda: ReportModel.get_lock_conversion_rate(month_ago, today.isoformat())),
+        ('ReportModel.get_dm_performance', lambda: ReportModel.get_dm_performance(month_ago, today.isoformat())),
+        ('LockModel.create_lock', create_lock),
+        ('LockModel.cancel_lock', cancel_lock),
+        ('OrderModel.create_order', create_order),
+        ('OrderModel.pay_order', pay_order),
+        ('OrderModel.cancel_order', cancel_order),
+    ]
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(func, iterations):
+    """每次调用放在一个工作单元中（与一次 API 请求相同），返回耗时统计"""
+    timings, errors, first_error = [], 0, None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            with SafeDatabase.unit_of_work():
+                func()
+        except Exception as e:
+            errors += 1
+            first_error = first_error or f"{type(e).__name__}: {e}"
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    total = sum(timings)
+    return {
+        'calls': iterations,
+        'errors': errors,
+        'first_error': first_error,
+        'mean_ms': round(total / iterations, 3),
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p95_ms': round(_percentile(timings, 95), 3),
+        'max_ms': round(timings[-1], 3),
+        'ops_per_sec': round(iterations / (total / 1000), 1) if total else None,
+    }
+
+
+def compare(results, baseline):
+    """与基线对比，返回回退列表"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        if (current['p50_ms'] > previous['p50_ms'] * REGRESSION_RATIO
+                and current['p50_ms'] - previous['p50_ms'] > REGRESSION_MIN_MS):
+            regressions.append((name, previous['p50_ms'], current['p50_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型方法性能基准（SQLite）")
+    parser.add_argument('--players', type=int, default=DEFAULT_PLAYERS)
+    parser.add_argument('--schedules', type=int, default=DEFAULT_SCHEDULES)
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--only', help="只跑名称包含该字符串的方法")
+    parser.add_argument('--json', help="结果保存为 JSON 文件")
+    parser.add_argument('--baseline', help="与该 JSON 基线对比，回退时退出码为 1")
+    parser.add_argument('--keep-db', action='store_true', help="保留生成的 SQLite 数据库文件")
+    parser.add_argument('--cache', action='store_true', help="开启查询缓存（默认关闭，以便与基线比较 SQL 耗时）")
+    args = parser.parse_args()
+
+    query_cache.enabled = args.cache
+
+    logging.disable(logging.WARNING)  # 基准期间关闭逐条 SQL 日志（日志本身会主导耗时）
+
+    print("=" * 78)
+    print("模型方法性能基准（SQLite 后端）")
+    print("=" * 78)
+    start = time.perf_counter()
+    backend, info = prepare_sqlite_database(players=args.players, schedules=args.schedules)
+    print(f"数据库: {info['path']}")
+    print(f"数据量: 玩家 {len(info['players'])}, " + ", ".join(f"{k} {v}" for k, v in info['counts'].items())
+          + f"（生成耗时 {time.perf_counter() - start:.1f}s）")
+    print("=" * 78)
+
+    rng = random.Random(7)
+    results = {}
+    print(f"{'方法':<42}{'p50(ms)':>9}{'p95(ms)':>9}{'max(ms)':>9}{'ops/s':>9}")
+    for name, func in build_scenarios(info, args.iterations, rng):
+        if args.only and args.only not in name:
+            continue
+        stats = run_scenario(func, args.iterations)
+        results[name] = stats
+        flag = f"  ✗ {stats['errors']} 次失败: {stats['first_error']}" if stats['errors'] else ''
+        print(f"{name:<42}{stats['p50_ms']:>9.3f}{stats['p95_ms']:>9.3f}{stats['max_ms']:>9.3f}"
+              f"{stats['ops_per_sec'] or 0:>9.0f}{flag}")
+
+    output = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'players': args.players,
+        'schedules': args.schedules,
+        'iterations': args.iterations,
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.json}")
+
+    if not args.keep_db:
+        use_backend(None)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(info['path'] + suffix):
+                os.remove(info['path'] + suffix)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f))
+        print("\n" + "=" * 78)
+        if regressions:
+            for name, before, after in regressions:
+                print(f"⚠️  {name}: p50 {before:.3f}ms → {after:.3f}ms")
+            exit_code = 1
+        else:
+            print("✅ 与基线相比没有性能回退")
+
+    failed = [name for name, stats in results.items() if stats['errors']]
+    if failed:
+        print(f"\n⚠️  以下方法调用失败: {', '.join(failed)}")
+        exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
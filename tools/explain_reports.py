@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+报表执行计划检查
+功能：调用各报表/场次列表的模型方法，截取其执行的 SQL 并 EXPLAIN，
+      检查按日期范围筛选的表走的是预期索引（范围扫描/索引查找），而不是全表扫描
+用法：
+    python tools/explain_reports.py                   # 在临时 SQLite 数据库上检查（无需 MySQL）
+    python tools/explain_reports.py --mysql           # 在 database_config.DB_CONFIG 指向的 MySQL 上检查
+    python tools/explain_reports.py --plan            # 同时打印每条语句的完整执行计划
+    python tools/explain_reports.py --json plans.json # 结果保存为 JSON
+有检查不通过时退出码为 1（可放在迁移/改 SQL 之后的检查步骤中）
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from database import SafeDatabase, use_backend
+from date_range import parse_date
+from query_cache import query_cache
+
+# ==================== 配置区 ====================
+DEFAULT_DAYS = 30              # 默认检查最近多少天的日期范围
+CHECK_DM_ID = 1                # DM 分域场景使用的 DM_ID
+
+# SQLite：EXPLAIN QUERY PLAN 的 detail，如 "SEARCH t USING INDEX T_Transaction_idx_x (Trans_Type=? ...)"
+_SQLITE_ACCESS = re.compile(r"^(SCAN|SEARCH) (\w+)(?: USING (?:COVERING )?INDEX (\w+)| USING (INTEGER PRIMARY KEY))?")
+
+
+def build_checks(start, end, today):
+    """
+    检查项：(名称, 调用, 语句特征, {表别名: 允许的索引})
+
+    只检查 SQL 中包含“语句特征”的那条语句；允许的索引为 None 时只要求不是全表扫描
+    """
+    from models.report_model import ReportModel
+    from models.schedule_model import ScheduleModel
+
+    return [
+        ('dashboard 营收', lambda: ReportModel.get_dashboard_stats(),
+         'FROM T_Transaction t', {'t': ('idx_trans_type_result_time',)}),
+        ('dashboard 营收(DM)', lambda: ReportModel.get_dashboard_stats(dm_id=CHECK_DM_ID),
+         'FROM T_Transaction t', {'t': None, 'o': None, 'sch': None}),
+        ('热门剧本', lambda: ReportModel.get_top_scripts(start, end),
+         'FROM T_Script s', {'sch': None, 'o': None}),
+        ('热门剧本(DM)', lambda: ReportModel.get_top_scripts(start, end, dm_id=CHECK_DM_ID),
+         'FROM T_Script s', {'sch': None, 'o': None}),
+        ('房间利用率', lambda: ReportModel.get_room_utilization(start, end),
+         'FROM T_Room r', {'sch': ('idx_schedule_start', 'idx_schedule_dm_start'), 'o': None}),
+        ('房间利用率(DM)', lambda: ReportModel.get_room_utilization(start, end, dm_id=CHECK_DM_ID),
+         'FROM T_Room r', {'sch': ('idx_schedule_dm_start',), 'o': None}),
+        ('锁位转化率', lambda: ReportModel.get_lock_conversion_rate(start, end),
+         'FROM t_lock_record l', {'l': ('idx_lock_time',)}),
+        ('DM 业绩', lambda: ReportModel.get_dm_performance(start, end),
+         'FROM T_DM d', {'sch': ('idx_schedule_dm_start', 'idx_schedule_start'), 'o': None}),
+        ('场次列表(按日期)', lambda: ScheduleModel.get_all_schedules(today),
+         'FROM T_Schedule sch', {'sch': ('idx_schedule_start', 'idx_schedule_dm_start')}),
+        ('场次列表(按日期+DM)', lambda: ScheduleModel.get_all_schedules(today, dm_id=CHECK_DM_ID),
+         'FROM T_Schedule sch', {'sch': ('idx_schedule_dm_start',)}),
+    ]
+
+
+def capture_queries(func):
+    """执行 func，返回期间经 SafeDatabase.execute_query 执行的 [(sql, params)]"""
+    captured = []
+    original = SafeDatabase.execute_query
+
+    def recording(sql, params=None, *args, **kwargs):
+        captured.append((sql, params))
+        return original(sql, params, *args, **kwargs)
+
+    SafeDatabase.execute_query = staticmethod(recording)
+    try:
+        func()
+    finally:
+        SafeDatabase.execute_query = staticmethod(original)
+    return captured
+
+
+def explain(sql, params, mysql):
+    """
+    EXPLAIN 一条语句
+
+    Returns:
+        (plan, access)：plan 为可打印的计划行；access 为 {表别名: (是否全表扫描, 使用的索引名)}
+    """
+    access = {}
+    if mysql:
+        rows = SafeDatabase.execute_query("EXPLAIN " + sql, params)
+        plan = []
+        for row in rows:
+            alias, scan_type, key = row.get('table'), row.get('type'), row.get('key')
+            plan.append(f"{alias}: type={scan_type} key={key} rows={row.get('rows')} extra={row.get('Extra')}")
+            if alias and not alias.startswith('<'):
+                access[alias] = (scan_type in ('ALL', 'index'), key)
+        return plan, access
+
+    rows = SafeDatabase.execute_query("EXPLAIN QUERY PLAN " + sql, params)
+    plan = [row['detail'] for row in rows]
+    for detail in plan:
+        match = _SQLITE_ACCESS.match(detail)
+        if match:
+            mode, alias, index, rowid = match.groups()
+            access[alias] = (mode == 'SCAN', index or ('PRIMARY' if rowid else None))
+    return plan, access
+
+
+def check_access(access, expected):
+    """按期望检查各表的访问方式，返回问题列表"""
+    problems = []
+    for alias, allowed in expected.items():
+        if alias not in access:
+            problems.append(f"{alias}: 执行计划中没有该表")
+            continue
+        full_scan, index = access[alias]
+        if full_scan:
+            problems.append(f"{alias}: 全表扫描（索引 {index or '无'}）")
+        elif allowed and not any(index and index.endswith(name) for name in allowed):
+            problems.append(f"{alias}: 使用 {index or '无索引'}，预期 {' / '.join(allowed)}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="报表执行计划检查")
+    parser.add_argument('--mysql', action='store_true', help="检查配置的 MySQL 数据库（默认在临时 SQLite 库上检查）")
+    parser.add_argument('--start', type=parse_date, help="开始日期 YYYY-MM-DD（默认最近 30 天）")
+    parser.add_argument('--end', type=parse_date, help="结束日期 YYYY-MM-DD（默认今天）")
+    parser.add_argument('--plan', action='store_true', help="打印完整执行计划")
+    parser.add_argument('--json', help="结果保存为 JSON 文件")
+    args = parser.parse_args()
+
+    query_cache.enabled = False     # 缓存命中时不会执行 SQL
+    logging.disable(logging.WARNING)
+
+    today = date.today()
+    end = (args.end or today).isoformat()
+    start = (args.start or today - timedelta(days=DEFAULT_DAYS)).isoformat()
+
+    print("=" * 78)
+    print(f"报表执行计划检查（{'MySQL' if args.mysql else 'SQLite'}，{start} ~ {end}）")
+    print("=" * 78)
+
+    db_path = None
+    if not args.mysql:
+        from bench_models import prepare_sqlite_database
+        _, info = prepare_sqlite_database()
+        db_path = info['path']
+
+    results = []
+    try:
+        for name, func, marker, expected in build_checks(start, end, today.isoformat()):
+            statements = [item for item in capture_queries(func) if marker in item[0]]
+            if not statements:
+                results.append({'name': name, 'ok': False, 'problems': [f"没有执行包含 {marker!r} 的语句"]})
+                continue
+            sql, params = statements[0]
+            plan, access = explain(sql, params, args.mysql)
+            problems = check_access(access, expected)
+            results.append({
+                'name': name,
+                'ok': not problems,
+                'problems': problems,
+                'access': {alias: {'full_scan': scan, 'index': index} for alias, (scan, index) in access.items()},
+                'plan': plan,
+            })
+    finally:
+        if db_path:
+            use_backend(None)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+    for result in results:
+        indexes = ', '.join(f"{alias}={item['index'] or '-'}" for alias, item in result.get('access', {}).items())
+        print(f"{'✅' if result['ok'] else '❌'} {result['name']:<24}{indexes}")
+        for problem in result['problems']:
+            print(f"     ⚠️  {problem}")
+        if args.plan:
+            for line in result.get('plan', []):
+                print(f"       {line}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'time': datetime.now().isoformat(timespec='seconds'),
+                       'backend': 'mysql' if args.mysql else 'sqlite',
+                       'start': start, 'end': end, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.json}")
+
+    failed = [result['name'] for result in results if not result['ok']]
+    print("\n" + "=" * 78)
+    if failed:
+        print(f"⚠️  执行计划不符合预期: {', '.join(failed)}")
+        return 1
+    print("✅ 所有报表的日期范围筛选都走索引")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+抢位压测（走真实 Flask 接口）
+功能：准备玩家和一个热门场次，玩家先登录，再按指定的到达模式抢位：
+      POST /api/auth/login -> POST /api/locks -> POST /api/orders -> POST /api/orders/<id>/pay
+      统计各接口的吞吐、延迟分位数和错误分布，按数据库记录检查超卖；结果可保存为 JSON，与上一次对比
+用法：
+    python tools/load_flash_sale.py                                  # SQLite + 进程内 Flask，500 人抢 6 个名额
+    python tools/load_flash_sale.py --players 1000 --concurrency 64 --capacity 20
+    python tools/load_flash_sale.py --arrival poisson --rate 200     # 泊松到达，平均每秒 200 人
+    python tools/load_flash_sale.py --arrival ramp --duration 5      # 5 秒内到达速率从 0 线性上升
+    python tools/load_flash_sale.py --flow order-pay                 # 不锁位，直接下单并支付
+    python tools/load_flash_sale.py --json run.json --compare last.json
+    python tools/load_flash_sale.py --url http://127.0.0.1:5000 --schedule 4001   # 对运行中的服务压测
+
+到达模式：
+    burst    所有玩家同时开始（默认，秒杀开抢的瞬间）
+    uniform  固定速率 --rate 人/秒
+    poisson  指数分布的到达间隔，平均 --rate 人/秒
+    ramp     --duration 秒内到达速率从 0 线性升到峰值
+
+--url 模式通过 /api/auth/register 注册 loadtest_* 玩家（已存在时直接登录），会写入真实数据；
+超卖检查读 database_config.py 中的数据库（--no-db-check 跳过）。
+出现超卖（实际占用超过名额，或成功数与数据库记录对不上）时退出码为 1。
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_models import prepare_sqlite_database, _empty_schedules, _percentile
+from bench_contention import _occupied
+
+from contention_stats import contention_stats
+from database import SafeDatabase, use_backend
+from seat_inventory import seat_inventory
+
+# ==================== 配置区 ====================
+DEFAULT_PLAYERS = 500          # 抢位的玩家数
+DEFAULT_CONCURRENCY = 50       # 并发连接（线程）数
+DEFAULT_CAPACITY = 6           # 场次名额（SQLite 模式下设置到剧本的 Max_Players）
+DEFAULT_RATE = 100.0           # uniform/poisson 的平均到达速率（人/秒）
+DEFAULT_DURATION = 5.0         # ramp 的到达持续时间（秒）
+PASSWORD = 'Load@123456'       # 压测玩家的密码
+RETRY_DELAY = 0.05             # 重试间隔（秒）
+LOGIN_CONCURRENCY = 8          # 登录（准备 token，不计入抢位结果）的最大并发；过高时 SQLite 上 Last_Login 的写入互相等锁
+
+FLOWS = {
+    'lock-order-pay': ['lock', 'order', 'pay'],
+    'order-pay': ['order', 'pay'],
+    'lock': ['lock'],
+}
+
+
+# ==================== 客户端 ====================
+
+class InProcessClient:
+    """进程内调用 Flask 应用（与真实请求经过相同的钩子：鉴权、请求级工作单元、幂等键）"""
+
+    def __init__(self):
+        from app import app
+        self._app = app
+        self._local = threading.local()
+
+    def post(self, path, body, headers):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self._app.test_client()
+        response = client.post(path, json=body, headers=headers)
+        return response.status_code, response.get_json(silent=True) or {}
+
+
+class HttpClient:
+    """通过 HTTP 调用运行中的服务"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def post(self, path, body, headers):
+        request = urllib.request.Request(
+            self.base_url + path, data=json.dumps(body).encode('utf-8'), method='POST',
+            headers=dict(headers, **{'Content-Type': 'application/json'}))
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read() or b'{}')
+            except ValueError:
+                return e.code, {}
+
+
+# ==================== 统计 ====================
+
+class StepStats:
+    """单个接口的调用记录（线程安全）"""
+
+    def __init__(self):
+        self.timings = []
+        self.errors = Counter()
+        self.ok = 0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, started, elapsed_ms, error=None):
+        with self._lock:
+            self.timings.append(elapsed_ms)
+            if error is None:
+                self.ok += 1
+            else:
+                self.errors[error] += 1
+            ended = started + elapsed_ms / 1000
+            self.first_start = started if self.first_start is None else min(self.first_start, started)
+            self.last_end = ended if self.last_end is None else max(self.last_end, ended)
+
+    def summary(self):
+        timings = sorted(self.timings)
+        wall = (self.last_end - self.first_start) if timings else 0.0
+        return {
+            'requests': len(timings),
+            'ok': self.ok,
+            'errors': dict(self.errors.most_common()),
+            'throughput': round(len(timings) / wall, 1) if wall > 0 else 0.0,
+            'p50_ms': round(_percentile(timings, 50), 2),
+            'p95_ms': round(_percentile(timings, 95), 2),
+            'p99_ms': round(_percentile(timings, 99), 2),
+            'max_ms': round(timings[-1], 2) if timings else 0.0,
+        }
+
+
+def call(client, stats, path, body, token=None, idempotency_key=None, retries=0):
+    """发起一次请求并记录耗时；5xx/409/连接异常时按 retries 重试（带同一个幂等键）。成功返回响应 data，失败返回 None"""
+    headers = {}
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+    if idempotency_key:
+        headers['Idempotency-Key'] = idempotency_key
+
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            status, payload = client.post(path, body, headers)
+            error = None if status < 400 else (payload.get('message') or f"HTTP {status}")
+        except Exception as e:
+            status, payload, error = None, {}, f"{type(e).__name__}: {e}"
+        stats.record(started, (time.perf_counter() - started) * 1000, error)
+        if error is None:
+            return payload.get('data') or {}
+        if attempt < retries and (status is None or status >= 500 or status == 409):
+            time.sleep(RETRY_DELAY)
+            continue
+        return None
+
+
+# ==================== 准备数据 ====================
+
+def prepare_sqlite(args):
+    """SQLite：生成数据，取一个空场次并把名额设为 --capacity，统一压测玩家的密码"""
+    from models.auth_model import AuthModel
+
+    _, info = prepare_sqlite_database(players=max(args.players, 100), schedules=100)
+    args.sqlite_path = info['path']
+    schedule_id = _empty_schedules(info, 1)[0]
+    script = SafeDatabase.execute_query(
+        "SELECT Script_ID FROM T_Schedule WHERE Schedule_ID = %s", (schedule_id,), fetch_one=True)
+    SafeDatabase.execute_update("UPDATE T_Script SET Max_Players = %s WHERE Script_ID = %s",
+                                (args.capacity, script['Script_ID']))
+    players = info['players'][:args.players]
+    SafeDatabase.execute_update("UPDATE T_User SET Password_Hash = %s WHERE Role = 'player'",
+                                (AuthModel.hash_password(PASSWORD),))
+    return schedule_id, [f"player_{pid}" for pid in players]
+
+
+def cleanup_sqlite(path):
+    use_backend(None)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def prepare_remote(client, args):
+    """--url：注册 loadtest_* 玩家（已存在时注册失败，登录阶段直接使用）"""
+    usernames = [f"loadtest_{i:05d}" for i in range(1, args.players + 1)]
+    stats = StepStats()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda i: call(client, stats, '/api/auth/register', {
+            'username': usernames[i], 'phone': f"177{i + 1:08d}", 'password': PASSWORD,
+        }), range(len(usernames))))
+    print(f"  注册压测玩家：新注册 {stats.ok}，已存在/失败 {len(usernames) - stats.ok}")
+    return usernames
+
+
+def arrival_offsets(args, count, rng):
+    """每个玩家开始抢位的时间偏移（秒）"""
+    if args.arrival == 'burst':
+        return [0.0] * count
+    if args.arrival == 'uniform':
+        return [i / args.rate for i in range(count)]
+    if args.arrival == 'poisson':
+        offsets, t = [], 0.0
+        for _ in range(count):
+            offsets.append(t)
+            t += rng.expovariate(args.rate)
+        return offsets
+    # ramp：速率随时间线性上升，第 i 个到达时间为 duration * sqrt(i / count)
+    return [args.duration * math.sqrt(i / count) for i in range(count)]
+
+
+# ==================== 压测 ====================
+
+def run_login(client, usernames, args):
+    stats = StepStats()
+    tokens = {}
+
+    def login(username):
+        data = call(client, stats, '/api/auth/login', {'username': username, 'password': PASSWORD},
+                    retries=args.retries)
+        if data:
+            tokens[username] = data['token']
+
+    with ThreadPoolExecutor(max_workers=min(args.concurrency, LOGIN_CONCURRENCY)) as executor:
+        list(executor.map(login, usernames))
+    return tokens, stats
+
+
+def run_sale(client, schedule_id, tokens, args):
+    """每个玩家按到达时间依次执行 flow 中的步骤，某一步失败即停止"""
+    steps = FLOWS[args.flow]
+    stats = {step: StepStats() for step in steps}
+    flow_stats = StepStats()
+    outcomes = Counter()
+    start_lags = []
+    won = set()
+    guard = threading.Lock()
+    run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+
+    users = list(tokens.items())
+    rng = random.Random(args.seed)
+    rng.shuffle(users)
+    offsets = arrival_offsets(args, len(users), rng)
+    begin = time.perf_counter() + 0.2      # 给线程池留出启动时间
+
+    def play(index):
+        username, token = users[index]
+        delay = begin + offsets[index] - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        started = time.perf_counter()
+        outcome = 'paid' if 'pay' in steps else 'booked' if 'order' in steps else 'locked'
+        order_id = None
+        for step in steps:
+            if step == 'lock':
+                data = call(client, stats['lock'], '/api/locks', {'schedule_id': schedule_id}, token,
+                            retries=args.retries)
+            elif step == 'order':
+                data = call(client, stats['order'], '/api/orders', {'schedule_id': schedule_id}, token,
+                            idempotency_key=f"load-{run_id}-{username}-order", retries=args.retries)
+                order_id = data.get('order_id') if data else None
+            else:
+                data = call(client, stats['pay'], f"/api/orders/{order_id}/pay", {'channel': 1}, token,
+                            idempotency_key=f"load-{run_id}-{username}-pay", retries=args.retries)
+            if data is None:
+                outcome = f"{step} 失败"
+                break
+            with guard:
+                won.add(username)
+        flow_stats.record(started, (time.perf_counter() - started) * 1000)
+        with guard:
+            outcomes[outcome] += 1
+            start_lags.append((started - begin - offsets[index]) * 1000)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(play, range(len(users))))
+
+    start_lags.sort()
+    return {
+        'steps': {step: stats[step].summary() for step in steps},
+        'flow': flow_stats.summary(),
+        'outcomes': dict(outcomes.most_common()),
+        'seats_won': len(won),
+        'start_lag_p95_ms': round(_percentile(start_lags, 95), 2),
+    }
+
+
+def check_oversell(schedule_id, occupied_before, seats_won):
+    """按数据库记录核对：实际占用不超过名额，新增占用 == 客户端看到的成功数 == 场次计数"""
+    occupied, capacity, counted = _occupied(schedule_id)
+    gained = occupied - occupied_before
+    return {
+        'capacity': capacity,
+        'occupied_before': occupied_before,
+        'occupied_after': occupied,
+        'counted': counted,
+        'oversold': max(0, occupied - capacity),
+        'consistent': gained == seats_won and counted == occupied,
+    }
+
+
+# ==================== 输出 ====================
+
+def print_summary(result):
+    print(f"  {'接口':<10}{'请求':>8}{'成功':>8}{'次/秒':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    rows = [('login', result['login'])] + list(result['sale']['steps'].items()) + [('flow', result['sale']['flow'])]
+    for name, s in rows:
+        print(f"  {name:<10}{s['requests']:>8}{s['ok']:>8}{s['throughput']:>10.1f}"
+              f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+
+    errors = defaultdict(int)
+    for name, s in rows[:-1]:
+        for message, count in s['errors'].items():
+            errors[(name, message)] += count
+    if errors:
+        print("-" * 70)
+        print("  错误分布：")
+        for (name, message), count in sorted(errors.items(), key=lambda item: -item[1]):
+            print(f"    {name:<8}{message:<44}{count:>8}")
+
+    print("-" * 70)
+    print("  玩家结果：" + "，".join(f"{k} {v}" for k, v in result['sale']['outcomes'].items())
+          + f"（开始时间 p95 落后 {result['sale']['start_lag_p95_ms']:.1f}ms）")
+
+    # 进程内模式：模型层的争用统计（每次执行含冲突重做，拒绝按原因区分）
+    for op, s in (result.get('contention') or {}).items():
+        if not s['attempts']:
+            continue
+        rejected = "，".join(f"{reason} {count}" for reason, count in s['rejections'].items() if count)
+        print(f"  {op:<6}执行 {s['attempts']}，成功 {s['ok']}{'，' + rejected if rejected else ''}；"
+              f"行锁等待 p95 {s['row_lock_wait']['p95_ms']:.1f}ms / max {s['row_lock_wait']['max_ms']:.1f}ms")
+
+
+def compare(result, baseline):
+    """与上一次结果逐接口对比吞吐和 p95"""
+    print("-" * 70)
+    print(f"  与 {baseline.get('finished_at', '上一次')} 的结果对比：")
+    print(f"  {'接口':<10}{'次/秒(前)':>12}{'次/秒(后)':>12}{'p95(前)':>10}{'p95(后)':>10}")
+    current = dict(result['sale']['steps'], login=result['login'], flow=result['sale']['flow'])
+    previous = dict(baseline['sale']['steps'], login=baseline['login'], flow=baseline['sale']['flow'])
+    for name, s in current.items():
+        if name not in previous:
+            continue
+        p = previous[name]
+        print(f"  {name:<10}{p['throughput']:>12.1f}{s['throughput']:>12.1f}{p['p95_ms']:>10.1f}{s['p95_ms']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="抢位压测（真实 Flask 接口）")
+    parser.add_argument('--players', type=int, default=DEFAULT_PLAYERS)
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY, help="场次名额（仅 SQLite 模式）")
+    parser.add_argument('--flow', choices=list(FLOWS), default='lock-order-pay')
+    parser.add_argument('--arrival', choices=['burst', 'uniform', 'poisson', 'ramp'], default='burst')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help="uniform/poisson 的到达速率（人/秒）")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="ramp 的到达持续时间（秒）")
+    parser.add_argument('--retries', type=int, default=0, help="5xx/409/连接失败时的重试次数（下单/支付带同一个幂等键）")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url', help="对运行中的服务压测（如 http://127.0.0.1:5000）")
+    parser.add_argument('--schedule', type=int, help="--url 模式下抢位的场次ID")
+    parser.add_argument('--no-db-check', action='store_true', help="--url 模式下不读数据库检查超卖")
+    parser.add_argument('--no-inventory', action='store_true', help="关闭座位库存（仅进程内模式，对比用）")
+    parser.add_argument('--json', help="结果保存为 JSON 文件")
+    parser.add_argument('--compare', help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)  # 名额已满等业务失败会大量写 ERROR 日志
+
+    if args.url:
+        if not args.schedule:
+            parser.error("--url 需要同时指定 --schedule")
+        client = HttpClient(args.url)
+        schedule_id = args.schedule
+        usernames = prepare_remote(client, args)
+    else:
+        seat_inventory.enabled = not args.no_inventory
+        schedule_id, usernames = prepare_sqlite(args)
+        client = InProcessClient()
+
+    db_check = not (args.url and args.no_db_check)
+    occupied_before = _occupied(schedule_id)[0] if db_check else None
+
+    print("=" * 70)
+    print(f"抢位压测：{len(usernames)} 个玩家 / {args.concurrency} 并发 -> 场次 {schedule_id}"
+          f"（{args.flow}，到达 {args.arrival}{'，名额 ' + str(args.capacity) if not args.url else ''}）")
+    print("=" * 70)
+
+    try:
+        tokens, login_stats = run_login(client, usernames, args)
+        sale = run_sale(client, schedule_id, tokens, args)
+        result = {
+            'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'config': {key: value for key, value in vars(args).items()
+                       if key not in ('json', 'compare', 'sqlite_path')},
+            'schedule_id': schedule_id,
+            'login': login_stats.summary(),
+            'sale': sale,
+            'oversell': check_oversell(schedule_id, occupied_before, sale['seats_won']) if db_check else None,
+            'contention': None if args.url else contention_stats.snapshot()['operations'],
+        }
+    finally:
+        if not args.url:
+            cleanup_sqlite(args.sqlite_path)
+
+    print_summary(result)
+    failed = False
+    oversell = result['oversell']
+    if oversell:
+        failed = oversell['oversold'] > 0 or not oversell['consistent']
+        print(f"  成功占位 {sale['seats_won']}，最终占用 {oversell['occupied_after']}/{oversell['capacity']}"
+              f"（场次计数 {oversell['counted']}） -> {'✗ 超卖/计数不一致' if failed else '✓ 无超卖'}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(result, json.load(f))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.json}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+场次余位投影核对工具
+功能：按订单/锁位明细核对 T_Schedule.Booked_Count / Locked_Count / Next_Lock_Expire，修复漂移；
+      可选先做一次锁位过期清理（未开启 event_scheduler 时用定时任务执行），或整体重建
+用法：
+    python tools/reconcile_occupancy.py                # 核对并修复
+    python tools/reconcile_occupancy.py --dry-run      # 只报告不修复
+    python tools/reconcile_occupancy.py --expire       # 先过期清理再核对（适合 crontab 每分钟执行）
+    python tools/reconcile_occupancy.py --schedule 4011 --schedule 4012
+    python tools/reconcile_occupancy.py --rebuild      # 一条语句按明细重建所有场次（迁移后/维护窗口内）
+
+发现漂移时退出码为 2（--dry-run 时便于监控告警），出错时为 1。
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from models.lock_model import LockModel
+from models.schedule_model import ScheduleModel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="场次余位投影核对")
+    parser.add_argument('--dry-run', action='store_true', help="只报告不修复")
+    parser.add_argument('--expire', action='store_true', help="先把已过期的锁位标记为过期并扣减计数")
+    parser.add_argument('--schedule', type=int, action='append', help="只核对指定场次（可重复）")
+    parser.add_argument('--rebuild', action='store_true', help="按明细重建所有场次（执行期间锁住全部场次行）")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    try:
+        if args.expire and not args.dry_run:
+            print(f"✓ 过期锁位: {LockModel.expire_locks()} 条")
+        if args.rebuild and not args.dry_run:
+            print(f"✓ 已重建 {ScheduleModel.rebuild_counts()} 个场次的余位投影")
+            return
+        drifted = ScheduleModel.reconcile_counts(args.schedule, dry_run=args.dry_run)
+    except Exception as e:
+        print(f"✗ 核对失败: {e}")
+        sys.exit(1)
+
+    if not drifted:
+        print("✓ 余位投影与明细一致")
+        return
+
+    print(f"{'发现' if args.dry_run else '已修复'} {len(drifted)} 个场次的计数漂移：")
+    print(f"  {'场次ID':<12}{'预约计数':>10}{'预约明细':>10}{'锁位计数':>10}{'锁位明细':>10}"
+          f"  {'最早到期(投影)':<20}{'最早到期(明细)':<20}")
+    for row in drifted:
+        print(f"  {row['Schedule_ID']:<12}{row['Booked_Count']:>10}{row['booked']:>10}"
+              f"{row['Locked_Count']:>10}{row['locked']:>10}"
+              f"  {str(row['Next_Lock_Expire'] or '-'):<20}{str(row['next_expire'] or '-'):<20}")
+    sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+轻量级请求链路追踪
+一次请求一个 trace：路由 span → 模型方法 span → SQL span，导出为 JSONL 并在管理端查看
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from database_config import TRACING_CONFIG
+
+logger = logging.getLogger(__name__)
+
+TRACE_ENABLED = TRACING_CONFIG['enabled']
+TRACE_SAMPLE_RATE = TRACING_CONFIG['sample_rate']
+TRACE_MAX_SPANS = TRACING_CONFIG['max_spans']
+TRACE_EXPORT_FILE = TRACING_CONFIG['export_file']
+TRACE_EXPORT_MIN_MS = TRACING_CONFIG['export_min_ms']
+TRACE_EXPORT_MAX_BYTES = TRACING_CONFIG['export_max_bytes']
+_TRACE_ID = re.compile(TRACING_CONFIG['trace_id_pattern'])
+
+_current_span = ContextVar('current_span', default=None)
+_buffer = deque(maxlen=TRACING_CONFIG['buffer_size'])
+_buffer_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+class Span:
+    """一次调用的耗时记录"""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start', 'duration_ms',
+                 'attrs', 'children', 'error', '_t0')
+
+    def __init__(self, trace, name, kind, parent=None, attrs=None):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.duration_ms = None
+        self.attrs = attrs or {}
+        self.children = []
+        self.error = None
+        self._t0 = time.perf_counter()
+
+    def finish(self, error=None):
+        self.duration_ms = (time.perf_counter() - self._t0) * 1000
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start': datetime.fromtimestamp(self.start).isoformat(timespec='microseconds'),
+            'duration_ms': round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            'attrs': self.attrs,
+            'error': self.error,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+class Trace:
+    """一次请求的完整调用树"""
+
+    def __init__(self, name, attrs=None, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.span_count = 0
+        self.dropped_spans = 0
+        self.root = Span(self, name, 'route', attrs=attrs)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.root.name,
+            'start': datetime.fromtimestamp(self.root.start).isoformat(timespec='milliseconds'),
+            'duration_ms': round(self.root.duration_ms or 0, 3),
+            'span_count': self.span_count + 1,
+            'dropped_spans': self.dropped_spans,
+            'error': self.root.error,
+            'root': self.root.to_dict(),
+        }
+
+    def summary(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.root.name,
+            'start': datetime.fromtimestamp(self.root.start).isoformat(timespec='milliseconds'),
+            'duration_ms': round(self.root.duration_ms or 0, 3),
+            'span_count': self.span_count + 1,
+            'status': self.root.attrs.get('status'),
+            'error': self.root.error,
+        }
+
+
+def current_trace_id():
+    """当前 trace ID（未在追踪中时返回 None）"""
+    span = _current_span.get()
+    return span.trace.trace_id if span else None
+
+
+def start_trace(name, trace_id=None, **attrs):
+    """
+    开始一个 trace 并设为当前上下文
+
+    Args:
+        trace_id: 调用方传入的 trace ID（如请求头 X-Trace-ID），不符合 trace_id_pattern 时忽略并生成新的
+
+    Returns:
+        根 span（未采样时返回 None）
+    """
+    if not TRACE_ENABLED or random.random() >= TRACE_SAMPLE_RATE:
+        return None
+    if trace_id and not _TRACE_ID.fullmatch(trace_id):
+        trace_id = None
+    trace = Trace(name, attrs=attrs, trace_id=trace_id)
+    _current_span.set(trace.root)
+    return trace.root
+
+
+def finish_trace(error=None, **attrs):
+    """结束当前 trace：计算耗时、放入内存缓冲并导出"""
+    current = _current_span.get()
+    if current is None:
+        return None
+    _current_span.set(None)
+
+    root = current.trace.root
+    root.attrs.update(attrs)
+    root.finish(error)
+
+    trace = root.trace
+    with _buffer_lock:
+        _buffer.append(trace)
+    _export(trace)
+    return trace
+
+
+def _export(trace):
+    if not TRACE_EXPORT_FILE or (trace.root.duration_ms or 0) < TRACE_EXPORT_MIN_MS:
+        return
+    try:
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+        with _export_lock:
+            _rotate_export_file()
+            with open(TRACE_EXPORT_FILE, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+    except Exception as e:
+        logger.warning(f"导出trace失败: {str(e)}")
+
+
+def _rotate_export_file():
+    """导出文件超过 TRACE_EXPORT_MAX_BYTES 时改名为 <文件>.1（覆盖上一份），调用方持有 _export_lock"""
+    try:
+        if os.path.getsize(TRACE_EXPORT_FILE) < TRACE_EXPORT_MAX_BYTES:
+            return
+    except OSError:
+        return
+    os.replace(TRACE_EXPORT_FILE, TRACE_EXPORT_FILE + '.1')
+
+
+@contextmanager
+def span(name, kind='internal', **attrs):
+    """
+    在当前 trace 下记录一个子 span；不在追踪中时什么也不做（yield None）
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    trace = parent.trace
+    if trace.span_count >= TRACE_MAX_SPANS:
+        trace.dropped_spans += 1
+        yield None
+        return
+
+    child = Span(trace, name, kind, parent=parent, attrs=attrs)
+    trace.span_count += 1
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.finish(e)
+        raise
+    else:
+        child.finish()
+    finally:
+        _current_span.reset(token)
+
+
+def traced_model(cls):
+    """
+    类装饰器：为模型类的公开静态方法自动记录 span（名称形如 ReportModel.get_dashboard_stats）
+    """
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith('_') or not isinstance(value, staticmethod):
+            continue
+        setattr(cls, attr, staticmethod(_wrap(f"{cls.__name__}.{attr}", value.__func__)))
+    return cls
+
+
+def _wrap(span_name, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current_span.get() is None:
+            return func(*args, **kwargs)
+        with span(span_name, kind='model'):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def recent_traces(limit=50, min_ms=0, name=None):
+    """最近的 trace 摘要（新的在前）"""
+    with _buffer_lock:
+        traces = list(_buffer)
+    result = []
+    for trace in reversed(traces):
+        if (trace.root.duration_ms or 0) < min_ms:
+            continue
+        if name and trace.root.name != name:
+            continue
+        result.append(trace.summary())
+        if len(result) >= limit:
+            break
+    return result
+
+
+def get_trace(trace_id):
+    """
+    按 ID 查找完整调用树：先查内存缓冲，再查导出文件
+
+    导出文件有大小上限并且只保留一份轮转文件，查找最多读取 2 * TRACE_EXPORT_MAX_BYTES
+    """
+    with _buffer_lock:
+        for trace in _buffer:
+            if trace.trace_id == trace_id:
+                return trace.to_dict()
+
+    if not TRACE_EXPORT_FILE or not _TRACE_ID.fullmatch(trace_id):
+        return None
+    for path in (TRACE_EXPORT_FILE, TRACE_EXPORT_FILE + '.1'):
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if trace_id in line:
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        continue
+                    if data.get('trace_id') == trace_id:
+                        return data
+    return None
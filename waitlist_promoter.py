@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+候补提升调度器 - 名额空出后由后台线程按加入顺序为候补玩家自动锁位
+
+订阅 seat_freed 事件（锁位过期、取消锁位、取消订单），把场次放入待处理集合后唤醒线程；
+同一场次在处理前多次释放名额只处理一次，每次处理一个短事务批量提升（WaitlistModel.promote），
+一批用满或有候补被跳过时继续处理同一场次，直到没有空位或没有候补。
+
+- 其它进程释放的名额、进程重启期间漏掉的事件，每 resync_seconds 秒按数据库补扫（WaitlistModel.pending_schedules），
+  同时把已开始/已取消场次的候补标记为已失效
+- 多个进程各自运行时重复处理是安全的：提升在场次行锁内重新计算空位，FOR UPDATE 读取队首候补
+- 提升延迟（收到 seat_freed 到候补锁位提交）见 stats()
+
+    from waitlist_promoter import waitlist_promoter
+    waitlist_promoter.start()
+"""
+
+from collections import Counter, deque
+import logging
+import threading
+import time
+
+from database_config import WAITLIST_CONFIG
+from models.waitlist_model import WaitlistModel
+from query_stats import _percentile
+import seat_events
+
+logger = logging.getLogger(__name__)
+
+
+class WaitlistPromoter:
+    """候补提升后台线程"""
+
+    def __init__(self, config=None):
+        config = config or WAITLIST_CONFIG
+        self.enabled = config.get('enabled', True)
+        self.batch_size = config.get('batch_size', 20)
+        self.lock_minutes = config.get('lock_minutes', 15)
+        self.resync_seconds = config.get('resync_seconds', 30)
+        self._pending = {}              # 场次ID -> 首次收到释放事件的时间（monotonic），按插入顺序处理
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lags = deque(maxlen=config.get('lag_samples', 1024))
+        self._counters = Counter()
+        self._last_error = None
+
+    # ==================== 生命周期 ====================
+
+    def start(self):
+        """启动后台线程（重复调用无副作用）"""
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        seat_events.subscribe(seat_events.SEAT_FREED, self._on_seat_freed)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='waitlist-promoter', daemon=True)
+        self._thread.start()
+        logger.info("候补提升调度器已启动")
+
+    def stop(self, timeout=5):
+        if self._thread is None:
+            return
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+        seat_events.unsubscribe(seat_events.SEAT_FREED, self._on_seat_freed)
+        logger.info("候补提升调度器已停止")
+
+    # ==================== 事件 ====================
+
+    def notify(self, schedule_id):
+        """把场次加入待处理集合并唤醒线程（已在集合中时只保留最早的时间）"""
+        with self._cond:
+            self._pending.setdefault(schedule_id, time.monotonic())
+            self._cond.notify()
+
+    def _on_seat_freed(self, schedule_id, **_):
+        self._counters['events'] += 1
+        self.notify(schedule_id)
+
+    # ==================== 调度 ====================
+
+    def _run(self):
+        next_resync = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= next_resync:
+                    self._resync()
+                    next_resync = time.monotonic() + self.resync_seconds
+                self._drain()
+            except Exception as e:
+                self._counters['errors'] += 1
+                self._last_error = str(e)
+                logger.error(f"候补提升调度失败: {str(e)}")
+
+            with self._cond:
+                timeout = next_resync - time.monotonic()
+                if not self._pending and timeout > 0 and not self._stop.is_set():
+                    self._cond.wait(timeout)
+
+    def _resync(self):
+        """补扫有候补且有空位的场次（以及需要把候补标记为失效的场次）"""
+        for schedule_id in WaitlistModel.pending_schedules():
+            self.notify(schedule_id)
+        self._counters['resyncs'] += 1
+
+    def _drain(self):
+        """逐个处理待处理场次；单个场次失败不影响其它场次，由下次补扫重试"""
+        while not self._stop.is_set():
+            with self._cond:
+                if not self._pending:
+                    return
+                schedule_id = next(iter(self._pending))
+                queued_at = self._pending.pop(schedule_id)
+
+            try:
+                self._promote_schedule(schedule_id, queued_at)
+            except Exception as e:
+                self._counters['errors'] += 1
+                self._last_error = str(e)
+                logger.error(f"场次候补提升失败: Schedule_ID={schedule_id}: {str(e)}")
+
+    def _promote_schedule(self, schedule_id, queued_at):
+        while not self._stop.is_set():
+            result = WaitlistModel.promote(schedule_id, self.batch_size, self.lock_minutes)
+            self._counters['runs'] += 1
+            if result['promoted']:
+                lag_ms = (time.monotonic() - queued_at) * 1000
+                with self._cond:
+                    self._lags.extend([lag_ms] * len(result['promoted']))
+                self._counters['promoted'] += len(result['promoted'])
+            self._counters['closed'] += result['closed']
+            if not result['promoted'] and not result['closed']:
+                return
+
+    # ==================== 统计 ====================
+
+    def stats(self):
+        """待处理场次数、提升/结束的候补数、提升延迟（毫秒）"""
+        with self._cond:
+            lags = sorted(self._lags)
+            pending = len(self._pending)
+            counters = dict(self._counters)
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'pending': pending,
+            'events': counters.get('events', 0),
+            'promoted': counters.get('promoted', 0),
+            'closed': counters.get('closed', 0),
+            'runs': counters.get('runs', 0),
+            'resyncs': counters.get('resyncs', 0),
+            'errors': counters.get('errors', 0),
+            'last_error': self._last_error,
+            'lag_p50_ms': round(_percentile(lags, 50), 1),
+            'lag_p95_ms': round(_percentile(lags, 95), 1),
+            'lag_max_ms': round(lags[-1], 1) if lags else 0.0,
+        }
+
+
+waitlist_promoter = WaitlistPromoter()